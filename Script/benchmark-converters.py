@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# benchmark-converters.py
+#
+# Benchmarks every reader and writer script on synthetic backups (see synthetic-backups.py).
+# Network lookups go through the synthetic extractor (extractors.py), so results are reproducible.
+# Each script runs in its own process; wall time and peak RSS of that process are recorded.
+# Results are printed as a table and can be saved as JSON and compared against an earlier run.
+#
+# Usage Example:
+# python3 benchmark-converters.py --scale small
+# python3 benchmark-converters.py --scale medium --output bench.json
+# python3 benchmark-converters.py --scale medium --compare bench.json
+#
+# --compare reports every script that got slower or bigger than the saved run by more than --threshold.
+
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def benchmark_jobs(data_dir, out_dir):
+    """
+    (name, script, arguments, needed modules, stdin) for every benchmarked script.
+    """
+    d = lambda name: os.path.join(data_dir, name)
+    o = lambda name: os.path.join(out_dir, name)
+    return [
+        ("newpipe-convert-playlists (db)", "newpipe-convert-playlists.py", [d("newpipe.db"), o("np.csv")], [], None),
+        ("newpipe-convert-playlists (zip)", "newpipe-convert-playlists.py", [d("NewPipeData.zip"), o("npz.csv")], [], None),
+        ("freetube-convert-playlists", "freetube-convert-playlists.py", [d("freetube-playlists.db"), o("ft.csv")], [], None),
+        ("piped-convert-playlists", "piped-convert-playlists.py", [d("playlists-piped.json"), o("piped.csv")], [], None),
+        ("grayjay-convert-playlists", "grayjay-convert-playlists.py", [d("grayjay-export.zip"), o("gj.csv")], [], None),
+        ("playlists-convert-newpipe", "playlists-convert-newpipe.py",
+         [os.path.join(SCRIPT_DIR, "NewPipeData-Zip-Template.zip"), d("playlists.csv"), o("NewPipeData.zip")], [], None),
+        ("playlists-convert-freetube", "playlists-convert-freetube.py", [d("playlists.csv"), o("freetube-playlists.db")], [], None),
+        ("playlists-convert-piped", "playlists-convert-piped.py", [d("playlists.csv"), o("playlists-piped.json")], [], None),
+        ("playlists-convert-grayjay", "playlists-convert-grayjay.py",
+         [os.path.join(SCRIPT_DIR, "Grayjay-Zip-Template.zip"), d("playlists.csv"), o("grayjay-export.zip")], [], None),
+        ("newpipedb-export-csv", "newpipedb-export-csv.py", [d("newpipe.db"), o("tables")], [], None),
+        ("structure-overview-zip", "structure-overview-zip.py", [d("grayjay-export.zip"), o("structure.txt")], [], None),
+        ("newpipe-search", "newpipe-search.py", [d("newpipe.db"), "night", "--index", o("search.sqlite")], [], None),
+        ("newpipe-listening-stats", "newpipe-listening-stats.py", [d("newpipe.db")], ["numpy"], None),
+        # option 8 with the default answer exports every format at once
+        ("main.py export all formats", "main.py", [d("NewPipeData.zip")], ["pydub"], b"8\n\n"),
+    ]
+
+def missing_modules(modules):
+    return [m for m in modules if importlib.util.find_spec(m) is None]
+
+def run_once(script, arguments, cwd, stdin=None):
+    """
+    Run one script with the synthetic extractor and return (seconds, peak RSS in KiB, exit code, output).
+    """
+    command = [sys.executable, os.path.join(SCRIPT_DIR, script)] + arguments
+    env = dict(os.environ, PLAYLIST_EXTRACTOR="synthetic")
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT)
+    process.stdin.write(stdin or b"")
+    process.stdin.close()
+    # read output before waiting so a chatty script cannot block on a full pipe
+    output = process.stdout.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stdout.close()
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return elapsed, peak_rss, process.returncode, output.decode("utf-8", "replace")
+
+def run_benchmarks(data_dir, repeat, only=None):
+    results = {}
+    for name, script, arguments, modules, stdin in benchmark_jobs(data_dir, "{out}"):
+        if only and not any(part in name for part in only):
+            continue
+        missing = missing_modules(modules)
+        if missing:
+            print(f"{name:34s} skipped, needs {', '.join(missing)}")
+            continue
+        timings = []
+        peak = 0
+        for _ in range(repeat):
+            out_dir = tempfile.mkdtemp(prefix="bench-")
+            try:
+                args = [a.replace("{out}", out_dir) for a in arguments]
+                elapsed, peak_rss, code, output = run_once(script, args, out_dir, stdin)
+            finally:
+                shutil.rmtree(out_dir, ignore_errors=True)
+            if code != 0:
+                print(f"{name:34s} FAILED (exit code {code})")
+                print(output[-2000:])
+                break
+            timings.append(elapsed)
+            peak = max(peak, peak_rss)
+        else:
+            results[name] = {"seconds": min(timings), "peak_rss_kib": peak}
+            print(f"{name:34s} {min(timings):9.3f} s {peak / 1024:9.1f} MiB")
+    return results
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        for key, label in (("seconds", "time"), ("peak_rss_kib", "peak RSS")):
+            if previous[key] > 0 and current[key] > previous[key] * (1 + threshold):
+                regressions.append(f"{name}: {label} {previous[key]} -> {current[key]} "
+                                   f"(+{(current[key] / previous[key] - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 benchmark-converters.py [--scale SCALE] [--data DIR] [--repeat N] [--only NAME] "
+              "[--output results.json] [--compare baseline.json] [--threshold 0.2]")
+    parser.add_argument("--scale", default="small", help="synthetic-backups.py scale (default small)")
+    parser.add_argument("--data", default=None, help="reuse synthetic backups in this folder instead of generating")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per script, the fastest counts (default 3)")
+    parser.add_argument("--only", action="append", help="only benchmark scripts whose name contains this")
+    parser.add_argument("--output", default=None, help="save results as JSON")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before a regression (default 0.2)")
+    args = parser.parse_args()
+
+    data_dir = args.data
+    temp_data = None
+    if data_dir is None or not os.path.isfile(os.path.join(data_dir, "newpipe.db")):
+        data_dir = data_dir or tempfile.mkdtemp(prefix="synthetic-")
+        temp_data = data_dir if args.data is None else None
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "synthetic-backups.py"), data_dir,
+                        "--scale", args.scale], check=True)
+        print(f"Generated synthetic backups in {time.perf_counter() - start:.1f} s")
+
+    print("=========================")
+    try:
+        results = run_benchmarks(data_dir, args.repeat, args.only)
+    finally:
+        if temp_data:
+            shutil.rmtree(temp_data, ignore_errors=True)
+    print("=========================")
+
+    report = {"scale": args.scale, "python": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions against " + args.compare + ":")
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print("No regressions against " + args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# benchmark-extractors.py
+#
+# Compares extractor backends (see extractors.py) on the URLs of a playlists CSV.
+# Every backend looks up the same URLs: video metadata for video URLs, playlist expansion for remote playlists.
+# Prints calls, errors and latency (mean, median, 95th percentile, total) per backend and call.
+#
+# Usage Example:
+# python3 benchmark-extractors.py playlists.csv --backends yt-dlp,pytubefix,replay --limit 50
+#
+# - The first argument is the input playlists CSV file.
+# - replay and record use the fixture store in PLAYLIST_EXTRACTOR_STORE (default ./extractor-fixtures),
+#   so a run with "record" followed by one with "replay" shows the cost of the network.
+
+import argparse
+import ast
+import csv
+import re
+import sys
+import time
+
+from extractors import create_extractor
+
+REMOTE_PLAYLIST_RE = re.compile(r'(?:youtube\.com|youtu\.be).*(list=|/playlist\?id=)|(?:odysee\.com|odysee\.tv).*/playlist/|(?:peertube\.)',
+                                re.IGNORECASE)
+
+def read_urls(csv_path, limit):
+    urls = []
+    seen = set()
+    with open(csv_path, "r", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                playlist_urls = ast.literal_eval(row[1])
+            except (ValueError, SyntaxError):
+                continue
+            for url in playlist_urls:
+                url = url.strip()
+                if url and url not in seen:
+                    seen.add(url)
+                    urls.append(url)
+                    if limit and len(urls) >= limit:
+                        return urls
+    return urls
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def run_backend(name, urls):
+    extractor = create_extractor(name)
+    timings = {"video_metadata": [], "expand_playlist": []}
+    errors = {"video_metadata": 0, "expand_playlist": 0}
+    for url in urls:
+        call = "expand_playlist" if REMOTE_PLAYLIST_RE.search(url) else "video_metadata"
+        start = time.perf_counter()
+        try:
+            getattr(extractor, call)(url)
+        except Exception:
+            errors[call] += 1
+        timings[call].append(time.perf_counter() - start)
+    return timings, errors
+
+def main():
+    parser = argparse.ArgumentParser(usage="python3 benchmark-extractors.py playlists.csv [--backends yt-dlp,replay] [--limit N]")
+    parser.add_argument("csv_file")
+    parser.add_argument("--backends", default="yt-dlp,pytubefix", help="comma separated extractor names")
+    parser.add_argument("--limit", type=int, default=20, help="number of URLs to look up, 0 for all (default 20)")
+    args = parser.parse_args()
+
+    urls = read_urls(args.csv_file, args.limit)
+    if not urls:
+        print("No URLs found in " + args.csv_file)
+        sys.exit(1)
+    print(f"Looking up {len(urls)} URLs")
+    print("=========================")
+    print(f"{'backend':12s} {'call':16s} {'calls':>6s} {'errors':>6s} {'mean ms':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'total s':>8s}")
+    for name in args.backends.split(","):
+        name = name.strip()
+        try:
+            timings, errors = run_backend(name, urls)
+        except (ImportError, ValueError) as e:
+            print(f"{name:12s} skipped: {e}")
+            continue
+        for call, values in timings.items():
+            if not values:
+                continue
+            values.sort()
+            print(f"{name:12s} {call:16s} {len(values):6d} {errors[call]:6d} {sum(values) / len(values) * 1000:9.1f} "
+                  f"{percentile(values, 0.5) * 1000:9.1f} {percentile(values, 0.95) * 1000:9.1f} {sum(values):8.2f}")
+    print("=========================")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# benchmark-playlist-store.py
+#
+# Measures the memory of the playlist model of main.py and newpipe-convert-playlists.py.
+# Loads every playlist of a newpipe.db twice with tracemalloc running:
+# as the former dict of playlist name -> list of URL strings, and as a PlaylistStore (playlist_store.py).
+#
+# Usage Example:
+# python3 benchmark-playlist-store.py newpipe.db
+#
+# - The first argument is the newpipe.db file (synthetic-backups.py --scale large makes a big one).
+
+import gc
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+from playlist_filter import select_playlists
+
+def legacy_playlists(conn):
+    # the former model: name -> list of URL strings, one str object per occurrence
+    playlists = {}
+    for uid, name in conn.execute("SELECT uid, name FROM playlists ORDER BY uid").fetchall():
+        playlists[name] = [url for (url,) in conn.execute(
+            "SELECT s.url FROM playlist_stream_join psj JOIN streams s ON s.uid = psj.stream_id "
+            "WHERE psj.playlist_id = ? ORDER BY psj.join_index", (uid,))]
+    for name, url in conn.execute("SELECT name, url FROM remote_playlists ORDER BY uid").fetchall():
+        playlists[name] = [url]
+    return playlists
+
+def measure(build):
+    """
+    (result, retained bytes, peak bytes, seconds) of build() under tracemalloc.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak, elapsed
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python3 benchmark-playlist-store.py newpipe.db")
+        sys.exit(1)
+    conn = sqlite3.connect(sys.argv[1])
+    old, old_retained, old_peak, old_time = measure(lambda: legacy_playlists(conn))
+    del old
+    store, new_retained, new_peak, new_time = measure(lambda: select_playlists(conn))
+
+    tracks = sum(len(playlist) for playlist in store)
+    print(f"{len(store)} playlists, {tracks} tracks, {len(store.urls)} distinct URLs")
+    print("=========================")
+    print(f"{'model':16s} {'retained MiB':>13s} {'peak MiB':>9s} {'load s':>7s}")
+    print(f"{'dict of lists':16s} {old_retained / 1024 / 1024:13.2f} {old_peak / 1024 / 1024:9.2f} {old_time:7.2f}")
+    print(f"{'playlist store':16s} {new_retained / 1024 / 1024:13.2f} {new_peak / 1024 / 1024:9.2f} {new_time:7.2f}")
+    print("=========================")
+    print(f"retained memory {old_retained / max(new_retained, 1):.1f}x smaller")
+
+    # both models must hold the same playlists (the dict keeps only the last of a shared name)
+    legacy = legacy_playlists(conn)
+    conn.close()
+    same = {p.name: store.urls_of(p) for p in store} == legacy
+    print("same playlists" if same else "PLAYLISTS DIFFER")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+# benchmark-streaming.py
+#
+# Checks that playlists-convert-piped.py and playlists-convert-freetube.py stream their output: both converters
+# run on a playlists.csv with one playlist of growing size, and the peak RSS of every run is printed next to
+# the size of its output. With streaming the peak only grows with the CSV row and the URLs remembered to skip
+# duplicates (about 0.4 KiB per video), while a converter that builds the whole playlist in memory needs
+# several times the size of its output.
+# Lookups go through the synthetic extractor (extractors.py), like benchmark-converters.py.
+#
+# Usage Example:
+# python3 benchmark-streaming.py
+# python3 benchmark-streaming.py --sizes 10000 40000 160000 --max-growth 96
+#
+# --max-growth fails the run (exit code 1) when a converter's peak RSS on the largest playlist exceeds
+# its peak on the smallest by more than that many MiB.
+
+import argparse
+import csv
+import importlib.util
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [10000, 40000, 160000]
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+CONVERTERS = [
+    ("playlists-convert-piped", "playlists-convert-piped.py", "playlists-piped.json"),
+    ("playlists-convert-freetube", "playlists-convert-freetube.py", "freetube-playlists.db"),
+]
+
+def load_benchmark_converters():
+    # run_once of benchmark-converters.py, whose file name is not importable
+    spec = importlib.util.spec_from_file_location("benchmark_converters",
+                                                  os.path.join(SCRIPT_DIR, "benchmark-converters.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def write_playlist_csv(path, size, seed=1):
+    rng = random.Random(seed)
+    urls = ["https://www.youtube.com/watch?v=" + "".join(rng.choice(ID_ALPHABET) for _ in range(11))
+            for _ in range(size)]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow([f"Streaming {size}", str(urls)])
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 benchmark-streaming.py [--sizes N ...] [--max-growth MIB]")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="videos in the playlist of each run (default 10000 40000 160000)")
+    parser.add_argument("--max-growth", type=float, default=None,
+                        help="allowed peak RSS growth in MiB from the smallest to the largest playlist")
+    args = parser.parse_args()
+    run_once = load_benchmark_converters().run_once
+    sizes = sorted(args.sizes)
+
+    print("=========================")
+    peaks = {}
+    work_dir = tempfile.mkdtemp(prefix="bench-streaming-")
+    try:
+        for size in sizes:
+            csv_path = os.path.join(work_dir, f"playlists-{size}.csv")
+            write_playlist_csv(csv_path, size)
+            for name, script, output_name in CONVERTERS:
+                output = os.path.join(work_dir, output_name)
+                elapsed, peak_rss, code, text = run_once(script, [csv_path, output], work_dir)
+                if code != 0:
+                    print(f"{name:28s} {size:>8} videos FAILED (exit code {code})")
+                    print(text[-2000:])
+                    sys.exit(1)
+                output_size = os.path.getsize(output)
+                os.remove(output)
+                peaks.setdefault(name, []).append(peak_rss)
+                print(f"{name:28s} {size:>8} videos {elapsed:8.2f} s {output_size / 1024 ** 2:9.1f} MiB output "
+                      f"{peak_rss / 1024:9.1f} MiB peak")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("=========================")
+
+    failed = False
+    for name, values in peaks.items():
+        growth = (values[-1] - values[0]) / 1024
+        print(f"{name:28s} peak RSS grew {growth:.1f} MiB from {sizes[0]} to {sizes[-1]} videos")
+        if args.max_growth is not None and growth > args.max_growth:
+            failed = True
+    if failed:
+        print(f"Peak RSS grew by more than {args.max_growth} MiB")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
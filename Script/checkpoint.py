@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+# checkpoint.py
+#
+# Journal of a long conversion, so a run that crashed, was stopped with Ctrl-C or lost the network
+# starts again where it stopped instead of from the beginning.
+# The journal <output>.journal is an append-only file of JSON lines:
+#   {"start": key}                              inputs and extractor the journal belongs to
+#   {"meta": url, "info": {...}}                a resolved video metadata lookup
+#   {"expand": url, "urls": [...]}              a resolved remote playlist expansion
+#   {"done": index, "end": offset}             a finished output record (e.g. a FreeTube playlist line), the output
+#                                               file is complete up to byte offset end
+# Every line is flushed when it is written, so a killed process loses nothing; an incomplete last line
+# is dropped when the journal is read back. A restarted run with the same inputs and extractor answers
+# lookups from the journal and keeps the finished records of the output, so its output is identical to an
+# uninterrupted run. Lookups are not kept in memory: only the offset of their line in the journal is,
+# and a video seen again (e.g. in several playlists) is read back from there.
+# A journal of other inputs is discarded; finish() removes the journal once the output is complete.
+#
+# Usage Example (interrupt the conversion and run the same command again):
+# python3 playlists-convert-freetube.py playlists.csv freetube-playlists.db
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from extractors import get_extractor
+
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_VERSION = 2
+FSYNC_INTERVAL = 5.0 # seconds between fsyncs, so the journal also survives a power loss
+
+def journal_key(kind, input_paths):
+    """
+    Identifies a conversion: its kind, the content of its input files and the extractor backend.
+    """
+    digest = hashlib.sha256(f"{JOURNAL_VERSION}:{kind}:{os.environ.get('PLAYLIST_EXTRACTOR', '')}".encode("utf-8"))
+    for path in input_paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+class Journal:
+    """
+    Checkpoints of one output file. metadata holds the journal offset of every metadata lookup by URL,
+    expansions the remote playlist expansions, done the end offsets of the finished records by index.
+    """
+    def __init__(self, output, kind, input_paths):
+        self.path = output + JOURNAL_SUFFIX
+        self.key = journal_key(kind, input_paths)
+        self.metadata = {}
+        self.expansions = {}
+        self.done = {}
+        self._lock = threading.Lock()
+        self._synced = time.time()
+        self._size = 0
+        self._load()
+        self.resumed = bool(self.metadata or self.expansions or self.done)
+        self._file = open(self.path, "ab" if self.resumed else "wb")
+        self._reader = None
+        if self.resumed:
+            done = f" and {len(self.done)} finished playlists" if self.done else ""
+            print(f"Resuming from {self.path}: {len(self.metadata) + len(self.expansions)} lookups{done}")
+        else:
+            self._append({"start": self.key})
+
+    def _load(self):
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        good_size = 0
+        with f:
+            first = True
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    record = None
+                if record is None:
+                    break # written when the process died
+                if first:
+                    first = False
+                    if record.get("start") != self.key:
+                        print(f"Ignoring {self.path}, it belongs to other inputs")
+                        return
+                elif "meta" in record:
+                    self.metadata[record["meta"]] = good_size
+                elif "expand" in record:
+                    self.expansions[record["expand"]] = record["urls"]
+                elif "done" in record:
+                    self.done[record["done"]] = record["end"]
+                good_size += len(line)
+        # cut off a torn last line so new records start on a line of their own
+        with open(self.path, "r+b") as f:
+            f.truncate(good_size)
+        self._size = good_size
+
+    def _append(self, record):
+        """
+        Write one record, returns the offset of its line.
+        """
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            offset = self._size
+            self._file.write(line)
+            self._file.flush()
+            self._size += len(line)
+            if time.time() - self._synced >= FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._synced = time.time()
+        return offset
+
+    def _read_record(self, offset):
+        with self._lock:
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(offset)
+            return json.loads(self._reader.readline())
+
+    def video_metadata(self, url):
+        """
+        get_extractor().video_metadata(url), answered from the journal when an earlier run resolved it.
+        """
+        offset = self.metadata.get(url)
+        if offset is not None:
+            return self._read_record(offset)["info"]
+        info = get_extractor().video_metadata(url)
+        self.metadata[url] = self._append({"meta": url, "info": info})
+        return info
+
+    def expand_playlist(self, url):
+        urls = self.expansions.get(url)
+        if urls is None:
+            urls = get_extractor().expand_playlist(url)
+            self.expansions[url] = urls
+            self._append({"expand": url, "urls": urls})
+        return list(urls)
+
+    def record_done(self, index, end):
+        """
+        Record index is finished and the output (flushed by the caller) is complete up to byte offset end.
+        """
+        self._append({"done": index, "end": end})
+
+    def resume_output(self, path):
+        """
+        Byte offset after the last finished record and its index, cutting off what was written after it;
+        (0, None) to start the output over when there is nothing to keep or the output was lost.
+        """
+        if not self.done:
+            return 0, None
+        last = max(self.done)
+        end = self.done[last]
+        try:
+            if os.path.getsize(path) < end:
+                raise OSError("output is shorter than the journal")
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        except OSError as e:
+            print(f"Starting {path} over ({e}), lookups are kept")
+            self.done = {}
+            return 0, None
+        return end, last
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def finish(self):
+        """
+        The output is complete: the journal is not needed any more.
+        """
+        self.close()
+        os.remove(self.path)
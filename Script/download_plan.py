@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+# download_plan.py
+#
+# Planner and scheduler for the playlist downloads of main.py (options 1 and 2).
+# Every track becomes a job whose size is estimated from streams.duration and the bitrate of the chosen codec
+# (unknown durations count as the median of the known ones). Before anything is downloaded the plan is checked
+# against the free space of the target disk: a download that cannot fit is cut down to the tracks that do,
+# instead of running out of disk in the middle of the night.
+# Jobs of all chosen playlists run on --jobs worker threads, longest track first: the long downloads start
+# early and the short ones fill the gaps at the end, so no worker sits idle while one finishes a long track.
+# --max-bytes and --max-time are budgets: no job is started that would exceed them (a smaller one that still
+# fits is taken instead), running jobs finish and the run ends with a summary. A worker that finds nothing that
+# fits waits while other downloads run, as they count with their estimate until they are done. The free space
+# is checked again before every job, and Ctrl-C also stops cleanly after the running downloads.
+#
+# Usage Example:
+# python3 main.py NewPipeData.zip --jobs 4 --max-bytes 50G --max-time 8h
+#
+# - Sizes take K, M, G or T suffixes (powers of 1024), times s, m or h; plain numbers are bytes and seconds.
+# - PLAYLIST_DISK_RESERVE_MB (default 512) is kept free on the target disk.
+
+import argparse
+import bisect
+import os
+import shutil
+import statistics
+import threading
+import time
+
+import metrics
+
+# kbit/s of the files written: YouTube audio streams for mp4, ffmpeg's defaults for the transcoded codecs
+CODEC_KBPS = {"mp3": 128, "wav": 1411, "flac": 800, "aac": 128, "opus": 96, "mp4": 130}
+SOURCE_KBPS = 130 # downloaded stream, kept next to the transcoded file until the transcode is done
+DEFAULT_DURATION = 240 # seconds, when no track of the plan has a known duration
+DEFAULT_JOBS = 1
+DEFAULT_RESERVE_MB = 512
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+TIME_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+plan_bytes = metrics.gauge("download_plan_bytes", "Estimated bytes of the planned downloads")
+
+def parse_size(value):
+    number, unit = value.strip().lower().rstrip("ib").rstrip(), ""
+    if number and number[-1] in SIZE_UNITS:
+        number, unit = number[:-1], number[-1]
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}', expected e.g. 500M or 50G")
+
+def parse_time(value):
+    number, unit = value.strip().lower(), ""
+    if number and number[-1] in TIME_UNITS:
+        number, unit = number[:-1], number[-1]
+    try:
+        return float(number) * TIME_UNITS[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid time '{value}', expected e.g. 90m or 8h")
+
+def add_download_arguments(parser):
+    group = parser.add_argument_group("downloads")
+    group.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="tracks downloaded at the same time")
+    group.add_argument("--max-bytes", type=parse_size, help="stop starting downloads beyond this size, e.g. 50G")
+    group.add_argument("--max-time", type=parse_time, help="stop starting downloads that would end after this time, e.g. 8h")
+
+def options_from_args(args):
+    return {"jobs": max(args.jobs, 1), "max_bytes": args.max_bytes, "max_time": args.max_time}
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+def format_hours(seconds):
+    return f"{seconds / 3600:.1f} h" if seconds >= 3600 else f"{seconds / 60:.0f} min"
+
+class DownloadPlan:
+    """
+    Jobs (size, order, folder, url, duration), sorted by estimated size, smallest first so the longest pops first.
+    """
+    def __init__(self, codec):
+        self.codec = codec
+        self.kbps = CODEC_KBPS.get(codec, SOURCE_KBPS)
+        # disk needed while a job runs, per byte of its final size
+        self.peak_factor = 1.0 if codec == "mp4" else 1.0 + SOURCE_KBPS / self.kbps
+        self.jobs = []
+        self.dropped = []
+
+    @property
+    def total_bytes(self):
+        return sum(job[0] for job in self.jobs)
+
+    @property
+    def total_seconds(self):
+        return sum(job[4] for job in self.jobs)
+
+    def estimate(self, duration):
+        return int(duration * self.kbps * 1000 / 8)
+
+def plan_downloads(store, playlists, codec, root):
+    """
+    One job per track of the chosen playlists, downloaded into root/<playlist label>.
+    """
+    plan = DownloadPlan(codec)
+    tracks = []
+    for playlist in playlists:
+        folder = os.path.join(root, playlist.label)
+        for index in playlist.items:
+            tracks.append((folder, store.urls[index], store.duration_of(index)))
+    known = [duration for _, _, duration in tracks if duration > 0]
+    fallback = statistics.median(known) if known else DEFAULT_DURATION
+    for order, (folder, url, duration) in enumerate(tracks):
+        duration = duration if duration > 0 else fallback
+        # ties keep the playlist order: the larger -order pops first
+        plan.jobs.append((plan.estimate(duration), -order, folder, url, duration))
+    plan.jobs.sort()
+    plan_bytes.set(plan.total_bytes)
+    return plan
+
+def free_space(root):
+    path = os.path.abspath(root)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+def disk_reserve():
+    return int(float(os.environ.get("PLAYLIST_DISK_RESERVE_MB", DEFAULT_RESERVE_MB)) * 1024 * 1024)
+
+def preflight(plan, root, jobs=DEFAULT_JOBS):
+    """
+    Check the plan against the free disk space; drops the longest tracks that do not fit.
+    Returns (free bytes, needed bytes).
+    """
+    free = free_space(root) - disk_reserve()
+    # every running job also holds its downloaded stream until it is transcoded
+    transient = sum(job[0] for job in plan.jobs[-jobs:]) * (plan.peak_factor - 1.0)
+    needed = int(plan.total_bytes + transient)
+    if needed > free:
+        budget = free - transient
+        total = plan.total_bytes
+        while plan.jobs and total > budget:
+            job = plan.jobs.pop()
+            plan.dropped.append(job)
+            total -= job[0]
+    return free, needed
+
+class Scheduler:
+    """
+    Hands out the longest job that fits the byte budget, the time budget and the free disk space.
+    """
+    def __init__(self, plan, root, max_bytes=None, max_time=None):
+        self.plan = plan
+        self.pending = list(plan.jobs)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.deadline = time.monotonic() + max_time if max_time else None
+        self.reserve = disk_reserve()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock) # notified when a job finishes or the run is stopped
+        self.committed = 0 # estimated bytes of running jobs plus actual bytes of finished ones
+        self.running = 0 # estimated bytes of running jobs, not on the disk yet
+        self.active = 0 # jobs running
+        self.busy_seconds = 0.0
+        self.done_bytes = 0
+        self.stopped = None # reason no more jobs are started
+
+    def next_job(self):
+        with self.changed:
+            while True:
+                if self.stopped or not self.pending:
+                    return None
+                caps = []
+                left = None
+                if self.max_bytes is not None:
+                    caps.append(("byte budget", self.max_bytes - self.committed))
+                if self.deadline is not None:
+                    left = self.deadline - time.monotonic()
+                    if left <= 0:
+                        self.stopped = "time budget"
+                        self.changed.notify_all()
+                        return None
+                    if self.busy_seconds > 0 and self.done_bytes > 0:
+                        # bytes one worker gets through in the time left, at the speed seen so far
+                        caps.append(("time budget", left * self.done_bytes / self.busy_seconds))
+                disk = (free_space(self.root) - self.reserve - self.running * self.plan.peak_factor) / self.plan.peak_factor
+                caps.append(("disk space", disk))
+                reason, cap = min(caps, key=lambda item: item[1])
+                index = bisect.bisect_right(self.pending, (cap, float("inf"))) - 1
+                if index >= 0:
+                    break
+                if not self.active:
+                    self.stopped = reason
+                    self.changed.notify_all()
+                    return None
+                # running jobs still count with their estimate, see again when one of them is done
+                self.changed.wait(left)
+            job = self.pending.pop(index)
+            self.committed += job[0]
+            self.running += job[0]
+            self.active += 1
+            return job
+
+    def finished(self, job, size, seconds):
+        with self.changed:
+            self.committed += size - job[0]
+            self.running -= job[0]
+            self.active -= 1
+            if size:
+                self.done_bytes += size
+                self.busy_seconds += seconds
+            self.changed.notify_all()
+
+    def stop(self, reason):
+        with self.changed:
+            self.stopped = self.stopped or reason
+            self.changed.notify_all()
+
+def run_plan(plan, download, root, jobs=DEFAULT_JOBS, max_bytes=None, max_time=None):
+    """
+    Run download(folder, url) -> bytes written (0 when skipped) for every job on jobs threads.
+    Returns (scheduler, jobs not started).
+    """
+    scheduler = Scheduler(plan, root, max_bytes, max_time)
+    metrics.track(len(plan.jobs), "tracks")
+
+    def worker():
+        while True:
+            job = scheduler.next_job()
+            if job is None:
+                return
+            start = time.monotonic()
+            size = 0
+            try:
+                size = download(job[2], job[3]) or 0
+            finally:
+                scheduler.finished(job, size, time.monotonic() - start)
+
+    threads = [threading.Thread(target=worker, name=f"download-{i}", daemon=True) for i in range(jobs)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        scheduler.stop("interrupted")
+        print("Stopping after the running downloads...")
+        for thread in threads:
+            thread.join()
+    return scheduler, scheduler.pending
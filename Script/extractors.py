@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+
+# extractors.py
+#
+# Common metadata interface in front of the libraries that talk to YouTube and other services.
+# Every script gets its extractor from get_extractor(), so backends can be swapped, recorded and measured.
+#
+# Backends (chosen with the PLAYLIST_EXTRACTOR environment variable, default depends on the script):
+#   yt-dlp      yt_dlp.YoutubeDL
+#   pytubefix   pytubefix.YouTube / pytubefix.Playlist
+#   synthetic   deterministic offline metadata derived from the URL (offline_backend.py)
+#   replay      answers from a local fixture store, never touches the network
+#   record      runs PLAYLIST_EXTRACTOR_RECORD_FROM (default yt-dlp) and saves every answer to the store
+# The fixture store is PLAYLIST_EXTRACTOR_STORE (default ./extractor-fixtures).
+# Backends that go to the network take every request from the shared budget in ratelimit.py and
+# retry calls answered with HTTP 429 once the service is unblocked.
+# enable_cache(N) keeps the last N video metadata and playlist expansion answers in memory (used by playlists-daemon.py).
+#
+# Metadata dicts use yt-dlp's key names: id, title, duration, uploader, uploader_url, channel_id,
+# thumbnail, view_count, timestamp, webpage_url. Channel dicts have id (UC...), name, url and thumbnail.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+
+import metrics
+import offline_backend
+import profiling
+import ratelimit
+
+DEFAULT_STORE = "extractor-fixtures"
+METADATA_KEYS = ("id", "title", "duration", "uploader", "uploader_url", "channel_id",
+                 "thumbnail", "view_count", "timestamp", "webpage_url")
+CHANNEL_URL = "https://www.youtube.com/channel/"
+
+_request_seconds = metrics.histogram("extractor_request_seconds", "Latency of extractor calls")
+_request_errors = metrics.counter("extractor_errors_total", "Failed extractor calls")
+_cache_requests = metrics.counter("extractor_cache_requests_total", "Cached extractor calls, by result (hit or miss)")
+
+class ExtractorError(Exception):
+    pass
+
+class MetadataCache:
+    """
+    Least recently used answers of (call, url), at most max_entries of them.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class Extractor:
+    """
+    Base class: video metadata, playlist expansion and audio streams for a URL.
+    Every public call is timed in self.stats as {call: [count, seconds, errors]}.
+    """
+    name = "base"
+    rate_limited = False
+
+    def __init__(self):
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self.cache = None
+
+    def _timed(self, call, function, *args):
+        start = time.perf_counter()
+        failed = False
+        try:
+            with profiling.span("extractor." + call, backend=self.name):
+                return self._call(function, args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                entry = self.stats.setdefault(call, [0, 0.0, 0])
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += int(failed)
+            _request_seconds.observe(elapsed, call=call, backend=self.name)
+            if failed:
+                _request_errors.inc(call=call, backend=self.name)
+
+    def _call(self, function, args):
+        if not self.rate_limited:
+            return function(*args)
+        service = ratelimit.service_of(args[0])
+        for attempt in range(ratelimit.MAX_RETRIES + 1):
+            ratelimit.acquire(service)
+            try:
+                result = function(*args)
+            except Exception as e:
+                if attempt == ratelimit.MAX_RETRIES or not ratelimit.is_throttled(e):
+                    raise
+                blocked = ratelimit.report_throttled(service, ratelimit.retry_after(e))
+                print(f"{service} is rate limiting, pausing requests of all processes for {blocked:.0f} s")
+                continue
+            ratelimit.report_success(service)
+            return result
+
+    def _cached(self, call, function, url):
+        # failures are not cached, callers get copies so they cannot change the cached answer
+        if self.cache is None:
+            return self._timed(call, function, url)
+        result = self.cache.get((call, url))
+        _cache_requests.inc(call=call, result="miss" if result is None else "hit")
+        if result is None:
+            result = self._timed(call, function, url)
+            self.cache.put((call, url), result)
+        return dict(result) if isinstance(result, dict) else list(result)
+
+    def video_metadata(self, url):
+        return self._cached("video_metadata", self._video_metadata, url)
+
+    def expand_playlist(self, url):
+        return self._cached("expand_playlist", self._expand_playlist, url)
+
+    def channel_metadata(self, url):
+        """
+        Returns {"id", "name", "url", "thumbnail"} of a channel URL (/channel/, /@handle, /c/ or /user/).
+        """
+        return self._cached("channel_metadata", self._channel_metadata, url)
+
+    def audio_stream(self, url):
+        """
+        Returns {"title", "url", "ext"} of the best audio-only stream.
+        """
+        return self._timed("audio_stream", self._audio_stream, url)
+
+    def download_audio(self, stream, output_path):
+        """
+        Download a stream returned by audio_stream into output_path, returns the file path.
+        """
+        path = self._timed("download_audio", self._download_audio, stream, output_path)
+        profiling.add_bytes(os.path.getsize(path))
+        return path
+
+    def _video_metadata(self, url):
+        raise NotImplementedError
+
+    def _expand_playlist(self, url):
+        raise NotImplementedError
+
+    def _channel_metadata(self, url):
+        raise NotImplementedError
+
+    def _audio_stream(self, url):
+        raise NotImplementedError
+
+    def _download_audio(self, stream, output_path):
+        path = os.path.join(output_path, safe_filename(stream["title"]) + "." + stream["ext"])
+        with urllib.request.urlopen(stream["url"]) as response, open(path, "wb") as f:
+            shutil.copyfileobj(response, f, 1024 * 1024)
+        return path
+
+def safe_filename(title):
+    return "".join("_" if c in '*"/\\<>:|?' else c for c in title)
+
+def metadata_from_info(info):
+    metadata = {key: info.get(key) for key in METADATA_KEYS}
+    metadata["webpage_url"] = metadata["webpage_url"] or info.get("original_url")
+    return metadata
+
+class YtDlpExtractor(Extractor):
+    name = "yt-dlp"
+    rate_limited = True
+
+    def __init__(self):
+        super().__init__()
+        from yt_dlp import YoutubeDL
+        self._youtube_dl = YoutubeDL
+
+    def _extract(self, url, **opts):
+        params = {'quiet': True, 'no_warnings': True, 'skip_download': True}
+        params.update(opts)
+        with self._youtube_dl(params) as ydl:
+            try:
+                return ydl.extract_info(url, download=False)
+            except Exception as e:
+                raise ExtractorError(str(e)) from e
+
+    def _video_metadata(self, url):
+        return metadata_from_info(self._extract(url, extract_flat=False))
+
+    def _expand_playlist(self, url):
+        info = self._extract(url, extract_flat=True)
+        video_urls = []
+        for entry in info.get('entries') or []:
+            video_url = entry.get('url') or entry.get('webpage_url')
+            if video_url:
+                video_urls.append(video_url)
+        return video_urls
+
+    def _channel_metadata(self, url):
+        # the channel page without its videos
+        info = self._extract(url, extract_flat=True, playlist_items="0")
+        channel_id = info.get("channel_id") or info.get("id")
+        avatars = [t.get("url") for t in info.get("thumbnails") or [] if "avatar" in str(t.get("id"))]
+        return {
+            "id": channel_id,
+            "name": info.get("channel") or info.get("uploader") or info.get("title"),
+            "url": CHANNEL_URL + channel_id if channel_id else info.get("channel_url") or url,
+            "thumbnail": avatars[-1] if avatars else info.get("thumbnail"),
+        }
+
+    def _audio_stream(self, url):
+        info = self._extract(url, format='bestaudio/best')
+        return {"title": info.get("title") or info.get("id"), "url": info["url"], "ext": info.get("ext") or "m4a"}
+
+class PytubefixExtractor(Extractor):
+    name = "pytubefix"
+    rate_limited = True
+
+    def __init__(self):
+        super().__init__()
+        import pytubefix
+        self._pytubefix = pytubefix
+
+    def _video(self, url):
+        try:
+            return self._pytubefix.YouTube(str(url))
+        except Exception as e:
+            raise ExtractorError(str(e)) from e
+
+    def _video_metadata(self, url):
+        video = self._video(url)
+        try:
+            publish_date = video.publish_date
+            return {
+                "id": video.video_id,
+                "title": video.title,
+                "duration": video.length,
+                "uploader": video.author,
+                "uploader_url": video.channel_url,
+                "channel_id": video.channel_id,
+                "thumbnail": video.thumbnail_url,
+                "view_count": video.views,
+                "timestamp": int(publish_date.timestamp()) if publish_date else None,
+                "webpage_url": video.watch_url,
+            }
+        except Exception as e:
+            raise ExtractorError(str(e)) from e
+
+    def _expand_playlist(self, url):
+        try:
+            return list(self._pytubefix.Playlist(url).video_urls)
+        except Exception as e:
+            raise ExtractorError(str(e)) from e
+
+    def _channel_metadata(self, url):
+        try:
+            channel = self._pytubefix.Channel(url)
+            return {
+                "id": channel.channel_id,
+                "name": channel.channel_name,
+                "url": CHANNEL_URL + channel.channel_id,
+                "thumbnail": channel.thumbnail_url,
+            }
+        except Exception as e:
+            raise ExtractorError(str(e)) from e
+
+    def _audio_stream(self, url):
+        video = self._video(url)
+        try:
+            stream = video.streams.filter(only_audio=True)[0]
+            return {"title": video.streams[0].title, "url": stream.url, "ext": stream.subtype, "_stream": stream}
+        except Exception as e:
+            raise ExtractorError(str(e)) from e
+
+    def _download_audio(self, stream, output_path):
+        # pytubefix downloads in chunks with its own throttling workarounds
+        return stream["_stream"].download(output_path=output_path)
+
+class SyntheticExtractor(Extractor):
+    name = "synthetic"
+
+    def _video_metadata(self, url):
+        offline_backend.simulate_latency()
+        return metadata_from_info(offline_backend.video_info(url))
+
+    def _expand_playlist(self, url):
+        offline_backend.simulate_latency()
+        return [entry["url"] for entry in offline_backend.playlist_info(url)["entries"]]
+
+    def _channel_metadata(self, url):
+        offline_backend.simulate_latency()
+        return offline_backend.channel_info(url)
+
+    def _audio_stream(self, url):
+        offline_backend.simulate_latency()
+        info = offline_backend.video_info(url)
+        return {"title": info["title"], "url": info["webpage_url"], "ext": "mp4"}
+
+    def _download_audio(self, stream, output_path):
+        path = os.path.join(output_path, safe_filename(stream["title"]) + "." + stream["ext"])
+        with open(path, "wb") as f:
+            f.write(offline_backend.audio_bytes(stream["url"]))
+        return path
+
+class FixtureStore:
+    """
+    One JSON file per (call, URL) plus recorded audio files, in a directory.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, "audio"), exist_ok=True)
+
+    def key(self, call, url):
+        return call + "-" + hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def load(self, call, url):
+        try:
+            with open(os.path.join(self.path, self.key(call, url) + ".json"), "r", encoding="utf-8") as f:
+                fixture = json.load(f)
+        except FileNotFoundError:
+            raise ExtractorError(f"no recorded {call} for {url}")
+        if "error" in fixture:
+            raise ExtractorError(fixture["error"])
+        return fixture["result"]
+
+    def save(self, call, url, result=None, error=None):
+        fixture = {"call": call, "url": url}
+        if error is not None:
+            fixture["error"] = error
+        else:
+            fixture["result"] = result
+        path = os.path.join(self.path, self.key(call, url) + ".json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def audio_path(self, url, ext):
+        return os.path.join(self.path, "audio", self.key("audio", url) + "." + ext)
+
+class ReplayExtractor(Extractor):
+    name = "replay"
+
+    def __init__(self, store_path):
+        super().__init__()
+        self.store = FixtureStore(store_path)
+
+    def _video_metadata(self, url):
+        return self.store.load("video_metadata", url)
+
+    def _expand_playlist(self, url):
+        return self.store.load("expand_playlist", url)
+
+    def _channel_metadata(self, url):
+        return self.store.load("channel_metadata", url)
+
+    def _audio_stream(self, url):
+        stream = self.store.load("audio_stream", url)
+        stream["_source"] = url
+        return stream
+
+    def _download_audio(self, stream, output_path):
+        source = self.store.audio_path(stream["_source"], stream["ext"])
+        if not os.path.isfile(source):
+            raise ExtractorError(f"no recorded audio for {stream['_source']}")
+        path = os.path.join(output_path, safe_filename(stream["title"]) + "." + stream["ext"])
+        shutil.copyfile(source, path)
+        return path
+
+class RecordingExtractor(Extractor):
+    """
+    Passes every call to another extractor and saves the answers (and failures) for replay.
+    """
+    def __init__(self, inner, store_path):
+        super().__init__()
+        self.inner = inner
+        self.store = FixtureStore(store_path)
+        self.name = "record:" + inner.name
+
+    def _record(self, call, url, function):
+        try:
+            result = function(url)
+        except ExtractorError as e:
+            self.store.save(call, url, error=str(e))
+            raise
+        self.store.save(call, url, result={k: v for k, v in result.items() if not k.startswith("_")}
+                        if isinstance(result, dict) else result)
+        return result
+
+    def _video_metadata(self, url):
+        return self._record("video_metadata", url, self.inner.video_metadata)
+
+    def _expand_playlist(self, url):
+        return self._record("expand_playlist", url, self.inner.expand_playlist)
+
+    def _channel_metadata(self, url):
+        return self._record("channel_metadata", url, self.inner.channel_metadata)
+
+    def _audio_stream(self, url):
+        stream = self._record("audio_stream", url, self.inner.audio_stream)
+        stream["_source"] = url
+        return stream
+
+    def _download_audio(self, stream, output_path):
+        path = self.inner.download_audio(stream, output_path)
+        shutil.copyfile(path, self.store.audio_path(stream["_source"], stream["ext"]))
+        return path
+
+BACKENDS = {
+    "yt-dlp": YtDlpExtractor,
+    "pytubefix": PytubefixExtractor,
+    "synthetic": SyntheticExtractor,
+}
+
+def create_extractor(name, store_path=None):
+    store_path = store_path or os.environ.get("PLAYLIST_EXTRACTOR_STORE", DEFAULT_STORE)
+    if name == "replay":
+        return ReplayExtractor(store_path)
+    if name == "record":
+        inner = os.environ.get("PLAYLIST_EXTRACTOR_RECORD_FROM", "yt-dlp")
+        return RecordingExtractor(create_extractor(inner, store_path), store_path)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown extractor '{name}', choose one of: " + ", ".join(list(BACKENDS) + ["replay", "record"]))
+    return BACKENDS[name]()
+
+_extractors = {}
+_extractors_lock = threading.Lock()
+_cache_entries = 0
+
+def enable_cache(max_entries):
+    """
+    Cache metadata and playlist answers of every extractor from get_extractor(), for long-running processes.
+    """
+    global _cache_entries
+    with _extractors_lock:
+        _cache_entries = max_entries
+        for extractor in _extractors.values():
+            if extractor.cache is None:
+                extractor.cache = MetadataCache(max_entries)
+
+def get_extractor(default="yt-dlp"):
+    """
+    The extractor selected by PLAYLIST_EXTRACTOR (or default), created once per process.
+    """
+    name = os.environ.get("PLAYLIST_EXTRACTOR", default)
+    with _extractors_lock:
+        if name not in _extractors:
+            extractor = create_extractor(name)
+            if _cache_entries:
+                extractor.cache = MetadataCache(_cache_entries)
+            _extractors[name] = extractor
+        return _extractors[name]
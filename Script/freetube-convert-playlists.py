@@ -14,8 +14,11 @@
 
 import json
 import csv
+import os
 import sys
 
+import profiling
+
 def freetube_to_csv(in_db, out_csv):
     with open(in_db, "r", encoding="utf-8") as f_in, \
          open(out_csv, "w", newline="", encoding="utf-8") as f_out:
@@ -47,8 +50,11 @@ def main():
     in_db = sys.argv[1]
     out_csv = sys.argv[2]
 
-    freetube_to_csv(in_db, out_csv)
+    with profiling.span("convert") as s:
+        freetube_to_csv(in_db, out_csv)
+        s.add_bytes(os.path.getsize(in_db))
     print(f"Converted {in_db} to {out_csv}.")
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
@@ -19,11 +19,14 @@ import csv
 import sys
 import tempfile
 
+import profiling
+
 def grayjay_zip_to_csv(zip_path, csv_path):
     with tempfile.TemporaryDirectory() as tmpdir:
         # Extract the zip
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with profiling.span("unzip") as s, zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(tmpdir)
+            s.add_bytes(sum(info.file_size for info in zip_ref.infolist()))
 
         # Path to playlists file inside unzipped folder
         playlists_file = os.path.join(tmpdir, "stores", "Playlists")
@@ -36,7 +39,7 @@ def grayjay_zip_to_csv(zip_path, csv_path):
         with open(playlists_file, "r", encoding="utf-8") as f:
             playlists_data = json.load(f)
 
-        with open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
+        with profiling.span("write csv"), open(csv_path, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.writer(csvfile)
             # No header row for consistency
 
@@ -69,4 +72,5 @@ def main():
     print(f"Converted {zip_path} to {csv_path}")
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
@@ -1,16 +1,23 @@
 #!/usr/bin/env python3
 
-import csv
+import argparse
 import sqlite3
 import sys
 import os
 import time
-import re
 import zipfile
 import tempfile
 from sqlite3 import Error
-from pytubefix import YouTube
 from pydub import AudioSegment
+import metrics
+import profiling
+from download_plan import (DEFAULT_JOBS, add_download_arguments, format_bytes, format_hours, options_from_args,
+                           plan_downloads, preflight, run_plan)
+from extractors import get_extractor
+from playlist_filter import add_filter_arguments, criteria_from_args, select_playlists
+from search_index import open_updated_index, search_playlists
+from snapshot_cache import SnapshotDirectory
+from playlist_export import EXPORT_FORMATS, delta_summary, export_playlists, playlist_fingerprints
 
 class text:
     PURPLE = '\033[95m'
@@ -25,6 +32,16 @@ class text:
     END = '\033[0m'
 
 database_size_limit = 1024**3 # 1GB size limit for DB extraction
+playlist_list_limit = 50 # above this many playlists, option 2 asks for a search first
+
+download_results = metrics.counter("downloads_total", "Tracks by result: downloaded, skipped or failed")
+download_seconds = metrics.histogram("download_seconds", "Time to download one track")
+transcode_seconds = metrics.histogram("transcode_seconds", "Time to transcode one track")
+download_speed = metrics.histogram("download_bytes_per_second", "Download throughput per track",
+                                   buckets=(64e3, 256e3, 1e6, 2.5e6, 5e6, 10e6, 25e6, 50e6, 100e6))
+
+# menu option -> export format
+EXPORT_OPTIONS = {"3": "csv", "4": "txt", "5": "m3u8", "6": "md", "7": "json"}
 
 def logo():
     print(text.RED + "NewPipe Playlist Extractor" + text.END)
@@ -39,7 +56,9 @@ def create_connection(db_file):
                     print(f"{text.RED}newpipe.db is too large ({db_info.file_size} bytes). Exiting.{text.END}")
                     return None, None
                 temp_folder = tempfile.TemporaryDirectory()
-                db_file = newpipezip.extract('newpipe.db', path=temp_folder.name)
+                with profiling.span("unzip") as s:
+                    db_file = newpipezip.extract('newpipe.db', path=temp_folder.name)
+                    s.add_bytes(db_info.file_size)
                 print(f"Extracted DB to {text.CYAN}{db_file}{text.END}")
         conn = sqlite3.connect(db_file)
         def dict_factory(cursor, row):
@@ -53,77 +72,137 @@ def create_connection(db_file):
         print(text.RED + str(e) + text.END)
     return None, None
 
-def getPlaylists(db_file):
-    print("Extracting Playlists...")
+def readPlaylists(db_file, criteria=None):
     conn, temp_folder = create_connection(db_file)
     if conn is None:
         return None
-    cur = conn.cursor()
-
-    # query local playlists (playlist uid and name)
-    cur.execute("SELECT uid, name FROM playlists")
-    local_playlists = cur.fetchall()
-
-    # query remote playlists (uid, name, url)
-    cur.execute("SELECT uid, name, url FROM remote_playlists")
-    remote_playlists = cur.fetchall()
-
-    PlaylistDir = {}
-
-    # add local playlists with video URLs
-    for pl in local_playlists:
-        uid = pl["uid"]
-        name = pl["name"]
-        cur.execute("""
-            SELECT s.url FROM playlist_stream_join psj
-            JOIN streams s ON psj.stream_id = s.uid
-            WHERE psj.playlist_id = ?
-            ORDER BY psj.join_index
-        """, (uid,))
-        urls = [row["url"] for row in cur.fetchall()]
-        PlaylistDir[name] = urls
-
-    # add remote playlists as single URL list
-    for pl in remote_playlists:
-        name = pl["name"]
-        url = pl["url"]
-        PlaylistDir[name] = [url]
+
+    # per-playlist fingerprints for incremental export
+    fingerprints = playlist_fingerprints(conn)
+
+    # one query for all playlists, filtered inside SQLite when criteria are given,
+    # into a compact PlaylistStore (see playlist_store.py)
+    PlaylistDir = select_playlists(conn, criteria)
 
     conn.close()
     if temp_folder is not None:
         temp_folder.cleanup()
 
+    return PlaylistDir, fingerprints
+
+def getPlaylists(db_file, fingerprints=None, criteria=None):
+    print("Extracting Playlists...")
+    # a backup parsed before is loaded from its snapshot (see snapshot_cache.py)
+    snapshots = SnapshotDirectory()
+    key = snapshots.key(db_file, criteria)
+    snapshot = snapshots.load(key)
+    if snapshot is not None:
+        print(f"Loaded playlists from snapshot in {text.CYAN}{snapshots.directory}{text.END}")
+    else:
+        snapshot = readPlaylists(db_file, criteria)
+        if snapshot is None:
+            return None
+        snapshots.save(key, *snapshot)
+    PlaylistDir, snapshotFingerprints = snapshot
+
+    # fill caller's dict with per-playlist fingerprints for incremental export
+    if fingerprints is not None:
+        fingerprints.update(snapshotFingerprints)
+
     return PlaylistDir
 
-def downloadPlaylist(folderName, playlist, codec):
-    path = "./Playlists/" + folderName
-    if not os.path.exists(path):
-        os.mkdir(path)
-    for song_url in playlist:
-        print(text.BLUE + "Downloading: " + song_url + text.END)
-        try:
-            YouTubeVideo = YouTube(str(song_url))
-            songName = YouTubeVideo.streams[0].title
-            destination = path + "/"
-            if not os.path.exists(destination + songName + "." + codec):
-                audio = YouTubeVideo.streams.filter(only_audio=True)[0]
-                audioFile = audio.download(output_path=destination)
-                if codec != "mp4":
+def downloadTrack(extractor, song_url, path, codec):
+    """
+    Download one track into the folder path, returns the bytes written (0 when skipped or failed).
+    """
+    print(text.BLUE + "Downloading: " + song_url + text.END)
+    try:
+        audio = extractor.audio_stream(str(song_url))
+        songName = audio["title"]
+        destination = path + "/"
+        if not os.path.exists(destination + songName + "." + codec):
+            start = time.perf_counter()
+            audioFile = extractor.download_audio(audio, destination)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(audioFile)
+            written = size
+            download_seconds.observe(elapsed)
+            download_speed.observe(size / max(elapsed, 1e-6))
+            if codec != "mp4":
+                with profiling.span("transcode", codec=codec) as s, transcode_seconds.time(codec=codec):
                     given_audio = AudioSegment.from_file(audioFile, format="mp4")
                     base, ext = os.path.splitext(audioFile)
                     newFile = base + "." + codec
                     given_audio.export(newFile, format=codec)
+                    s.add_bytes(size)
                     os.remove(audioFile)
-                else:
-                    pass
-                print(text.YELLOW + "Waiting 3 sec. for YouTube DDoS protection circumvent" + text.END)
-                time.sleep(3)
-            else:
-                print(text.CYAN + (destination + songName + "." + codec) + " already downloaded" + text.END)
-        except Exception as e:
-            print(text.RED + str(e) + text.END)
-            print("If error is get_throttling_function_name could not find match for multiple")
-            print("Read the README error chapter")
+                    written = os.path.getsize(newFile)
+            download_results.inc(result="downloaded")
+            metrics.advance(moved_bytes=size)
+            return written
+        else:
+            download_results.inc(result="skipped")
+            metrics.advance()
+            print(text.CYAN + (destination + songName + "." + codec) + " already downloaded" + text.END)
+    except Exception as e:
+        download_results.inc(result="failed")
+        metrics.advance(error=True)
+        print(text.RED + str(e) + text.END)
+        print("If error is get_throttling_function_name could not find match for multiple")
+        print("Read the README error chapter")
+    return 0
+
+def downloadPlaylists(Playlists, chosenPlaylists, codec, options):
+    # estimated sizes, disk space check and longest-first scheduling (see download_plan.py)
+    root = "./Playlists"
+    plan = plan_downloads(Playlists, chosenPlaylists, codec, root)
+    free, needed = preflight(plan, root, options["jobs"])
+    print(f"{len(plan.jobs) + len(plan.dropped)} tracks, {format_hours(plan.total_seconds)}, about "
+          f"{text.CYAN}{format_bytes(needed)}{text.END} as {codec}, {format_bytes(free)} free")
+    if plan.dropped:
+        print(f"{text.YELLOW}Not enough disk space: {len(plan.dropped)} tracks are left out, "
+              f"{len(plan.jobs)} tracks ({format_bytes(plan.total_bytes)}) fit{text.END}")
+    for playlist in chosenPlaylists:
+        os.makedirs(os.path.join(root, playlist.label), exist_ok=True)
+    extractor = get_extractor(default="pytubefix")
+    start = time.monotonic()
+    scheduler, notStarted = run_plan(plan, lambda folder, url: downloadTrack(extractor, url, folder, codec), root,
+                                     options["jobs"], options["max_bytes"], options["max_time"])
+    print(f"{format_bytes(scheduler.done_bytes)} downloaded in {format_hours(time.monotonic() - start)}")
+    if notStarted:
+        print(f"{text.YELLOW}Stopped by the {scheduler.stopped}: {len(notStarted)} tracks not downloaded{text.END}")
+
+def exportPlaylists(Playlists, formats, fingerprints=None):
+    stats = export_playlists(Playlists, formats, "./Playlists", fingerprints)
+    for fmt in formats:
+        result = stats[fmt]
+        if result["delta"] is not None:
+            print(f"{fmt}: playlists {delta_summary(result['delta'])}")
+        print(f"{fmt}: {text.CYAN}{result['written']}{text.END} files written, {result['unchanged']} unchanged, {result['removed']} removed")
+
+def choosePlaylists(db_file, Playlists):
+    chosen = list(Playlists)
+    if len(chosen) > playlist_list_limit:
+        print(f"{len(chosen)} playlists, search by playlist name, track title or uploader")
+        query = str(input("Search (empty lists all playlists): "))
+        if query.strip():
+            conn, _ = open_updated_index(db_file)
+            matches = search_playlists(conn, query)
+            conn.close()
+            keys = dict.fromkeys(f"{kind}:{uid}" for kind, uid, name, matched_by in matches)
+            chosen = [Playlists.get(key) for key in keys if Playlists.get(key) is not None]
+    print("Available playlists")
+    for index, playlist in enumerate(chosen):
+        print("{0} => {1}".format(index, playlist.label))
+    if not chosen:
+        return []
+    userInput = str(input("Type playlist index (or 'all' for every listed playlist): ")).strip()
+    if userInput.lower() == "all":
+        return chosen
+    try:
+        return [chosen[int(userInput)]]
+    except (ValueError, IndexError):
+        return []
 
 def chooseCodec():
     print("=========================")
@@ -139,9 +218,13 @@ def chooseCodec():
     codecs = {"1": "mp3", "2": "wav", "3": "flac", "4": "aac", "5": "opus", "6": "mp4"}
     return codecs.get(userInput, "mp3")
 
-def main(db_file):
+def main(db_file, criteria=None, options=None):
+    options = options or {"jobs": DEFAULT_JOBS, "max_bytes": None, "max_time": None}
     logo()
-    Playlists = getPlaylists(db_file)
+    # a filtered selection is not a full export: it is not recorded in the incremental export state,
+    # and the formats it writes are dropped from it (see playlist_export.forget_formats)
+    fingerprints = None if criteria else {}
+    Playlists = getPlaylists(db_file, fingerprints, criteria)
     if Playlists is None or len(Playlists) == 0:
         print("No playlists could be extracted. Exiting.")
         sys.exit()
@@ -156,6 +239,7 @@ def main(db_file):
     print("5\t|\tSave playlists to .m3u8 files")
     print("6\t|\tSave playlists to .md file")
     print("7\t|\tDump contents of database to JSON (debug)")
+    print("8\t|\tSave playlists to several formats at once")
 
     userInput = str(input("Choose action: "))
     print("=========================")
@@ -163,91 +247,58 @@ def main(db_file):
     if userInput == "1":
         userCodec = chooseCodec()
         print("Downloading all playlists...")
-        for playlist in Playlists:
-            print("Downloading playlist: " + text.CYAN + playlist + text.END)
-            downloadPlaylist(playlist, Playlists[playlist], userCodec)
+        downloadPlaylists(Playlists, list(Playlists), userCodec, options)
         print(text.GREEN + "Done!" + text.END)
 
     elif userInput == "2":
-        playlistIndex = {}
-        print("Available playlists")
-        index = 0
-        for key in Playlists:
-            playlistIndex[index] = key
-            print("{0} => {1}".format(index, key))
-            index += 1
-        userInput = str(input("Type playlist index: "))
-        chosenPlaylist = playlistIndex.get(int(userInput))
-        if chosenPlaylist and chosenPlaylist in Playlists:
+        chosenPlaylists = choosePlaylists(db_file, Playlists)
+        if chosenPlaylists:
             userCodec = chooseCodec()
-            downloadPlaylist(chosenPlaylist, Playlists[chosenPlaylist], userCodec)
+            print("Downloading playlists: " + text.CYAN + ", ".join(p.label for p in chosenPlaylists) + text.END)
+            downloadPlaylists(Playlists, chosenPlaylists, userCodec, options)
             print(text.GREEN + "Done!" + text.END)
         else:
             print(text.YELLOW + "Playlist not in data base" + text.END)
 
-    elif userInput == "3":
-        print("Saving playlists into /Playlists/playlists.csv")
-        os.makedirs("./Playlists", exist_ok=True)
-        with open("./Playlists/playlists.csv", "w", newline='', encoding='utf-8') as f:
-            writerCSV = csv.writer(f)
-            for playlist, urls in Playlists.items():
-                writerCSV.writerow([playlist, str(urls)])
-        print(text.GREEN + "Done!" + text.END)
-
-    elif userInput == "4":
-        print("Saving playlists into /Playlists/playlists.txt")
-        os.makedirs("./Playlists", exist_ok=True)
-        with open('./Playlists/playlists.txt', 'w', encoding='utf-8') as writerTXT:
-            for playlist in Playlists:
-                writerTXT.write("=========================\n")
-                writerTXT.write(playlist + "\n")
-                writerTXT.write("=========================\n")
-                for url in Playlists[playlist]:
-                    writerTXT.write(url + "\n")
-        print(text.GREEN + "Done!" + text.END)
-
-    elif userInput == "5":
-        print("Saving m3u8 playlists into /Playlists/")
-        os.makedirs("./Playlists", exist_ok=True)
-        for playlist in Playlists:
-            playlistpath = './Playlists/' + re.sub('[*"/\\<>:|?]', '_', playlist) + '.m3u8'
-            print(f'Writing {playlistpath}')
-            with open(playlistpath, 'w', encoding='utf-8') as writerM3U8:
-                writerM3U8.write("#EXTM3U\n")
-                writerM3U8.write("#PLAYLIST:" + playlist + "\n")
-                for song_url in Playlists[playlist]:
-                    writerM3U8.write(song_url + "\n")
-        print(text.GREEN + "Done!" + text.END)
-
-    elif userInput == "6":
-        print("Saving playlists into /Playlists/playlists.md")
-        os.makedirs("./Playlists", exist_ok=True)
-        with open('./Playlists/playlists.md', 'w', encoding='utf-8') as writerMD:
-            for playlist in Playlists:
-                writerMD.write(playlist + "\n")
-                writerMD.write("=========================\n\n")
-                for url in Playlists[playlist]:
-                    writerMD.write(f"* [{url}]({url})\n")
-                writerMD.write("\n")
+    elif userInput in EXPORT_OPTIONS:
+        fmt = EXPORT_OPTIONS[userInput]
+        if fmt == "m3u8":
+            print("Saving m3u8 playlists into /Playlists/")
+        elif fmt == "json":
+            print("Dumping all data managed by NewPipe Playlist Extractor to /Playlists/playlists.json")
+        else:
+            print("Saving playlists into /Playlists/playlists." + fmt)
+        exportPlaylists(Playlists, [fmt], fingerprints)
         print(text.GREEN + "Done!" + text.END)
 
-    elif userInput == "7":
-        import json
-        print("Dumping all data managed by NewPipe Playlist Extractor to /Playlists/playlists.json")
-        os.makedirs("./Playlists", exist_ok=True)
-        with open('./Playlists/playlists.json', 'w', encoding='utf-8') as writerJSON:
-            json.dump(Playlists, writerJSON, ensure_ascii=False, indent=4)
-        print(text.GREEN + "Done!" + text.END)
+    elif userInput == "8":
+        print("Formats: " + ", ".join(EXPORT_FORMATS))
+        userFormats = str(input("Type formats separated by comma (default is all): "))
+        formats = [f.strip().lower() for f in userFormats.split(",") if f.strip()] or list(EXPORT_FORMATS)
+        unknown = [f for f in formats if f not in EXPORT_FORMATS]
+        if unknown:
+            print(text.YELLOW + "Unknown format: " + ", ".join(unknown) + text.END)
+        else:
+            print("Saving playlists into /Playlists/")
+            exportPlaylists(Playlists, formats, fingerprints)
+            print(text.GREEN + "Done!" + text.END)
 
     else:
         print(text.YELLOW + "Wrong input, ending script" + text.END)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) == 2:
-        main(sys.argv[1])
+    profiling.init_from_argv()
+    metrics.init_from_argv()
+    parser = argparse.ArgumentParser(usage="python3 main.py <newpipe.db or zip> [selection options]")
+    parser.add_argument("db_file")
+    add_filter_arguments(parser)
+    add_download_arguments(parser)
+    if len(sys.argv) >= 2:
+        args = parser.parse_args()
+        main(args.db_file, criteria_from_args(args), options_from_args(args))
     else:
-        print("""Usage: python3 main.py <newpipe.db or zip>
+        print("""Usage: python3 main.py <newpipe.db or zip> [selection options]
 
 To use this script:
 
@@ -255,8 +306,20 @@ To use this script:
 2. Extract the database as .ZIP file.
 3. Run this script with path to zip or newpipe.db file.
 
+Selection options (python3 main.py --help for all):
+  --name PATTERN, --min-duration SEC, --max-duration SEC, --uploader TEXT,
+  --uploaded-after DATE, --uploaded-before DATE, --stream-type TYPE, --not-watched
+
+Download options (options 1 and 2):
+  --jobs N (parallel downloads, longest track first), --max-bytes SIZE, --max-time TIME
+
+Profiling: --profile[=trace.json], --profile-top=N, --profile-cprofile=STAGE
+Progress and metrics: --progress, --metrics-file=PATH, --metrics-port=PORT
+
 Examples:
 
 $ python3 main.py NewPipeBackup.zip
 $ python3 main.py newpipe.db
+$ python3 main.py newpipe.db --name "Rock*" --max-duration 600 --not-watched
+$ python3 main.py NewPipeBackup.zip --jobs 4 --max-bytes 50G --max-time 8h
 """)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+
+# metrics.py
+#
+# Counters, gauges and histograms for long download and conversion runs.
+# Progress of the current run (done/total items, bytes, errors) is tracked with track() and advance(),
+# from which the status line derives throughput, ETA and queue depth.
+#
+# Flags (removed from sys.argv by init_from_argv before the script parses its arguments):
+#   --progress                 live status line on stderr
+#   --metrics-file=PATH        Prometheus text file, rewritten every few seconds and at exit
+#                              (for the node_exporter textfile collector)
+#   --metrics-port=PORT        serve the metrics at http://127.0.0.1:PORT/metrics while the script runs
+#
+# Usage Example:
+# python3 main.py NewPipeData.zip --progress --metrics-file=/var/lib/node_exporter/newpipe.prom
+# python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip --metrics-port=9464
+
+import atexit
+import bisect
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "playlist_extractor_"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STATUS_INTERVAL = 0.5 # seconds between status line updates
+FILE_INTERVAL = 5 # seconds between metrics file rewrites
+
+_lock = threading.Lock()
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self):
+        with _lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        if not self.values:
+            return [(self.name, (), 0)]
+        return [(self.name, key, value) for key, value in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with _lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        with _lock:
+            return self.values.get(_label_key(labels), 0)
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.values = {} # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def time(self, **labels):
+        """
+        Context manager observing the seconds spent inside it.
+        """
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        for key, entry in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                samples.append((self.name + "_bucket", key + (("le", repr(float(bound))),), cumulative))
+            samples.append((self.name + "_bucket", key + (("le", "+Inf"),), entry[-1]))
+            samples.append((self.name + "_sum", key, entry[-2]))
+            samples.append((self.name + "_count", key, entry[-1]))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _get(self, cls, name, help_text, *args):
+        with _lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(PREFIX + name, help_text, *args)
+        return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with _lock:
+            for metric in self.metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.help}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                for name, key, value in metric.samples():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+# progress of the current run
+items_total = gauge("items_total", "Items (tracks, URLs) planned in the current run")
+items_done = gauge("items_done", "Items finished in the current run, including skipped and failed ones")
+item_errors = counter("item_errors_total", "Items that failed")
+bytes_total = counter("bytes_total", "Bytes downloaded or written")
+run_started = gauge("run_start_time_seconds", "Unix time the current run started")
+
+_run_start = None
+_unit = "items"
+
+def track(total, unit="items"):
+    """
+    Start tracking a run of total items (called again for every playlist adds to the plan).
+    """
+    global _run_start, _unit
+    if _run_start is None:
+        _run_start = time.perf_counter()
+        run_started.set(time.time())
+    _unit = unit
+    items_total.inc(total)
+
+def advance(count=1, error=False, moved_bytes=0):
+    items_done.inc(count)
+    if error:
+        item_errors.inc(count)
+    if moved_bytes:
+        bytes_total.inc(moved_bytes)
+
+def _duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+def status_line():
+    """
+    One line of progress: done/total, rate, ETA, queue depth, errors and throughput.
+    """
+    total = items_total.get()
+    done = items_done.get()
+    elapsed = time.perf_counter() - _run_start if _run_start is not None else 0.0
+    rate = done / elapsed if elapsed > 0 else 0.0
+    queued = max(total - done, 0)
+    eta = _duration(queued / rate) if rate > 0 else "--:--"
+    percent = done * 100 // total if total else 0
+    return (f"[{done}/{total} {_unit} {percent}%] {rate:.2f}/s ETA {eta} queue {queued} "
+            f"errors {item_errors.total()} {bytes_total.total() / elapsed / 1024 / 1024 if elapsed else 0:.2f} MiB/s "
+            f"elapsed {_duration(elapsed)}")
+
+def write_textfile(path):
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(path + ".tmp", path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port, host="127.0.0.1"):
+    """
+    Serve /metrics from a daemon thread, returns the server.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+_stop = threading.Event()
+_reporter = None
+_metrics_file = None
+_progress = False
+_status_lock = threading.Lock()
+_status_shown = False
+
+class _ClearingStream:
+    """
+    Wraps sys.stdout so regular output first clears the status line instead of running into it.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, data):
+        global _status_shown
+        with _status_lock:
+            if _status_shown:
+                sys.stderr.write("\r\033[K")
+                sys.stderr.flush()
+                _status_shown = False
+            written = self._stream.write(data)
+            self._stream.flush()
+            return written
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+def _show_status():
+    global _status_shown
+    with _status_lock:
+        sys.stderr.write("\r\033[K" + status_line())
+        sys.stderr.flush()
+        _status_shown = True
+
+def _report_loop():
+    last_file = 0.0
+    while not _stop.wait(STATUS_INTERVAL):
+        if _progress and _run_start is not None:
+            _show_status()
+        if _metrics_file and time.monotonic() - last_file >= FILE_INTERVAL:
+            write_textfile(_metrics_file)
+            last_file = time.monotonic()
+
+def finish():
+    """
+    Stop the reporter, print the final status and write the metrics file; registered with atexit.
+    """
+    _stop.set()
+    if _reporter is not None:
+        _reporter.join()
+    if _progress and _run_start is not None:
+        _show_status()
+        sys.stderr.write("\n")
+    if _metrics_file:
+        write_textfile(_metrics_file)
+
+def init_from_argv(argv=None):
+    """
+    Strip the metrics flags from argv (default sys.argv, changed in place) and start what they ask for.
+    """
+    global _reporter, _metrics_file, _progress
+    argv = sys.argv if argv is None else argv
+    kept = argv[:1]
+    port = None
+    for arg in argv[1:]:
+        if arg == "--progress":
+            _progress = True
+        elif arg.startswith("--metrics-file="):
+            _metrics_file = arg.split("=", 1)[1]
+        elif arg.startswith("--metrics-port="):
+            port = int(arg.split("=", 1)[1])
+        else:
+            kept.append(arg)
+    argv[:] = kept
+    if port is not None:
+        serve(port)
+        print(f"Serving metrics at http://127.0.0.1:{port}/metrics", file=sys.stderr)
+    if _progress:
+        sys.stdout = _ClearingStream(sys.stdout)
+    if _progress or _metrics_file:
+        _reporter = threading.Thread(target=_report_loop, daemon=True)
+        _reporter.start()
+        atexit.register(finish)
+    return argv
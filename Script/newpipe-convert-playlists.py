@@ -4,14 +4,23 @@
 #
 # Convert NewPipe newpipe.db or backup zip to a CSV, each row being a playlist and a list of its video URLs.
 # Supports local and remote playlists
+# Keeps a playlists.csv.state.json file with a fingerprint per playlist next to the CSV.
+# On later runs only added or changed playlists are read from the database, unchanged rows
+# are taken over from the previous CSV, and nothing is written when no playlist changed.
+# Selection options (see playlist_filter.py) export only matching playlists and tracks; the
+# filter runs inside SQLite and such a partial export removes the state file, so the next full
+# export reads every playlist again instead of keeping the partial CSV.
 #
 # Usage Example:
 #   python3 newpipe-convert-playlists.py newpipe.db playlists.csv
 #   python3 newpipe-convert-playlists.py NewPipeData.zip playlists.csv
+#   python3 newpipe-convert-playlists.py NewPipeData.zip playlists.csv --name "Rock*" --not-watched
 #
 # - The first argument is the path to your NewPipe database file (newpipe.db or ZIP backup).
 # - The second argument is the destination CSV file.
 
+import argparse
+import ast
 import csv
 import os
 import sqlite3
@@ -19,15 +28,35 @@ import sys
 import tempfile
 import zipfile
 
+import profiling
+from playlist_filter import add_filter_arguments, criteria_from_args, select_playlists
+from playlist_export import delta_summary, diff_fingerprints, load_state, playlist_fingerprints, save_state
+from playlist_store import PlaylistStore
+
 def extract_newpipe_db(zip_path, extract_dir):
-    with zipfile.ZipFile(zip_path, 'r') as zf:
+    with profiling.span("unzip") as s, zipfile.ZipFile(zip_path, 'r') as zf:
         zf.extract('newpipe.db', path=extract_dir)
+        s.add_bytes(zf.getinfo('newpipe.db').file_size)
     return os.path.join(extract_dir, 'newpipe.db')
 
-def read_playlists_from_db(db_path):
+@profiling.profiled("read playlists")
+def read_playlists_from_db(db_path, previous_rows=None, refresh_names=None):
+    """
+    Read every playlist into a PlaylistStore.
+    Playlists whose name is not in refresh_names are taken from previous_rows
+    (name -> URL list string of the last CSV) instead of being queried.
+    """
     conn = sqlite3.connect(db_path)
+    if previous_rows is None:
+        # nothing to reuse, read every playlist with a single query
+        store = select_playlists(conn)
+        conn.close()
+        return store
     c = conn.cursor()
 
+    def reuse(name):
+        return name not in refresh_names and name in previous_rows
+
     # Read local playlists
     c.execute("SELECT uid, name FROM playlists")
     local_playlists = c.fetchall()
@@ -36,53 +65,119 @@ def read_playlists_from_db(db_path):
     c.execute("SELECT uid, name, url FROM remote_playlists")
     remote_playlists = c.fetchall()
 
-    playlist_map = {}
+    store = PlaylistStore()
 
     # For local playlists, gather video URLs by joining playlist_stream_join and streams tables
     for uid, name in local_playlists:
-        c.execute("""
-            SELECT s.url FROM playlist_stream_join psj
-            JOIN streams s ON psj.stream_id = s.uid
-            WHERE psj.playlist_id = ?
-            ORDER BY psj.join_index
-        """, (uid,))
-        urls = [row[0] for row in c.fetchall()]
-        playlist_map[name] = urls
+        playlist = store.add_playlist("local", uid, name)
+        if reuse(name):
+            urls = ast.literal_eval(previous_rows[name])
+        else:
+            c.execute("""
+                SELECT s.url FROM playlist_stream_join psj
+                JOIN streams s ON psj.stream_id = s.uid
+                WHERE psj.playlist_id = ?
+                ORDER BY psj.join_index
+            """, (uid,))
+            urls = [row[0] for row in c.fetchall()]
+        for url in urls:
+            store.add_track(playlist, url)
 
     # For remote playlists, add playlist URL as single item list
     for uid, name, url in remote_playlists:
-        playlist_map[name] = [url]
+        store.add_track(store.add_playlist("remote", uid, name), url)
 
     c.close()
     conn.close()
-    return playlist_map
+    return store.finish()
 
-def write_playlists_csv(playlist_map, csv_path):
-    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+def read_fingerprints_from_db(db_path):
+    conn = sqlite3.connect(db_path)
+    fingerprints = playlist_fingerprints(conn)
+    conn.close()
+    return fingerprints
+
+def read_previous_csv(csv_path):
+    rows = {}
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) == 2:
+                rows[row[0]] = row[1]
+    return rows
+
+def write_playlists_csv(store, csv_path):
+    with profiling.span("write csv"), open(csv_path, 'w', newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        for name, urls in playlist_map.items():
+        for playlist in store:
             # Write playlist name and stringified list of URLs
-            writer.writerow([name, str(urls)])
+            writer.writerow([playlist.name, str(store.urls_of(playlist))])
+
+def export_db(db_path, output_csv, criteria=None):
+    state_path = output_csv + ".state.json"
+    if criteria:
+        # the CSV will not hold what the state describes any more
+        if os.path.isfile(state_path):
+            os.remove(state_path)
+        conn = sqlite3.connect(db_path)
+        store = select_playlists(conn, criteria)
+        conn.close()
+        write_playlists_csv(store, output_csv)
+        return store
+
+    fingerprints = read_fingerprints_from_db(db_path)
+    state = load_state(state_path)
+    previous_rows = None
+    refresh_names = None
+
+    # a CSV changed since the state was saved (by hand or by another program) is exported in full
+    if state and os.path.isfile(output_csv) and os.path.getsize(output_csv) == state.get("size"):
+        delta = diff_fingerprints(state.get("playlists", {}), fingerprints)
+        print(f"Playlists since last export: {delta_summary(delta)}")
+        if not (delta["added"] or delta["changed"] or delta["removed"]):
+            print(f"{output_csv} is up to date")
+            return None
+        previous_rows = read_previous_csv(output_csv)
+        refresh_names = {fingerprints[key]["name"] for key in delta["added"] + delta["changed"]}
+        # a name shared by several playlists has one row per playlist, those are always read again
+        seen = set()
+        for value in fingerprints.values():
+            if value["name"] in seen:
+                refresh_names.add(value["name"])
+            seen.add(value["name"])
+
+    store = read_playlists_from_db(db_path, previous_rows, refresh_names)
+    write_playlists_csv(store, output_csv)
+    save_state(state_path, {"playlists": fingerprints, "size": os.path.getsize(output_csv)})
+    return store
+
+def newpipe_to_csv(input_path, output_csv, criteria=None):
+    """
+    Export a newpipe.db or NewPipe backup zip, returns the PlaylistStore or None when nothing changed.
+    """
+    if input_path.lower().endswith('.zip'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = extract_newpipe_db(input_path, tmpdir)
+            return export_db(db_path, output_csv, criteria)
+    return export_db(input_path, output_csv, criteria)
 
 def main():
-    if len(sys.argv) != 3:
+    parser = argparse.ArgumentParser(
+        usage="python3 newpipe-convert-playlists.py <newpipe.db or NewPipeData.zip> playlists.csv [selection options]")
+    parser.add_argument("input_path")
+    parser.add_argument("output_csv")
+    add_filter_arguments(parser)
+    if len(sys.argv) < 3:
         print("Usage:")
         print("  python3 newpipe-convert-playlists.py newpipe.db playlists.csv")
         print("  python3 newpipe-convert-playlists.py NewPipeData.zip playlists.csv")
+        print("  python3 newpipe-convert-playlists.py NewPipeData.zip playlists.csv --name \"Rock*\" --max-duration 600")
         sys.exit(1)
+    args = parser.parse_args()
 
-    input_path = sys.argv[1]
-    output_csv = sys.argv[2]
-
-    if input_path.lower().endswith('.zip'):
-        with tempfile.TemporaryDirectory() as tmpdir:
-            db_path = extract_newpipe_db(input_path, tmpdir)
-            playlist_map = read_playlists_from_db(db_path)
-    else:
-        playlist_map = read_playlists_from_db(input_path)
-
-    write_playlists_csv(playlist_map, output_csv)
-    print(f"Exported {len(playlist_map)} playlists to {output_csv}")
+    store = newpipe_to_csv(args.input_path, args.output_csv, criteria_from_args(args))
+    if store is not None:
+        print(f"Exported {len(store)} playlists to {args.output_csv}")
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+# newpipe-listening-stats.py
+#
+# Listening-history analytics for a NewPipe newpipe.db or backup zip.
+# Loads stream_history, stream_state, streams and playlist_stream_join into columnar NumPy arrays
+# with one bulk read per table, then computes with vectorized group-bys:
+# - top tracks and top uploaders by play count (stream_history.repeat_count)
+# - plays per hour of day and per day of week (local time of the last access)
+# - completion ratios of stream_state.progress_time against streams.duration
+# - top playlists by the plays of their tracks
+# --benchmark also runs the same statistics as plain SQL/Python, checks both agree and prints timings.
+#
+# Requires numpy (pip3 install numpy)
+#
+# Usage Example:
+# python3 newpipe-listening-stats.py newpipe.db
+# python3 newpipe-listening-stats.py NewPipeData.zip --top 20
+# python3 newpipe-listening-stats.py newpipe.db --benchmark
+#
+# - The first argument is the path to your NewPipe database file (newpipe.db or ZIP backup).
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MS_PER_HOUR = 3600 * 1000
+MS_PER_DAY = 24 * MS_PER_HOUR
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+COMPLETED_RATIO = 0.9 # progress at or above this counts as listened to the end
+ROWID_WINDOW = 1 << 20 # rows rendered per group_concat call
+DENSE_FACTOR = 4 # uids up to this many times the row count use a direct index table
+
+@profiling.profiled("unzip")
+def extract_newpipe_db(zip_path, extract_dir):
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        zf.extract('newpipe.db', path=extract_dir)
+    return os.path.join(extract_dir, 'newpipe.db')
+
+def utc_offset_ms():
+    return time.localtime().tm_gmtoff * 1000
+
+def fetch_int_columns(db_path, table, columns, jobs=None):
+    """
+    Bulk read integer columns of a table into one int64 array per column.
+    Rows are rendered to text inside SQLite with group_concat over rowid windows, so no
+    Python object is created per row, and windows are read in parallel on separate connections.
+    """
+    conn = sqlite3.connect(db_path)
+    low, high = conn.execute(f"SELECT min(rowid), max(rowid) FROM {table}").fetchone()
+    conn.close()
+    if low is None:
+        return [np.empty(0, dtype=np.int64) for _ in columns]
+
+    row_text = " || ',' || ".join(f"IFNULL({c}, 0)" for c in columns)
+    query = f"SELECT group_concat({row_text}) FROM {table} WHERE rowid >= ? AND rowid < ?"
+
+    def read_window(start):
+        window_conn = sqlite3.connect(db_path)
+        text_data = window_conn.execute(query, (start, start + ROWID_WINDOW)).fetchone()[0]
+        window_conn.close()
+        if not text_data:
+            return np.empty(0, dtype=np.int64)
+        return np.fromstring(text_data, dtype=np.int64, sep=',')
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        parts = list(pool.map(read_window, range(low, high + 1, ROWID_WINDOW)))
+    data = np.concatenate(parts).reshape(-1, len(columns))
+    return [np.ascontiguousarray(data[:, i]) for i in range(len(columns))]
+
+@profiling.profiled("load columns")
+def load_columns(db_path):
+    cols = {}
+    cols["history_stream"], cols["history_date"], cols["history_repeat"] = fetch_int_columns(
+        db_path, "stream_history", ["stream_id", "access_date", "repeat_count"])
+    cols["state_stream"], cols["state_progress"] = fetch_int_columns(
+        db_path, "stream_state", ["stream_id", "progress_time"])
+    cols["join_playlist"], cols["join_stream"] = fetch_int_columns(
+        db_path, "playlist_stream_join", ["playlist_id", "stream_id"])
+
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT uid, duration, uploader FROM streams ORDER BY uid")
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    cols["stream_uid"] = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    cols["stream_duration"] = np.fromiter((r[1] or 0 for r in rows), dtype=np.int64, count=len(rows))
+    # factorize uploaders, codes follow name order so ties break by name
+    uploaders = sorted({r[2] for r in rows})
+    code = {name: i for i, name in enumerate(uploaders)}
+    cols["stream_uploader"] = np.fromiter((code[r[2]] for r in rows), dtype=np.int64, count=len(rows))
+    cols["uploaders"] = uploaders
+    return cols
+
+def lookup(sorted_keys, keys):
+    """
+    Positions of keys in sorted_keys and a mask of the keys that were found.
+    Dense keys (autoincrement uids) use a direct index table instead of a binary search.
+    """
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+    first, last = int(sorted_keys[0]), int(sorted_keys[-1])
+    if first >= 0 and last < DENSE_FACTOR * len(sorted_keys) + 1024:
+        index = np.full(last + 1, -1, dtype=np.int64)
+        index[sorted_keys] = np.arange(len(sorted_keys))
+        pos = index[np.clip(keys, 0, last)]
+        pos[(keys < 0) | (keys > last)] = -1
+        found = pos >= 0
+        pos[~found] = 0
+        return pos, found
+    pos = np.searchsorted(sorted_keys, keys)
+    pos[pos == len(sorted_keys)] = 0
+    return pos, sorted_keys[pos] == keys
+
+def top_n(values, keys, n):
+    """
+    Indices of the n largest values, ties broken by ascending key.
+    """
+    if n < len(values):
+        kth = np.partition(values, len(values) - n)[len(values) - n]
+        candidates = np.nonzero(values >= kth)[0]
+    else:
+        candidates = np.arange(len(values))
+    candidates = candidates[values[candidates] > 0]
+    order = np.lexsort((keys[candidates], -values[candidates]))
+    return candidates[order[:n]]
+
+@profiling.profiled("compute")
+def compute_stats_numpy(cols, top=10, offset_ms=0):
+    stats = {}
+    uids = cols["stream_uid"]
+
+    # plays per stream
+    pos, found = lookup(uids, cols["history_stream"])
+    repeat = cols["history_repeat"]
+    plays = np.bincount(pos[found], weights=repeat[found], minlength=len(uids)).astype(np.int64)
+    idx = top_n(plays, uids, top)
+    stats["top_tracks"] = [(int(uids[i]), int(plays[i])) for i in idx]
+
+    # plays per uploader
+    uploader_plays = np.bincount(cols["stream_uploader"], weights=plays,
+                                 minlength=len(cols["uploaders"])).astype(np.int64)
+    idx = top_n(uploader_plays, np.arange(len(uploader_plays)), top)
+    stats["top_uploaders"] = [(cols["uploaders"][i], int(uploader_plays[i])) for i in idx]
+
+    # plays by local hour of day and weekday (1970-01-01 was a Thursday)
+    local = cols["history_date"][found] + offset_ms
+    weights = repeat[found]
+    stats["hours"] = np.bincount((local // MS_PER_HOUR) % 24, weights=weights, minlength=24).astype(np.int64).tolist()
+    stats["weekdays"] = np.bincount((local // MS_PER_DAY + 3) % 7, weights=weights, minlength=7).astype(np.int64).tolist()
+
+    # completion of started streams
+    pos, found = lookup(uids, cols["state_stream"])
+    duration = cols["stream_duration"][pos[found]]
+    progress = cols["state_progress"][found]
+    known = duration > 0
+    ratio = np.clip(progress[known] / (duration[known] * 1000.0), 0.0, 1.0)
+    stats["completion"] = {
+        "streams": int(len(ratio)),
+        "mean": float(ratio.mean()) if len(ratio) else 0.0,
+        "completed": int(np.count_nonzero(ratio >= COMPLETED_RATIO)),
+        "buckets": np.bincount(np.minimum((ratio * 10).astype(np.int64), 9), minlength=10).tolist(),
+    }
+
+    # plays per playlist, summed over its tracks
+    pos, found = lookup(uids, cols["join_stream"])
+    playlist_ids, inverse = np.unique(cols["join_playlist"][found], return_inverse=True)
+    playlist_plays = np.bincount(inverse, weights=plays[pos[found]], minlength=len(playlist_ids)).astype(np.int64)
+    idx = top_n(playlist_plays, playlist_ids, top)
+    stats["top_playlists"] = [(int(playlist_ids[i]), int(playlist_plays[i])) for i in idx]
+    return stats
+
+@profiling.profiled("compute (python)")
+def compute_stats_python(conn, top=10, offset_ms=0):
+    """
+    The same statistics with SQL group-bys and Python loops, used as benchmark baseline.
+    """
+    stats = {}
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT h.stream_id, SUM(h.repeat_count) AS plays FROM stream_history h
+        JOIN streams s ON s.uid = h.stream_id
+        GROUP BY h.stream_id HAVING plays > 0 ORDER BY plays DESC, h.stream_id LIMIT ?
+    """, (top,))
+    stats["top_tracks"] = [(r[0], r[1]) for r in cur.fetchall()]
+
+    cur.execute("""
+        SELECT s.uploader, SUM(h.repeat_count) AS plays FROM stream_history h
+        JOIN streams s ON s.uid = h.stream_id
+        GROUP BY s.uploader HAVING plays > 0 ORDER BY plays DESC, s.uploader LIMIT ?
+    """, (top,))
+    stats["top_uploaders"] = [(r[0], r[1]) for r in cur.fetchall()]
+
+    hours = [0] * 24
+    weekdays = [0] * 7
+    cur.execute("""
+        SELECT h.access_date, h.repeat_count FROM stream_history h
+        JOIN streams s ON s.uid = h.stream_id
+    """)
+    for access_date, repeat_count in cur:
+        local = access_date + offset_ms
+        hours[(local // MS_PER_HOUR) % 24] += repeat_count
+        weekdays[(local // MS_PER_DAY + 3) % 7] += repeat_count
+    stats["hours"] = hours
+    stats["weekdays"] = weekdays
+
+    ratios = []
+    cur.execute("""
+        SELECT st.progress_time, s.duration FROM stream_state st
+        JOIN streams s ON s.uid = st.stream_id WHERE s.duration > 0
+    """)
+    for progress_time, duration in cur:
+        ratios.append(min(max(progress_time / (duration * 1000.0), 0.0), 1.0))
+    buckets = [0] * 10
+    for ratio in ratios:
+        buckets[min(int(ratio * 10), 9)] += 1
+    stats["completion"] = {
+        "streams": len(ratios),
+        "mean": sum(ratios) / len(ratios) if ratios else 0.0,
+        "completed": sum(1 for ratio in ratios if ratio >= COMPLETED_RATIO),
+        "buckets": buckets,
+    }
+
+    cur.execute("""
+        SELECT psj.playlist_id, SUM(p.plays) AS plays FROM playlist_stream_join psj
+        JOIN (SELECT stream_id, SUM(repeat_count) AS plays FROM stream_history GROUP BY stream_id) p
+            ON p.stream_id = psj.stream_id
+        JOIN streams s ON s.uid = psj.stream_id
+        GROUP BY psj.playlist_id HAVING plays > 0 ORDER BY plays DESC, psj.playlist_id LIMIT ?
+    """, (top,))
+    stats["top_playlists"] = [(r[0], r[1]) for r in cur.fetchall()]
+    cur.close()
+    return stats
+
+def names_by_uid(conn, table, column, uids):
+    if not uids:
+        return {}
+    cur = conn.cursor()
+    cur.execute(f"SELECT uid, {column} FROM {table} WHERE uid IN ({','.join('?' * len(uids))})", list(uids))
+    names = dict(cur.fetchall())
+    cur.close()
+    return names
+
+@profiling.profiled("report")
+def print_report(conn, stats):
+    titles = names_by_uid(conn, "streams", "title", [uid for uid, _ in stats["top_tracks"]])
+    playlists = names_by_uid(conn, "playlists", "name", [uid for uid, _ in stats["top_playlists"]])
+
+    print("=========================")
+    print("Top tracks")
+    for uid, plays in stats["top_tracks"]:
+        print(f"{plays:8d}  {titles.get(uid, uid)}")
+    print("=========================")
+    print("Top uploaders")
+    for uploader, plays in stats["top_uploaders"]:
+        print(f"{plays:8d}  {uploader}")
+    print("=========================")
+    print("Top playlists")
+    for uid, plays in stats["top_playlists"]:
+        print(f"{plays:8d}  {playlists.get(uid, uid)}")
+    print("=========================")
+    print("Plays per hour of day")
+    peak = max(stats["hours"]) or 1
+    for hour, plays in enumerate(stats["hours"]):
+        print(f"{hour:02d}h {plays:8d}  " + "#" * round(40 * plays / peak))
+    print("=========================")
+    print("Plays per day of week")
+    peak = max(stats["weekdays"]) or 1
+    for day, plays in zip(WEEKDAYS, stats["weekdays"]):
+        print(f"{day} {plays:8d}  " + "#" * round(40 * plays / peak))
+    print("=========================")
+    completion = stats["completion"]
+    print(f"Completion of {completion['streams']} started streams: "
+          f"mean {completion['mean']:.0%}, {completion['completed']} played to the end (>= {COMPLETED_RATIO:.0%})")
+    for i, count in enumerate(completion["buckets"]):
+        print(f"{i * 10:3d}-{i * 10 + 10:3d}% {count:8d}")
+
+def same_stats(a, b):
+    ca = dict(a["completion"])
+    cb = dict(b["completion"])
+    if abs(ca.pop("mean") - cb.pop("mean")) > 1e-9:
+        return False
+    return ca == cb and all(a[key] == b[key] for key in a if key != "completion")
+
+def benchmark(db_path, conn, top, offset_ms):
+    history_rows = conn.execute("SELECT count(*) FROM stream_history").fetchone()[0]
+
+    start = time.perf_counter()
+    cols = load_columns(db_path)
+    loaded = time.perf_counter()
+    numpy_stats = compute_stats_numpy(cols, top, offset_ms)
+    numpy_done = time.perf_counter()
+    python_stats = compute_stats_python(conn, top, offset_ms)
+    python_done = time.perf_counter()
+
+    print("=========================")
+    print(f"Benchmark on {history_rows} stream_history rows")
+    print(f"numpy:  load {loaded - start:.3f}s + compute {numpy_done - loaded:.3f}s = {numpy_done - start:.3f}s")
+    print(f"python: {python_done - numpy_done:.3f}s")
+    print(f"speedup: {(python_done - numpy_done) / max(numpy_done - start, 1e-9):.1f}x")
+    print("results match" if same_stats(numpy_stats, python_stats) else "RESULTS DIFFER")
+    return numpy_stats
+
+def listening_stats(db_path, top, run_benchmark):
+    conn = sqlite3.connect(db_path)
+    offset_ms = utc_offset_ms()
+    if run_benchmark:
+        stats = benchmark(db_path, conn, top, offset_ms)
+    else:
+        stats = compute_stats_numpy(load_columns(db_path), top, offset_ms)
+    print_report(conn, stats)
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 newpipe-listening-stats.py <newpipe.db or zip> [--top N] [--benchmark]")
+    parser.add_argument("input_path")
+    parser.add_argument("--top", type=int, default=10, help="entries in the top lists (default 10)")
+    parser.add_argument("--benchmark", action="store_true", help="compare against a plain SQL/Python implementation")
+    if len(sys.argv) < 2:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    if np is None:
+        print("numpy is required: pip3 install numpy")
+        sys.exit(1)
+
+    if args.input_path.lower().endswith('.zip'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            listening_stats(extract_newpipe_db(args.input_path, tmpdir), args.top, args.benchmark)
+    else:
+        listening_stats(args.input_path, args.top, args.benchmark)
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    main()
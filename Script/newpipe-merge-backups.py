@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+# newpipe-merge-backups.py
+#
+# Merges several NewPipe backups (e.g. from different phones) into one.
+# The first backup is copied as the base, every further backup is ATTACHed to it in turn and merged with
+# INSERT ... SELECT statements, so rows stream through SQLite and memory stays bounded however many backups are given.
+# - streams are deduplicated on (service_id, url); a temp table maps the uids of the attached backup to the merged ones
+#   and is used to remap playlist_stream_join, stream_history, stream_state and feed
+# - stream_history keeps the highest repeat_count of an access, stream_state the furthest progress
+# - subscriptions and remote playlists are unioned on (service_id, url), feed groups matched by name
+# - search_history rows are added when not present yet
+# - local playlists with the same name are handled by --playlists:
+#     merge  one playlist, tracks missing from it are appended in their order (default)
+#     keep   every playlist is kept, copies with exactly the same tracks are skipped
+#     first  the playlist of the earliest backup wins, later ones are skipped
+# The merged newpipe.db is analyzed and compacted (sqlite_finalize.py). A .zip output also gets
+# preferences.json and newpipe.settings of the first backup.
+#
+# Usage Example:
+# python3 newpipe-merge-backups.py NewPipeData-merged.zip phone.zip tablet.zip old-phone.zip
+# python3 newpipe-merge-backups.py merged.db phone.zip tablet.zip --playlists keep
+#
+# - The first argument is the output (.zip or .db).
+# - All further arguments are NewPipe backups (.zip) or newpipe.db files, the first one is the base.
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import zipfile
+
+import profiling
+from sqlite_finalize import finalize_db, report
+
+PLAYLIST_POLICIES = ("merge", "keep", "first")
+CACHE_KIB = 64 * 1024 # page cache of the merged database
+
+STREAM_COLUMNS = ("service_id, url, title, stream_type, duration, uploader, uploader_url, thumbnail_url, "
+                  "view_count, textual_upload_date, upload_date, is_upload_date_approximation")
+
+def extract_newpipe_db(path, extract_dir):
+    if not path.lower().endswith('.zip'):
+        return path
+    with zipfile.ZipFile(path, 'r') as zf:
+        zf.extract('newpipe.db', path=extract_dir)
+    return os.path.join(extract_dir, 'newpipe.db')
+
+def src_tables(conn):
+    return {row[0] for row in conn.execute("SELECT name FROM src.sqlite_master WHERE type='table'")}
+
+def map_by_key(c, temp_table, table, key):
+    """
+    Fill temp_table(old, new) with the uids of src.table and main.table rows sharing the key columns.
+    """
+    condition = " AND ".join(f"m.{column} = s.{column}" for column in key)
+    c.execute(f"DELETE FROM temp.{temp_table}")
+    c.execute(f"INSERT INTO temp.{temp_table} SELECT s.uid, m.uid FROM src.{table} s JOIN main.{table} m ON {condition}")
+
+def merge_streams(c, counts):
+    before = c.execute("SELECT count(*) FROM main.streams").fetchone()[0]
+    c.execute(f"INSERT OR IGNORE INTO main.streams ({STREAM_COLUMNS}) SELECT {STREAM_COLUMNS} FROM src.streams ORDER BY uid")
+    counts["streams added"] = c.execute("SELECT count(*) FROM main.streams").fetchone()[0] - before
+    map_by_key(c, "stream_map", "streams", ("service_id", "url"))
+
+def merge_history(c, tables, counts):
+    if "stream_history" in tables:
+        c.execute("""INSERT INTO main.stream_history (stream_id, access_date, repeat_count)
+                     SELECT m.new, h.access_date, h.repeat_count FROM src.stream_history h JOIN temp.stream_map m ON m.old = h.stream_id
+                     WHERE true
+                     ON CONFLICT(stream_id, access_date) DO UPDATE SET repeat_count = max(repeat_count, excluded.repeat_count)""")
+        counts["history rows"] = c.rowcount
+    if "stream_state" in tables:
+        c.execute("""INSERT INTO main.stream_state (stream_id, progress_time)
+                     SELECT m.new, s.progress_time FROM src.stream_state s JOIN temp.stream_map m ON m.old = s.stream_id
+                     WHERE true
+                     ON CONFLICT(stream_id) DO UPDATE SET progress_time = max(progress_time, excluded.progress_time)""")
+    if "search_history" in tables:
+        c.execute("""INSERT INTO main.search_history (creation_date, service_id, search)
+                     SELECT s.creation_date, s.service_id, s.search FROM src.search_history s
+                     WHERE NOT EXISTS (SELECT 1 FROM main.search_history h
+                                       WHERE h.search = s.search AND h.service_id = s.service_id AND h.creation_date IS s.creation_date)
+                     ORDER BY s.id""")
+
+def merge_subscriptions(c, tables, counts):
+    if "subscriptions" not in tables:
+        return
+    c.execute("""INSERT OR IGNORE INTO main.subscriptions
+                 (service_id, url, name, avatar_url, subscriber_count, description, notification_mode)
+                 SELECT service_id, url, name, avatar_url, subscriber_count, description, notification_mode
+                 FROM src.subscriptions ORDER BY uid""")
+    counts["subscriptions added"] = c.rowcount
+    map_by_key(c, "subscription_map", "subscriptions", ("service_id", "url"))
+    if "feed" in tables:
+        c.execute("""INSERT OR IGNORE INTO main.feed (stream_id, subscription_id)
+                     SELECT sm.new, bm.new FROM src.feed f
+                     JOIN temp.stream_map sm ON sm.old = f.stream_id
+                     JOIN temp.subscription_map bm ON bm.old = f.subscription_id""")
+    if "feed_last_updated" in tables:
+        c.execute("""INSERT INTO main.feed_last_updated (subscription_id, last_updated)
+                     SELECT bm.new, f.last_updated FROM src.feed_last_updated f JOIN temp.subscription_map bm ON bm.old = f.subscription_id
+                     WHERE true
+                     ON CONFLICT(subscription_id) DO UPDATE SET last_updated = max(coalesce(last_updated, 0), coalesce(excluded.last_updated, 0))""")
+    if "feed_group" in tables:
+        c.execute("""INSERT INTO main.feed_group (name, icon_id, sort_order)
+                     SELECT name, icon_id, (SELECT coalesce(max(sort_order), -1) + 1 FROM main.feed_group) + row_number() OVER (ORDER BY sort_order) - 1
+                     FROM src.feed_group g WHERE NOT EXISTS (SELECT 1 FROM main.feed_group m WHERE m.name = g.name)""")
+        c.execute("DELETE FROM temp.group_map")
+        c.execute("""INSERT INTO temp.group_map SELECT g.uid, (SELECT min(m.uid) FROM main.feed_group m WHERE m.name = g.name)
+                     FROM src.feed_group g""")
+        if "feed_group_subscription_join" in tables:
+            c.execute("""INSERT OR IGNORE INTO main.feed_group_subscription_join (group_id, subscription_id)
+                         SELECT gm.new, bm.new FROM src.feed_group_subscription_join j
+                         JOIN temp.group_map gm ON gm.old = j.group_id
+                         JOIN temp.subscription_map bm ON bm.old = j.subscription_id""")
+
+def playlist_streams(c, schema, playlist_uid, mapped=False):
+    """
+    Stream uids of a playlist in order, src playlists translated to merged uids.
+    """
+    if mapped:
+        rows = c.execute("""SELECT m.new FROM src.playlist_stream_join j JOIN temp.stream_map m ON m.old = j.stream_id
+                            WHERE j.playlist_id = ? ORDER BY j.join_index""", (playlist_uid,))
+    else:
+        rows = c.execute(f"SELECT stream_id FROM {schema}.playlist_stream_join WHERE playlist_id = ? ORDER BY join_index",
+                         (playlist_uid,))
+    return [row[0] for row in rows]
+
+def append_tracks(c, target_uid, src_uid, only_missing):
+    """
+    Append the tracks of src playlist src_uid to merged playlist target_uid, renumbering join_index.
+    """
+    missing = "AND m.new NOT IN (SELECT stream_id FROM main.playlist_stream_join WHERE playlist_id = :target)" if only_missing else ""
+    c.execute(f"""INSERT INTO main.playlist_stream_join (playlist_id, stream_id, join_index)
+                  SELECT :target, m.new,
+                         (SELECT coalesce(max(join_index), -1) + 1 FROM main.playlist_stream_join WHERE playlist_id = :target)
+                         + row_number() OVER (ORDER BY j.join_index) - 1
+                  FROM src.playlist_stream_join j JOIN temp.stream_map m ON m.old = j.stream_id
+                  WHERE j.playlist_id = :source {missing}
+                  ORDER BY j.join_index""", {"target": target_uid, "source": src_uid})
+    return c.rowcount
+
+def merge_playlists(c, tables, policy, counts):
+    if "remote_playlists" in tables:
+        c.execute("""INSERT OR IGNORE INTO main.remote_playlists (service_id, name, url, thumbnail_url, uploader, display_index, stream_count)
+                     SELECT service_id, name, url, thumbnail_url, uploader, display_index, stream_count FROM src.remote_playlists ORDER BY uid""")
+        counts["remote playlists added"] = c.rowcount
+    if "playlists" not in tables:
+        return
+    by_name = {}
+    for uid, name in c.execute("SELECT uid, name FROM main.playlists ORDER BY uid").fetchall():
+        by_name.setdefault(name, []).append(uid)
+
+    src_playlists = c.execute("""SELECT uid, name, is_thumbnail_permanent, thumbnail_stream_id, display_index
+                                 FROM src.playlists ORDER BY uid""").fetchall()
+    for uid, name, thumbnail_permanent, thumbnail_stream_id, display_index in src_playlists:
+        existing = by_name.get(name)
+        if existing and policy == "first":
+            counts["playlists skipped"] += 1
+            continue
+        if existing and policy == "merge":
+            added = append_tracks(c, existing[0], uid, only_missing=True)
+            counts["playlists merged" if added else "playlists unchanged"] += 1
+            continue
+        if existing and policy == "keep":
+            tracks = playlist_streams(c, "src", uid, mapped=True)
+            if any(playlist_streams(c, "main", other) == tracks for other in existing):
+                counts["playlists unchanged"] += 1
+                continue
+
+        row = c.execute("SELECT new FROM temp.stream_map WHERE old = ?", (thumbnail_stream_id,)).fetchone()
+        c.execute("INSERT INTO main.playlists (name, is_thumbnail_permanent, thumbnail_stream_id, display_index) VALUES (?, ?, ?, ?)",
+                  (name, thumbnail_permanent, row[0] if row else -1, display_index))
+        target_uid = c.lastrowid
+        append_tracks(c, target_uid, uid, only_missing=False)
+        if not row:
+            c.execute("""UPDATE main.playlists SET thumbnail_stream_id = coalesce(
+                             (SELECT stream_id FROM main.playlist_stream_join WHERE playlist_id = ? ORDER BY join_index LIMIT 1), -1)
+                         WHERE uid = ?""", (target_uid, target_uid))
+        by_name.setdefault(name, []).append(target_uid)
+        counts["playlists added"] += 1
+
+def merge_backup(conn, db_path, policy):
+    """
+    Merge one attached backup into the main database, returns counts of what was added.
+    """
+    counts = {"streams added": 0, "history rows": 0, "subscriptions added": 0, "remote playlists added": 0,
+              "playlists added": 0, "playlists merged": 0, "playlists unchanged": 0, "playlists skipped": 0}
+    conn.execute("ATTACH DATABASE ? AS src", (db_path,))
+    try:
+        tables = src_tables(conn)
+        if "streams" not in tables:
+            raise sqlite3.DatabaseError("no streams table")
+        c = conn.cursor()
+        c.execute("BEGIN")
+        with profiling.span("merge streams"):
+            merge_streams(c, counts)
+        with profiling.span("merge history"):
+            merge_history(c, tables, counts)
+        with profiling.span("merge subscriptions"):
+            merge_subscriptions(c, tables, counts)
+        with profiling.span("merge playlists"):
+            merge_playlists(c, tables, policy, counts)
+        c.execute("COMMIT")
+        c.close()
+    finally:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        conn.execute("DETACH DATABASE src")
+    return counts
+
+def open_merged(db_path):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute(f"PRAGMA cache_size=-{CACHE_KIB}")
+    conn.execute("PRAGMA temp_store=FILE")
+    for name in ("stream_map", "subscription_map", "group_map"):
+        conn.execute(f"CREATE TEMP TABLE {name} (old INTEGER PRIMARY KEY, new INTEGER NOT NULL)")
+    return conn
+
+def merge_backups(output_path, input_paths, policy):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, 'newpipe.db')
+        with profiling.span("copy base"):
+            base_dir = os.path.join(tmpdir, 'base')
+            shutil.copyfile(extract_newpipe_db(input_paths[0], base_dir), db_path)
+        conn = open_merged(db_path)
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        print(f"Base: {input_paths[0]}")
+
+        for path in input_paths[1:]:
+            with profiling.span("merge backup", path=path):
+                input_dir = os.path.join(tmpdir, 'input')
+                src_path = extract_newpipe_db(path, input_dir)
+                src = sqlite3.connect(src_path)
+                src_version = src.execute("PRAGMA user_version").fetchone()[0]
+                src.close()
+                if src_version != user_version:
+                    print(f"Warning: {path} has database version {src_version}, the base has {user_version}")
+                try:
+                    counts = merge_backup(conn, src_path, policy)
+                except sqlite3.DatabaseError as e:
+                    print(f"Skipping {path}: {e}")
+                    continue
+                finally:
+                    if src_path != path:
+                        shutil.rmtree(input_dir, ignore_errors=True)
+            print(f"Merged {path}: " + ", ".join(f"{value} {key}" for key, value in counts.items() if value))
+        conn.close()
+
+        report("newpipe.db", *finalize_db(db_path))
+
+        if output_path.lower().endswith('.zip'):
+            with profiling.span("zip") as s:
+                with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                    zf.write(db_path, arcname='newpipe.db')
+                    if input_paths[0].lower().endswith('.zip'):
+                        with zipfile.ZipFile(input_paths[0], 'r') as base_zip:
+                            for name in ('preferences.json', 'newpipe.settings'):
+                                if name in base_zip.namelist():
+                                    zf.writestr(name, base_zip.read(name))
+                s.add_bytes(os.path.getsize(output_path))
+        else:
+            shutil.copyfile(db_path, output_path)
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 newpipe-merge-backups.py <output .zip or .db> <backup> <backup> [...] [--playlists merge|keep|first]")
+    parser.add_argument("output_path")
+    parser.add_argument("input_paths", nargs="+")
+    parser.add_argument("--playlists", choices=PLAYLIST_POLICIES, default="merge",
+                        help="what to do with local playlists of the same name (default merge)")
+    if len(sys.argv) < 3:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    for path in args.input_paths:
+        if not os.path.isfile(path):
+            print(f"Error: File '{path}' not found.")
+            sys.exit(1)
+        if os.path.abspath(path) == os.path.abspath(args.output_path):
+            print("Error: the output must not be one of the inputs.")
+            sys.exit(1)
+
+    merge_backups(args.output_path, args.input_paths, args.playlists)
+    print(f"Created {args.output_path} from {len(args.input_paths)} backups")
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# newpipe-search.py
+#
+# Search playlists and tracks of a NewPipe newpipe.db or backup zip.
+# Builds or updates the side-car FTS5 index (<backup>.search.sqlite) and runs the query against it.
+# Every word of the query has to match (as a prefix) the playlist name, or a track title or uploader.
+# --benchmark times the index update and a batch of queries built from words in the library.
+#
+# Usage Example:
+# python3 newpipe-search.py NewPipeData.zip "daft punk"
+# python3 newpipe-search.py newpipe.db "lofi" --tracks
+# python3 newpipe-search.py newpipe.db --benchmark
+#
+# - The first argument is the path to your NewPipe database file (newpipe.db or ZIP backup).
+# - The second argument is the search text.
+
+import argparse
+import random
+import sys
+import time
+
+import profiling
+from search_index import open_updated_index, search_playlists, search_tracks
+
+BENCHMARK_QUERIES = 200
+
+def print_playlists(results):
+    for kind, uid, name, matched_by in results:
+        suffix = " (remote)" if kind == "remote" else ""
+        via = "  [matching track]" if matched_by == "track" else ""
+        print(f"{name}{suffix}{via}")
+    print(f"{len(results)} playlists found")
+
+def print_tracks(results):
+    for uid, title, uploader in results:
+        print(f"{title} - {uploader}")
+    print(f"{len(results)} tracks found")
+
+def benchmark(conn, update_seconds, result):
+    streams = conn.execute("SELECT count(*) FROM streams_fts").fetchone()[0]
+    playlists = conn.execute("SELECT count(*) FROM playlists_fts").fetchone()[0]
+    print(f"Index update: {update_seconds * 1000:.1f} ms "
+          f"({result['streams_added']} streams added, {result['streams_updated']} updated, "
+          f"{result['streams_removed']} removed, playlists re-read: {result['playlists_updated']})")
+    print(f"Indexed {streams} streams and {playlists} playlists")
+
+    # sample words from random titles so the queries hit real data
+    words = []
+    max_uid = conn.execute("SELECT IFNULL(max(rowid), 0) FROM streams_fts").fetchone()[0]
+    rng = random.Random(0)
+    for _ in range(BENCHMARK_QUERIES * 3):
+        row = conn.execute("SELECT title FROM streams_fts WHERE rowid >= ? LIMIT 1",
+                           (rng.randint(0, max_uid),)).fetchone()
+        if row and row[0].split():
+            words.append(rng.choice(row[0].split()))
+        if len(words) >= BENCHMARK_QUERIES:
+            break
+    if not words:
+        print("No stream titles to benchmark with")
+        return
+
+    for label, run in (("tracks", lambda q: search_tracks(conn, q)),
+                       ("playlists by name and track", lambda q: search_playlists(conn, q))):
+        timings = []
+        for word in words:
+            start = time.perf_counter()
+            run(word)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{label}: {len(timings)} queries, median {timings[len(timings) // 2] * 1000:.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms, max {timings[-1] * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 newpipe-search.py <newpipe.db or zip> <query> [--tracks] [--limit N] [--index PATH] [--benchmark]")
+    parser.add_argument("input_path")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--tracks", action="store_true", help="list matching tracks instead of playlists")
+    parser.add_argument("--limit", type=int, default=50, help="maximum number of results (default 50)")
+    parser.add_argument("--index", default=None, help="index file (default: <input>.search.sqlite)")
+    parser.add_argument("--benchmark", action="store_true", help="time index update and queries")
+    if len(sys.argv) < 3:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    conn, result = open_updated_index(args.input_path, args.index)
+    update_seconds = time.perf_counter() - start
+
+    if args.benchmark:
+        benchmark(conn, update_seconds, result)
+    elif args.tracks:
+        print_tracks(search_tracks(conn, args.query, args.limit))
+    else:
+        print_playlists(search_playlists(conn, args.query, limit=args.limit))
+    conn.close()
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    main()
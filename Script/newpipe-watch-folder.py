@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+
+# newpipe-watch-folder.py
+#
+# Watches a folder that phones sync their NewPipe backups into and exports every new backup automatically.
+# - Linux inotify (through ctypes) reports new and written files; elsewhere, or with --poll, the folder is scanned
+#   every few seconds instead
+# - a backup is only picked up once its size and modification time stayed the same for --debounce seconds
+#   and it opens as a zip with a newpipe.db, so files still being copied are not read half-written
+# - backups are identified by the SHA-256 of their content: a backup synced twice, renamed or copied to another
+#   folder is exported only once
+# - every device gets its own output folder (the subfolder the backup is in, or the file name without the
+#   NewPipe timestamp), so the incremental export (playlist fingerprints, see playlist_export.py) only renders
+#   the playlists that changed since the previous backup of the same device
+# - exports run on a pool of --workers threads, backups of the same device one after another and oldest first
+# State (known hashes and files) is kept in <output>/.watch-state.json.
+#
+# Usage Example:
+# python3 newpipe-watch-folder.py ~/Sync/NewPipe ./Playlists
+# python3 newpipe-watch-folder.py ~/Sync/NewPipe ./Playlists --formats m3u8,csv --workers 4 --debounce 10
+# python3 newpipe-watch-folder.py ~/Sync/NewPipe ./Playlists --once
+#
+# - The first argument is the folder to watch (subfolders included).
+# - The second argument is the output folder, one subfolder per device.
+# - --once exports the backups already there and exits.
+
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import profiling
+from playlist_export import EXPORT_FORMATS, delta_summary, export_playlists, playlist_fingerprints
+from playlist_filter import select_playlists
+
+DEFAULT_PATTERN = "NewPipeData*.zip"
+DEFAULT_FORMATS = "csv,m3u8"
+DEFAULT_WORKERS = 2
+DEFAULT_DEBOUNCE = 5.0
+DEFAULT_POLL = 10.0
+GIVE_UP_AFTER = 3600 # seconds a file may stay unreadable before it is skipped
+STATE_FILE = ".watch-state.json"
+STATE_VERSION = 1
+TIMESTAMP_RE = re.compile(r"[-_ ]*\d{8}[-_ ]?\d{4,6}.*$")
+
+backups_total = metrics.counter("watch_backups_total", "Backups seen by the folder watcher, by result")
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify:
+    """
+    Minimal inotify binding: watch directories, read (directory, file name, mask) events.
+    """
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify needs Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.watches[wd] = path
+
+    def read(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((self.watches.get(wd), name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def device_name(watch_dir, path):
+    """
+    The subfolder a backup was synced into, or for backups in the watched folder itself
+    the file name without the timestamp NewPipe adds (NewPipeData-20240101_120000.zip -> NewPipeData).
+    """
+    folder = os.path.relpath(os.path.dirname(path), watch_dir)
+    if folder != ".":
+        return folder.replace(os.sep, "_")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return TIMESTAMP_RE.sub("", stem) or stem
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def is_complete_backup(path):
+    try:
+        with zipfile.ZipFile(path, "r") as zf:
+            return "newpipe.db" in zf.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+class Watcher:
+    def __init__(self, watch_dir, output_dir, formats, pattern, workers, debounce):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.output_dir = output_dir
+        self.formats = formats
+        self.pattern = pattern
+        self.debounce = debounce
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self.pending = {} # path -> [size, mtime_ns, time of last change, time first seen]
+        self.device_queues = {} # device -> paths waiting, only devices with a drain job running
+        self.exporting = {} # sha256 -> path of backups being exported right now
+        self.lock = threading.Lock()
+        self.state_path = os.path.join(output_dir, STATE_FILE)
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        if state.get("version") != STATE_VERSION:
+            state = {"version": STATE_VERSION, "backups": {}, "files": {}, "devices": {}}
+        return state
+
+    def save_state(self):
+        # called with self.lock held
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def matches(self, path):
+        return fnmatch.fnmatch(os.path.basename(path), self.pattern)
+
+    def notice(self, path):
+        """
+        A matching file was created or written; (re)start its debounce timer.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.pending.pop(path, None)
+            return
+        entry = self.pending.get(path)
+        if entry is None:
+            self.pending[path] = [stat.st_size, stat.st_mtime_ns, time.monotonic(), time.monotonic()]
+        elif entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            entry[:3] = [stat.st_size, stat.st_mtime_ns, time.monotonic()]
+
+    def scan(self):
+        """
+        Notice every matching file that is new or changed since it was last exported.
+        """
+        for root, dirs, files in os.walk(self.watch_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                path = os.path.join(root, name)
+                if not self.matches(path) or path in self.pending:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                with self.lock:
+                    known = self.state["files"].get(path)
+                if known is None or known[:2] != [stat.st_size, stat.st_mtime_ns]:
+                    self.notice(path)
+
+    def ready(self):
+        """
+        Pending files whose size and mtime stayed the same for the debounce time, oldest first.
+        """
+        now = time.monotonic()
+        ready = []
+        for path, entry in list(self.pending.items()):
+            if now - entry[2] < self.debounce:
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if [stat.st_size, stat.st_mtime_ns] != entry[:2]:
+                self.pending[path] = [stat.st_size, stat.st_mtime_ns, now, entry[3]]
+                continue
+            if not is_complete_backup(path):
+                if now - entry[3] > GIVE_UP_AFTER:
+                    print(f"Skipping {path}: not a NewPipe backup")
+                    backups_total.inc(result="invalid")
+                    del self.pending[path]
+                else:
+                    entry[2] = now # still being written or broken, look again later
+                continue
+            del self.pending[path]
+            ready.append((stat.st_mtime_ns, path))
+        return [path for _, path in sorted(ready)]
+
+    def drain(self, device):
+        """
+        Export the queued backups of one device in order, one job per device at a time.
+        """
+        while True:
+            with self.lock:
+                queue = self.device_queues[device]
+                if not queue:
+                    del self.device_queues[device]
+                    return
+                path = queue.pop(0)
+            try:
+                self.export_backup(path, device)
+            except Exception as e:
+                backups_total.inc(result="failed")
+                print(f"{device}: failed to export {path}: {type(e).__name__}: {e}")
+
+    def export_backup(self, path, device):
+        stat = os.stat(path)
+        with profiling.span("hash"):
+            digest = file_sha256(path)
+        with self.lock:
+            self.state["files"][path] = [stat.st_size, stat.st_mtime_ns, digest]
+            seen = self.state["backups"].get(digest)
+            if seen is None and digest in self.exporting:
+                seen = {"path": self.exporting[digest]}
+            last = self.state["devices"].get(device)
+            if seen is None and last is not None and stat.st_mtime_ns < last["mtime_ns"]:
+                seen = {"path": "a newer backup of " + device}
+            if seen is not None:
+                self.save_state()
+            else:
+                self.exporting[digest] = path
+        if seen is not None:
+            backups_total.inc(result="duplicate")
+            print(f"{device}: {os.path.basename(path)} skipped, already exported from {seen['path']}")
+            return
+
+        device_dir = os.path.join(self.output_dir, device)
+        try:
+            with profiling.span("export backup", path=path), tempfile.TemporaryDirectory() as tmpdir:
+                with zipfile.ZipFile(path, "r") as zf:
+                    zf.extract("newpipe.db", path=tmpdir)
+                conn = sqlite3.connect(os.path.join(tmpdir, "newpipe.db"))
+                try:
+                    fingerprints = playlist_fingerprints(conn)
+                    store = select_playlists(conn)
+                finally:
+                    conn.close()
+                stats = export_playlists(store, self.formats, device_dir, fingerprints)
+        except BaseException:
+            with self.lock:
+                del self.exporting[digest]
+            raise
+
+        lines = [f"{device}: exported {os.path.basename(path)} to {device_dir}"]
+        for fmt in self.formats:
+            result = stats[fmt]
+            lines.append(f"  {fmt}: playlists {delta_summary(result['delta'])}, "
+                         f"{result['written']} files written, {result['removed']} removed")
+        print("\n".join(lines))
+        backups_total.inc(result="exported")
+        with self.lock:
+            del self.exporting[digest]
+            self.state["backups"][digest] = {"path": path, "device": device, "exported": int(time.time()),
+                                             "playlists": len(store)}
+            self.state["devices"][device] = {"mtime_ns": stat.st_mtime_ns, "sha256": digest}
+            self.save_state()
+
+    def submit_ready(self):
+        for path in self.ready():
+            device = device_name(self.watch_dir, path)
+            with self.lock:
+                queue = self.device_queues.get(device)
+                if queue is not None:
+                    queue.append(path)
+                    continue
+                self.device_queues[device] = [path]
+            self.pool.submit(self.drain, device)
+
+    def run_once(self):
+        self.scan()
+        for entry in self.pending.values():
+            entry[2] -= self.debounce # files already there count as settled if unchanged
+        self.submit_ready()
+        self.pool.shutdown(wait=True)
+
+    def watch_inotify(self, inotify):
+        for root, dirs, _ in os.walk(self.watch_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            inotify.add_watch(root)
+        self.scan()
+        while True:
+            for directory, name, mask in inotify.read(min(self.debounce, 1.0)):
+                if mask & IN_Q_OVERFLOW:
+                    self.scan()
+                    continue
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO) and not name.startswith("."):
+                        inotify.add_watch(path)
+                        self.scan()
+                elif self.matches(path):
+                    self.notice(path)
+            self.submit_ready()
+
+    def watch_polling(self, interval):
+        while True:
+            self.scan()
+            self.submit_ready()
+            time.sleep(min(interval, self.debounce) if self.pending else interval)
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 newpipe-watch-folder.py <watch folder> <output folder> [--formats csv,m3u8] [--workers N] "
+              "[--debounce S] [--poll S] [--pattern GLOB] [--once]")
+    parser.add_argument("watch_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--formats", default=DEFAULT_FORMATS, help=f"export formats, from {', '.join(EXPORT_FORMATS)} (default {DEFAULT_FORMATS})")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help=f"backup file names to pick up (default {DEFAULT_PATTERN})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"backups exported at the same time (default {DEFAULT_WORKERS})")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help=f"seconds a file must stay unchanged before it is read (default {DEFAULT_DEBOUNCE:g})")
+    parser.add_argument("--poll", type=float, nargs="?", const=DEFAULT_POLL, default=None,
+                        help=f"scan the folder every N seconds instead of using inotify (default {DEFAULT_POLL:g})")
+    parser.add_argument("--once", action="store_true", help="export the backups already in the folder and exit")
+    if len(sys.argv) < 3:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in EXPORT_FORMATS]
+    if unknown or not formats:
+        print("Unknown formats: " + ", ".join(unknown) + ". Choose from: " + ", ".join(EXPORT_FORMATS))
+        sys.exit(1)
+    if not os.path.isdir(args.watch_dir):
+        print(f"Error: Folder '{args.watch_dir}' not found.")
+        sys.exit(1)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    watcher = Watcher(args.watch_dir, args.output_dir, formats, args.pattern, args.workers, args.debounce)
+    if args.once:
+        watcher.run_once()
+        return
+
+    # service managers stop with SIGTERM, handle it like Ctrl+C
+    signal.signal(signal.SIGTERM, stop)
+    inotify = None
+    if args.poll is None:
+        try:
+            inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            print(f"inotify not available ({e}), scanning every {DEFAULT_POLL:g} seconds")
+    try:
+        if inotify is not None:
+            print(f"Watching {args.watch_dir} (inotify) for {args.pattern}")
+            watcher.watch_inotify(inotify)
+        else:
+            print(f"Watching {args.watch_dir} (every {args.poll or DEFAULT_POLL:g} seconds) for {args.pattern}")
+            watcher.watch_polling(args.poll or DEFAULT_POLL)
+    except KeyboardInterrupt:
+        print("Stopping, waiting for running exports")
+    finally:
+        if inotify is not None:
+            inotify.close()
+        watcher.pool.shutdown(wait=True)
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    metrics.init_from_argv()
+    main()
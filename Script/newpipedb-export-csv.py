@@ -5,56 +5,287 @@
 # exports each table in SQLite database file as separate CSV file in output folder
 # Connects to the SQLite database file.
 # Lists all tables in the database.
-# For each table, selects all data and writes it as CSV with column headers.
+# For each table, streams its rows in chunks and writes them as CSV with column headers.
 # Saves each table as a separate CSV file named after the table inside the specified output directory.
+# Tables are exported concurrently, each on its own read-only connection.
+# With --gzip every table is written as a compressed .csv.gz file instead.
+# With --incremental a state file in the output folder records the size and mtime of the database,
+# a high-water mark per append-mostly table (the dates of stream_history and search_history, a repeated search moves
+# its row above the mark and the table is exported again) and a checksum for every
+# other table. A later run on an unchanged database reads no table at all; otherwise it appends only new rows
+# and reads every other table once, writing it to a temporary file while hashing it: the CSV is only
+# replaced when the checksum changed. streams is checksummed, its titles, durations and views are updated in place.
 #
 # usage example: python3 newpipedb-export-csv.py newpipe.db output-csv-folder
+#                python3 newpipedb-export-csv.py --gzip --jobs 4 newpipe.db output-csv-folder
+#                python3 newpipedb-export-csv.py --incremental newpipe.db output-csv-folder
 
+import argparse
 import sqlite3
 import csv
+import gzip
+import hashlib
+import json
 import os
 import sys
+import tempfile
+from urllib.request import pathname2url
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def export_sqlite_to_csv(db_file, output_dir):
+import profiling
+
+FETCH_SIZE = 10000 # rows held in memory per table at a time
+
+STATE_FILE = ".export-state.json"
+STATE_VERSION = 2
+
+# append-mostly tables and the column that only grows as rows are added
+WATERMARK_COLUMNS = {
+    "stream_history": "access_date",
+    "search_history": "creation_date", # a repeated search moves its row's date, not its id
+}
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def open_readonly(db_file):
+    uri = "file:" + pathname2url(os.path.abspath(db_file)) + "?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+def open_csv_output(csv_file_path, compress):
+    if compress:
+        return gzip.open(csv_file_path, "wt", newline="", encoding="utf-8", compresslevel=6)
+    return open(csv_file_path, "w", newline="", encoding="utf-8")
+
+def csv_path_for(output_dir, table_name, compress):
+    extension = ".csv.gz" if compress else ".csv"
+    return os.path.join(output_dir, f"{table_name}{extension}")
+
+def stream_rows(cursor):
+    while True:
+        rows = cursor.fetchmany()
+        if not rows:
+            break
+        yield rows
+
+def write_rows(cursor, csv_file_path, compress, append=False, on_rows=None):
+    """
+    Write the rows of an executed cursor to csv_file_path, chunk by chunk.
+    A new file starts with the column header, appended rows do not.
+    on_rows is called with every chunk before it is written.
+    """
+    column_names = [description[0] for description in cursor.description]
+    row_count = 0
+    if compress:
+        # appending to a gzip file adds a new gzip member, readers see one stream
+        csv_file = gzip.open(csv_file_path, "at" if append else "wt", newline="", encoding="utf-8", compresslevel=6)
+    else:
+        csv_file = open(csv_file_path, "a" if append else "w", newline="", encoding="utf-8")
+    with profiling.span("write csv", table=os.path.basename(csv_file_path)) as s, csv_file:
+        writer = csv.writer(csv_file)
+        if not append:
+            writer.writerow(column_names)  # Write header
+        for rows in stream_rows(cursor):
+            if on_rows is not None:
+                on_rows(rows)
+            writer.writerows(rows)         # Write data rows
+            row_count += len(rows)
+        if not compress:
+            s.add_bytes(csv_file.tell())
+    return row_count
+
+def table_columns(cursor, table_name):
+    cursor.execute(f"SELECT * FROM {quote_identifier(table_name)} LIMIT 0")
+    return [description[0] for description in cursor.description]
+
+def source_stamp(db_file):
+    """
+    Size and mtime of the database and its write-ahead log, which changes first in WAL mode.
+    """
+    stamp = []
+    for path in (db_file, db_file + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        stamp += [stat.st_size, stat.st_mtime_ns]
+    return stamp
+
+def export_table(db_file, table_name, output_dir, compress=False):
+    conn = open_readonly(db_file)
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_SIZE
+    try:
+        cursor.execute(f"SELECT * FROM {quote_identifier(table_name)}")
+        csv_file_path = csv_path_for(output_dir, table_name, compress)
+        row_count = write_rows(cursor, csv_file_path, compress)
+    finally:
+        cursor.close()
+        conn.close()
+    return csv_file_path, row_count
+
+def export_table_incremental(db_file, table_name, output_dir, compress, previous):
+    """
+    Export one table against its state from the last run.
+    Append-mostly tables (WATERMARK_COLUMNS) only get rows above the recorded high-water mark
+    appended, as long as the rows at or below it are still all there.
+    Other tables are read once into a temporary file while they are hashed, and only replace their CSV
+    when the checksum changed.
+    Returns (csv path, rows written, action, new state).
+    """
+    conn = open_readonly(db_file)
+    cursor = conn.cursor()
+    cursor.arraysize = FETCH_SIZE
+    table = quote_identifier(table_name)
+    csv_file_path = csv_path_for(output_dir, table_name, compress)
+    try:
+        columns = table_columns(cursor, table_name)
+        column = WATERMARK_COLUMNS.get(table_name)
+        if column not in columns:
+            column = None
+        reusable = (previous is not None
+                    and previous.get("columns") == columns
+                    and previous.get("watermark_column") == column
+                    and os.path.isfile(csv_file_path))
+
+        if column is not None:
+            quoted = quote_identifier(column)
+            watermark = previous.get("watermark") if reusable else None
+            if reusable and watermark is None:
+                # table was empty last time, everything in it now is new
+                reusable = previous.get("rows") == 0
+            elif reusable:
+                cursor.execute(f"SELECT count(*) FROM {table} WHERE {quoted} <= ?", (watermark,))
+                reusable = cursor.fetchone()[0] == previous["rows"]
+            column_index = columns.index(column)
+            state = {"columns": columns, "watermark_column": column, "watermark": watermark, "rows": 0}
+
+            def track_watermark(rows):
+                top = max(row[column_index] for row in rows)
+                if state["watermark"] is None or top > state["watermark"]:
+                    state["watermark"] = top
+
+            if reusable:
+                if watermark is None:
+                    cursor.execute(f"SELECT * FROM {table} ORDER BY {quoted}")
+                else:
+                    cursor.execute(f"SELECT * FROM {table} WHERE {quoted} > ? ORDER BY {quoted}", (watermark,))
+                row_count = write_rows(cursor, csv_file_path, compress, append=True, on_rows=track_watermark)
+                state["rows"] = previous["rows"] + row_count
+                return csv_file_path, row_count, "appended" if row_count else "unchanged", state
+            cursor.execute(f"SELECT * FROM {table} ORDER BY {quoted}")
+            row_count = write_rows(cursor, csv_file_path, compress, on_rows=track_watermark)
+            state["rows"] = row_count
+            return csv_file_path, row_count, "exported", state
+
+        h = hashlib.blake2b(digest_size=16)
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(csv_file_path) + ".", suffix=".tmp", dir=output_dir)
+        os.close(fd)
+        try:
+            cursor.execute(f"SELECT * FROM {table}")
+            row_count = write_rows(cursor, tmp_path, compress, on_rows=lambda rows: h.update(repr(rows).encode("utf-8")))
+            state = {"columns": columns, "watermark_column": None, "checksum": h.hexdigest()}
+            if reusable and previous.get("checksum") == state["checksum"]:
+                return csv_file_path, 0, "unchanged", state
+            os.chmod(tmp_path, 0o644) # mkstemp creates 0600
+            os.replace(tmp_path, csv_file_path)
+            return csv_file_path, row_count, "exported", state
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        cursor.close()
+        conn.close()
+
+def load_export_state(state_path, compress):
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    # switching between plain and gzip output starts over
+    if state.get("version") != STATE_VERSION or state.get("gzip") != compress:
+        return {}
+    return state
+
+def save_export_state(state_path, compress, tables, source):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": STATE_VERSION, "gzip": compress, "source": source, "tables": tables}, f, indent=1)
+    os.replace(tmp_path, state_path)
+
+def export_sqlite_to_csv(db_file, output_dir, compress=False, jobs=None, incremental=False):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    conn = sqlite3.connect(db_file)
+    conn = open_readonly(db_file)
     cursor = conn.cursor()
 
     # Get all table names
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = cursor.fetchall()
+    tables = [row[0] for row in cursor.fetchall()]
 
-    for table_name_tuple in tables:
-        table_name = table_name_tuple[0]
-        
-        cursor.execute(f"SELECT * FROM {table_name}")
-        rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
 
-        # Get column names
-        column_names = [description[0] for description in cursor.description]
+    state_path = os.path.join(output_dir, STATE_FILE)
+    previous = load_export_state(state_path, compress) if incremental else {}
+    previous_state = previous.get("tables", {})
+    new_state = {}
 
-        csv_file_path = os.path.join(output_dir, f"{table_name}.csv")
-        with open(csv_file_path, "w", newline="", encoding="utf-8") as csv_file:
-            writer = csv.writer(csv_file)
-            writer.writerow(column_names)  # Write header
-            writer.writerows(rows)         # Write data rows
+    if incremental:
+        source = source_stamp(db_file)
+        unchanged = (previous.get("source") == source and set(previous_state) == set(tables)
+                     and all(os.path.isfile(csv_path_for(output_dir, table_name, compress)) for table_name in tables))
+        if unchanged:
+            # the database was not written since the last run: no table needs to be read
+            for table_name in tables:
+                print(f"Table '{table_name}' unchanged, kept {csv_path_for(output_dir, table_name, compress)}")
+            return
 
-        print(f"Exported table '{table_name}' to {csv_file_path}")
+    jobs = jobs or min(len(tables), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        if incremental:
+            futures = {pool.submit(export_table_incremental, db_file, table_name, output_dir, compress,
+                                   previous_state.get(table_name)): table_name
+                       for table_name in tables}
+        else:
+            futures = {pool.submit(export_table, db_file, table_name, output_dir, compress): table_name
+                       for table_name in tables}
+        for future in as_completed(futures):
+            table_name = futures[future]
+            if incremental:
+                csv_file_path, row_count, action, table_state = future.result()
+                new_state[table_name] = table_state
+                if action == "unchanged":
+                    print(f"Table '{table_name}' unchanged, kept {csv_file_path}")
+                elif action == "appended":
+                    print(f"Appended {row_count} new rows of table '{table_name}' to {csv_file_path}")
+                else:
+                    print(f"Exported table '{table_name}' ({row_count} rows) to {csv_file_path}")
+            else:
+                csv_file_path, row_count = future.result()
+                print(f"Exported table '{table_name}' ({row_count} rows) to {csv_file_path}")
 
-    cursor.close()
-    conn.close()
+    if incremental:
+        save_export_state(state_path, compress, new_state, source)
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python3 newpipedb-export-csv.py <sqlite-db-file> <output-csv-folder>")
+    parser = argparse.ArgumentParser(
+        usage="python3 newpipedb-export-csv.py [--gzip] [--jobs N] [--incremental] <sqlite-db-file> <output-csv-folder>")
+    parser.add_argument("db_file")
+    parser.add_argument("output_dir")
+    parser.add_argument("--gzip", action="store_true", help="write compressed .csv.gz files")
+    parser.add_argument("--jobs", type=int, default=None, help="number of tables exported at once (default: CPU count)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="append new rows and skip unchanged tables since the last run")
+    if len(sys.argv) < 3:
+        parser.print_usage()
         sys.exit(1)
+    args = parser.parse_args()
 
-    db_file = sys.argv[1]
-    output_dir = sys.argv[2]
-
-    export_sqlite_to_csv(db_file, output_dir)
+    export_sqlite_to_csv(args.db_file, args.output_dir, args.gzip, args.jobs, args.incremental)
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
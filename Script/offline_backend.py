@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# offline_backend.py
+#
+# Offline metadata source behind the "synthetic" extractor (see extractors.py).
+# Metadata is derived deterministically from a hash of the URL, so runs are reproducible and need no network.
+# Playlist URLs expand to a fixed, URL-dependent list of video URLs.
+# Channel handles and /c/ or /user/ URLs resolve to a fixed, URL-dependent channel ID.
+# Set OFFLINE_BACKEND_LATENCY_MS to simulate a per-request latency and OFFLINE_BACKEND_FAILURE_RATE (0 to 1)
+# to make that share of requests fail, like a flaky network would.
+#
+# Usage Example (run any script against it):
+# PLAYLIST_EXTRACTOR=synthetic python3 playlists-convert-freetube.py playlists.csv freetube-playlists.db
+
+import hashlib
+import os
+import random
+import time
+
+WORDS = ["night", "drive", "summer", "echo", "river", "golden", "neon", "ocean", "city", "dream",
+         "fire", "lights", "midnight", "rain", "shadow", "signal", "static", "velvet", "wild", "young"]
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+PLAYLIST_SIZE = 25 # videos a remote playlist expands to
+
+def url_digest(url):
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=16).digest()
+
+def video_id(url):
+    if "v=" in url:
+        return url.split("v=", 1)[1].split("&", 1)[0]
+    if "youtu.be/" in url:
+        return url.split("youtu.be/", 1)[1].split("?", 1)[0]
+    return "".join(ID_ALPHABET[b % 64] for b in url_digest(url)[:11])
+
+class SimulatedFailure(Exception):
+    pass
+
+def simulate_latency():
+    latency_ms = float(os.environ.get("OFFLINE_BACKEND_LATENCY_MS", "0"))
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000.0)
+    failure_rate = float(os.environ.get("OFFLINE_BACKEND_FAILURE_RATE", "0"))
+    if failure_rate > 0 and random.random() < failure_rate:
+        raise SimulatedFailure("simulated network error")
+
+def video_info(url):
+    digest = url_digest(url)
+    vid = video_id(url)
+    uploader = WORDS[digest[0] % len(WORDS)].title() + " " + WORDS[digest[1] % len(WORDS)].title()
+    channel_id = "UC" + "".join(ID_ALPHABET[b % 64] for b in digest[2:16]) + "AAAAAAAA"
+    return {
+        "id": vid,
+        "title": " ".join(WORDS[b % len(WORDS)] for b in digest[4:8]).capitalize(),
+        "duration": 60 + int.from_bytes(digest[8:10], "big") % 540,
+        "uploader": uploader,
+        "uploader_url": "https://www.youtube.com/channel/" + channel_id,
+        "channel_id": channel_id,
+        "thumbnail": f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+        "view_count": int.from_bytes(digest[10:13], "big"),
+        "timestamp": 1300000000 + int.from_bytes(digest[13:16], "big") * 20,
+        "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+    }
+
+def playlist_info(url):
+    digest = url_digest(url)
+    entries = []
+    for i in range(PLAYLIST_SIZE):
+        vid = "".join(ID_ALPHABET[b % 64] for b in url_digest(f"{url}#{i}")[:11])
+        entries.append({"id": vid, "url": f"https://www.youtube.com/watch?v={vid}"})
+    return {"id": digest.hex()[:34], "title": "Playlist " + digest.hex()[:6], "entries": entries}
+
+def channel_info(url):
+    """
+    Channel of a /channel/UC... URL keeps its id, handles and /c/ or /user/ names get one derived from the URL.
+    """
+    path = url.split("://", 1)[-1].split("?", 1)[0].rstrip("/")
+    if "/channel/UC" in path:
+        channel_id = path.split("/channel/", 1)[1].split("/", 1)[0]
+    else:
+        digest = url_digest(path.lower()) + url_digest(path.lower() + "#")
+        channel_id = "UC" + "".join(ID_ALPHABET[b % 64] for b in digest[:22])
+    digest = url_digest(channel_id)
+    return {
+        "id": channel_id,
+        "name": WORDS[digest[0] % len(WORDS)].title() + " " + WORDS[digest[1] % len(WORDS)].title(),
+        "url": "https://www.youtube.com/channel/" + channel_id,
+        "thumbnail": f"https://yt3.ggpht.com/{channel_id}=s88",
+    }
+
+def audio_bytes(url):
+    """
+    Placeholder audio file content for a video URL.
+    """
+    return url_digest(url) * 64
@@ -15,13 +15,16 @@ import json
 import csv
 import sys
 
+import profiling
+
 def piped_json_to_csv(json_path, csv_path):
-    with open(json_path, "r", encoding="utf-8") as f:
+    with profiling.span("read json") as s, open(json_path, "r", encoding="utf-8") as f:
         data = json.load(f)
+        s.add_bytes(f.tell())
 
     playlists = data.get("playlists", [])
 
-    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+    with profiling.span("write csv"), open(csv_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         # No header row, match your preferred CSV style
         for pl in playlists:
@@ -39,4 +42,5 @@ def main():
     print(f"Converted {in_json} to {out_csv}.")
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
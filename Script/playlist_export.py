@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+# playlist_export.py
+#
+# Export engine shared by main.py and newpipe-convert-playlists.py.
+# Walks the playlists of a PlaylistStore (see playlist_store.py) once and renders every requested
+# format into in-memory buffers. Per-playlist files and JSON keys use the playlist label, which is
+# unique even when several playlists share a name.
+# Per-playlist M3U8 files are written in parallel on a thread pool. Labels that map to the same file name
+# (e.g. "a/b" and "a:b" both become a_b.m3u8) get " (2)", " (3)", ... so no two writes share a file.
+# A file is only rewritten when the hash of its new content differs from the file on disk.
+# With playlist fingerprints (playlists.uid + ordered playlist_stream_join stream IDs) and a
+# state file, only added, changed or removed playlists are rendered and written.
+# An export without fingerprints (e.g. a filtered selection) drops the state of the formats it writes,
+# so the next export with fingerprints writes them in full again.
+#
+# Formats: csv, txt, m3u8, md, json
+
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+
+EXPORT_FORMATS = ("csv", "txt", "m3u8", "md", "json")
+
+AGGREGATE_FILES = {
+    "csv": "playlists.csv",
+    "txt": "playlists.txt",
+    "md": "playlists.md",
+    "json": "playlists.json",
+}
+
+M3U8_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+STATE_FILE = ".export-state.json"
+STATE_VERSION = 1
+
+def m3u8_filename(playlist):
+    return re.sub('[*"/\\<>:|?]', '_', playlist) + '.m3u8'
+
+def m3u8_filenames(labels):
+    """
+    label -> M3U8 file name, unique: the first label keeps its plain file name, later ones that sanitize
+    to a taken name get " (2)", " (3)", ...
+    """
+    files = {}
+    taken = set()
+    clashes = []
+    for label in labels:
+        filename = m3u8_filename(label)
+        if filename in taken:
+            clashes.append(label)
+        else:
+            files[label] = filename
+            taken.add(filename)
+    for label in clashes:
+        n = 2
+        while m3u8_filename(f"{label} ({n})") in taken:
+            n += 1
+        files[label] = m3u8_filename(f"{label} ({n})")
+        taken.add(files[label])
+    return files
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def file_hash(path):
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+def write_if_changed(path, data):
+    """
+    Write bytes to path unless the file already holds exactly these bytes.
+    Returns True when the file was (re)written.
+    """
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        if file_hash(path) == content_hash(data):
+            return False
+    # a private temporary file per write, M3U8 files are written from several threads
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    with profiling.span("write file") as s:
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644) # mkstemp creates 0600
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        s.add_bytes(len(data))
+    return True
+
+def encode_text(text_data, translate_newlines=True):
+    # match what open(path, 'w') would write on this platform
+    if translate_newlines and os.linesep != "\n":
+        text_data = text_data.replace("\n", os.linesep)
+    return text_data.encode('utf-8')
+
+@profiling.profiled("fingerprints")
+def playlist_fingerprints(conn):
+    """
+    Fingerprint every playlist of an open newpipe.db connection.
+    Returns {key: {"name": name, "fingerprint": hex}} where key is "local:<uid>" or "remote:<uid>".
+    Only playlist_stream_join is read, the streams table is not touched.
+    """
+    cur = conn.cursor()
+    cur.row_factory = None
+    fingerprints = {}
+
+    # ordered subquery keeps group_concat in join_index order
+    cur.execute("""
+        SELECT playlist_id, group_concat(stream_id) FROM (
+            SELECT playlist_id, stream_id FROM playlist_stream_join
+            ORDER BY playlist_id, join_index
+        ) GROUP BY playlist_id
+    """)
+    stream_ids = dict(cur.fetchall())
+
+    cur.execute("SELECT uid, name FROM playlists")
+    for uid, name in cur.fetchall():
+        data = f"{uid}:{stream_ids.get(uid) or ''}".encode()
+        fingerprints[f"local:{uid}"] = {"name": name, "fingerprint": hashlib.blake2b(data, digest_size=16).hexdigest()}
+
+    cur.execute("SELECT uid, name, url FROM remote_playlists")
+    for uid, name, url in cur.fetchall():
+        data = f"{uid}:{url}".encode()
+        fingerprints[f"remote:{uid}"] = {"name": name, "fingerprint": hashlib.blake2b(data, digest_size=16).hexdigest()}
+
+    cur.close()
+    return fingerprints
+
+def diff_fingerprints(old, new):
+    """
+    Compare two fingerprint maps.
+    Returns {"added": [...], "changed": [...], "removed": [...], "unchanged": [...]} of keys.
+    A renamed playlist counts as changed.
+    """
+    delta = {"added": [], "changed": [], "removed": [], "unchanged": []}
+    for key, entry in new.items():
+        previous = old.get(key)
+        if previous is None:
+            delta["added"].append(key)
+        elif previous != entry:
+            delta["changed"].append(key)
+        else:
+            delta["unchanged"].append(key)
+    delta["removed"] = [key for key in old if key not in new]
+    return delta
+
+def delta_summary(delta):
+    return "{0} added, {1} changed, {2} removed, {3} unchanged".format(
+        len(delta["added"]), len(delta["changed"]), len(delta["removed"]), len(delta["unchanged"]))
+
+def load_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if state.get("version") != STATE_VERSION:
+        return {}
+    return state
+
+def forget_formats(path, formats):
+    """
+    Drop the state of formats whose files are overwritten by an export the state does not describe.
+    """
+    state = load_state(path)
+    recorded = state.get("formats", {})
+    if not any(fmt in recorded for fmt in formats):
+        return
+    for fmt in formats:
+        recorded.pop(fmt, None)
+    save_state(path, state)
+
+def save_state(path, state):
+    state["version"] = STATE_VERSION
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+@profiling.profiled("render")
+def render_playlists(store, formats, m3u8_keys=None):
+    """
+    Render all requested formats in a single traversal of the store.
+    Returns (aggregate, m3u8) where aggregate maps format -> text
+    and m3u8 maps playlist label -> text.
+    If m3u8_keys is given only those playlists are rendered as M3U8.
+    """
+    buffers = {fmt: io.StringIO() for fmt in formats if fmt in AGGREGATE_FILES and fmt != "json"}
+    writerCSV = csv.writer(buffers["csv"]) if "csv" in buffers else None
+    writerTXT = buffers.get("txt")
+    writerMD = buffers.get("md")
+    m3u8 = {} if "m3u8" in formats else None
+
+    aggregate_text = writerCSV is not None or writerTXT is not None or writerMD is not None
+
+    for playlist in store:
+        in_m3u8 = m3u8 is not None and (m3u8_keys is None or playlist.key in m3u8_keys)
+        if not (aggregate_text or in_m3u8):
+            continue
+        name = playlist.name
+        urls = store.urls_of(playlist)
+        if writerCSV is not None:
+            writerCSV.writerow([name, str(urls)])
+        if writerTXT is not None:
+            writerTXT.write("=========================\n")
+            writerTXT.write(name + "\n")
+            writerTXT.write("=========================\n")
+            writerTXT.write("".join(url + "\n" for url in urls))
+        if writerMD is not None:
+            writerMD.write(name + "\n")
+            writerMD.write("=========================\n\n")
+            writerMD.write("".join(f"* [{url}]({url})\n" for url in urls))
+            writerMD.write("\n")
+        if in_m3u8:
+            m3u8[playlist.label] = "#EXTM3U\n#PLAYLIST:" + playlist.label + "\n" + "".join(url + "\n" for url in urls)
+
+    aggregate = {fmt: buf.getvalue() for fmt, buf in buffers.items()}
+    if "json" in formats:
+        aggregate["json"] = json.dumps(store.to_dict(), ensure_ascii=False, indent=4)
+    return aggregate, m3u8
+
+@profiling.profiled("export")
+def export_playlists(store, formats, output_dir="./Playlists", fingerprints=None):
+    """
+    Export the playlists of a PlaylistStore into output_dir in every format listed in formats.
+    When fingerprints (see playlist_fingerprints) are given, a state file in output_dir
+    records what every format was last exported from, and unchanged playlists are skipped.
+    Returns a dict format -> {"written", "unchanged", "removed", "delta"}.
+    """
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown:
+        raise ValueError("Unknown export format: " + ", ".join(unknown))
+
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = os.path.join(output_dir, STATE_FILE)
+    if fingerprints is None:
+        # dropped before anything is written, so an interrupted export is not taken as up to date either
+        forget_formats(state_path, formats)
+    state = load_state(state_path) if fingerprints is not None else {}
+    previous = state.get("formats", {})
+    stats = {}
+
+    m3u8_files = m3u8_filenames([playlist.label for playlist in store]) if "m3u8" in formats else {}
+
+    def m3u8_file(label):
+        return m3u8_files.get(label) or m3u8_filename(label)
+
+    deltas = {}
+    exported = {}
+    if fingerprints is not None:
+        # the state records labels, and for M3U8 the file every playlist was written to
+        fingerprints = {key: {"name": store.get(key).label if store.get(key) else value["name"],
+                              "fingerprint": value["fingerprint"]}
+                        for key, value in fingerprints.items()}
+        for fmt in formats:
+            if fmt == "m3u8":
+                exported[fmt] = {key: dict(value, file=m3u8_file(value["name"])) for key, value in fingerprints.items()}
+            else:
+                exported[fmt] = fingerprints
+            deltas[fmt] = diff_fingerprints(previous.get(fmt, {}), exported[fmt])
+
+    def up_to_date(fmt):
+        delta = deltas.get(fmt)
+        return delta is not None and not (delta["added"] or delta["changed"] or delta["removed"])
+
+    # size of every aggregate file when the state was saved: a file overwritten since then is rendered again
+    sizes = state.get("sizes", {})
+
+    def file_intact(fmt):
+        try:
+            return os.path.getsize(os.path.join(output_dir, AGGREGATE_FILES[fmt])) == sizes.get(fmt)
+        except OSError:
+            return False
+
+    render_formats = []
+    for fmt in formats:
+        if fmt in AGGREGATE_FILES and up_to_date(fmt) and file_intact(fmt):
+            stats[fmt] = {"written": 0, "unchanged": 1, "removed": 0, "delta": deltas[fmt]}
+        else:
+            render_formats.append(fmt)
+
+    m3u8_keys = None
+    stale_m3u8 = []
+    if "m3u8" in deltas:
+        delta = deltas["m3u8"]
+        m3u8_keys = set(delta["added"] + delta["changed"])
+        # files deleted by hand since the last run are written again
+        for key in delta["unchanged"]:
+            if not os.path.isfile(os.path.join(output_dir, exported["m3u8"][key]["file"])):
+                m3u8_keys.add(key)
+        current = set(m3u8_files.values())
+        old = previous.get("m3u8", {})
+        for key in delta["removed"] + delta["changed"]:
+            # states written before file names were recorded hold only the label
+            filename = old[key].get("file") or m3u8_filename(old[key]["name"])
+            if filename not in current:
+                stale_m3u8.append(filename)
+
+    aggregate, m3u8 = render_playlists(store, render_formats, m3u8_keys)
+
+    for fmt, text_data in aggregate.items():
+        path = os.path.join(output_dir, AGGREGATE_FILES[fmt])
+        # csv.writer already emits \r\n line endings, like open(..., newline='')
+        data = encode_text(text_data, translate_newlines=(fmt != "csv"))
+        written = write_if_changed(path, data)
+        sizes[fmt] = len(data)
+        stats[fmt] = {"written": int(written), "unchanged": int(not written), "removed": 0, "delta": deltas.get(fmt)}
+
+    if m3u8 is not None:
+        def write_m3u8(item):
+            playlist, text_data = item
+            path = os.path.join(output_dir, m3u8_files[playlist])
+            return write_if_changed(path, encode_text(text_data))
+
+        with ThreadPoolExecutor(max_workers=M3U8_WORKERS) as pool:
+            results = list(pool.map(write_m3u8, m3u8.items()))
+        removed = 0
+        for filename in set(stale_m3u8):
+            try:
+                os.remove(os.path.join(output_dir, filename))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        written = sum(results)
+        stats["m3u8"] = {"written": written, "unchanged": len(store) - written, "removed": removed,
+                         "delta": deltas.get("m3u8")}
+
+    if fingerprints is not None:
+        for fmt in formats:
+            previous[fmt] = exported[fmt]
+        state["formats"] = previous
+        state["sizes"] = sizes
+        save_state(state_path, state)
+
+    return stats
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+# playlist_filter.py
+#
+# Selection of playlists and tracks from a newpipe.db, shared by main.py and newpipe-convert-playlists.py.
+# Criteria are compiled into SQL over playlists/playlist_stream_join/streams, so only matching rows ever
+# leave SQLite: the selected streams (each URL once), the playlists' stream IDs and the remote playlists.
+# Without criteria the result holds exactly what the per-playlist queries did.
+#
+# Criteria (all optional, combined with AND):
+#   name           list of playlist name patterns, * and ? wildcards, case-insensitive, any may match
+#   min_duration   minimum streams.duration in seconds
+#   max_duration   maximum streams.duration in seconds
+#   uploader       text contained in streams.uploader, case-insensitive
+#   uploaded_after / uploaded_before   YYYY-MM-DD bounds on streams.upload_date
+#   stream_type    streams.stream_type, e.g. VIDEO_STREAM or AUDIO_STREAM
+#   not_watched    only streams without stream_history entry or saved stream_state progress
+#
+# Remote playlists have no tracks in the database, they are only selected when no track criteria are set.
+
+import argparse
+from datetime import datetime, timezone
+
+import profiling
+from playlist_store import PlaylistStore
+
+def date_to_ms(value):
+    day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return int(day.timestamp() * 1000)
+
+def date_argument(value):
+    try:
+        date_to_ms(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+    return value
+
+def like_pattern(pattern):
+    escaped = pattern.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped.replace("*", "%").replace("?", "_")
+
+def build_selection_queries(criteria):
+    """
+    Compile criteria into {"streams", "local", "remote"} (sql, params) pairs:
+    streams  (uid, url, duration) of every selected track, each stream once
+    local    (playlist uid, name, stream_id) of the playlists selected by name, by uid and join_index;
+             stream_id is NULL for an empty playlist, tracks not in streams are left out by the caller
+    remote   (uid, name, url) by uid, None when track criteria rule out remote playlists
+    "drop_empty" tells the caller to leave out playlists without a selected track.
+    """
+    criteria = criteria or {}
+    name_conditions = []
+    name_params = []
+    for pattern in criteria.get("name") or []:
+        name_conditions.append("{alias}.name LIKE ? ESCAPE '\\'")
+        name_params.append(like_pattern(pattern))
+    name_clause = "(" + " OR ".join(name_conditions) + ")" if name_conditions else None
+
+    track_conditions = []
+    track_params = []
+    if criteria.get("min_duration") is not None:
+        track_conditions.append("s.duration >= ?")
+        track_params.append(int(criteria["min_duration"]))
+    if criteria.get("max_duration") is not None:
+        track_conditions.append("s.duration <= ?")
+        track_params.append(int(criteria["max_duration"]))
+    if criteria.get("uploader"):
+        track_conditions.append("s.uploader LIKE ? ESCAPE '\\'")
+        track_params.append("%" + like_pattern(criteria["uploader"]) + "%")
+    if criteria.get("uploaded_after"):
+        track_conditions.append("s.upload_date >= ?")
+        track_params.append(date_to_ms(criteria["uploaded_after"]))
+    if criteria.get("uploaded_before"):
+        track_conditions.append("s.upload_date < ?")
+        track_params.append(date_to_ms(criteria["uploaded_before"]) + 24 * 3600 * 1000)
+    if criteria.get("stream_type"):
+        track_conditions.append("s.stream_type = ?")
+        track_params.append(criteria["stream_type"])
+    if criteria.get("not_watched"):
+        track_conditions.append("NOT EXISTS (SELECT 1 FROM stream_history h WHERE h.stream_id = s.uid)")
+        track_conditions.append("NOT EXISTS (SELECT 1 FROM stream_state st WHERE st.stream_id = s.uid AND st.progress_time > 0)")
+
+    local_params = name_params if name_clause else []
+
+    # every stream of a selected playlist that passes the track criteria, once, in uid order
+    streams_sql = """
+            SELECT s.uid, s.url, s.duration
+            FROM streams s
+            WHERE s.uid IN (
+                SELECT psj.stream_id FROM playlist_stream_join psj
+                JOIN playlists p ON p.uid = psj.playlist_id"""
+    if name_clause:
+        streams_sql += "\n                WHERE " + name_clause.format(alias="p")
+    streams_sql += ")"
+    streams_params = list(local_params)
+    if track_conditions:
+        streams_sql += "\n            AND " + " AND ".join(track_conditions)
+        streams_params += track_params
+    streams_sql += "\n            ORDER BY s.uid"
+
+    # streams is not joined: stream IDs are resolved against the streams query, which
+    # already applied the track criteria, so this stays a scan in index order
+    local_sql = """
+            SELECT p.uid, p.name, psj.stream_id
+            FROM playlists p
+            LEFT JOIN playlist_stream_join psj ON psj.playlist_id = p.uid"""
+    if name_clause:
+        local_sql += "\n            WHERE " + name_clause.format(alias="p")
+    local_sql += "\n            ORDER BY p.uid, psj.join_index"
+
+    remote = None
+    if not track_conditions:
+        remote_sql = """
+            SELECT r.uid, r.name, r.url
+            FROM remote_playlists r"""
+        remote_params = []
+        if name_clause:
+            remote_sql += "\n            WHERE " + name_clause.format(alias="r")
+            remote_params = list(name_params)
+        remote_sql += "\n            ORDER BY r.uid"
+        remote = (remote_sql, remote_params)
+
+    return {
+        "streams": (streams_sql, streams_params),
+        "local": (local_sql, local_params),
+        "remote": remote,
+        # with track criteria only playlists with a matching track are selected
+        "drop_empty": bool(track_conditions),
+    }
+
+@profiling.profiled("query playlists")
+def select_playlists(conn, criteria=None):
+    """
+    Run the selection on an open newpipe.db connection.
+    Returns a PlaylistStore (see playlist_store.py); playlists sharing a name are all kept.
+    """
+    queries = build_selection_queries(criteria)
+    store = PlaylistStore()
+    table = store.urls
+    cur = conn.cursor()
+    cur.row_factory = None
+
+    durations = store.durations
+    for stream_id, url, duration in cur.execute(*queries["streams"]):
+        if table.add(url, stream_id) == len(durations):
+            durations.append(duration or 0)
+
+    current = None
+    append = None
+    find = table.find
+    for uid, name, stream_id in cur.execute(*queries["local"]):
+        if uid != current:
+            current = uid
+            append = store.add_playlist("local", uid, name).items.append
+        if stream_id is not None:
+            index = find(stream_id)
+            # tracks not selected (or join rows without stream) are skipped
+            if index >= 0:
+                append(index)
+
+    if queries["drop_empty"]:
+        for key in [key for key, playlist in store.playlists.items() if not playlist.items]:
+            del store.playlists[key]
+
+    if queries["remote"] is not None:
+        for uid, name, url in cur.execute(*queries["remote"]):
+            store.add_track(store.add_playlist("remote", uid, name), url)
+
+    cur.close()
+    return store.finish()
+
+def add_filter_arguments(parser):
+    group = parser.add_argument_group("selection")
+    group.add_argument("--name", action="append", help="playlist name pattern, * and ? wildcards (repeatable)")
+    group.add_argument("--min-duration", type=int, help="minimum track length in seconds")
+    group.add_argument("--max-duration", type=int, help="maximum track length in seconds")
+    group.add_argument("--uploader", help="text contained in the track uploader")
+    group.add_argument("--uploaded-after", type=date_argument, help="tracks uploaded on or after YYYY-MM-DD")
+    group.add_argument("--uploaded-before", type=date_argument, help="tracks uploaded on or before YYYY-MM-DD")
+    group.add_argument("--stream-type", help="VIDEO_STREAM, AUDIO_STREAM, LIVE_STREAM, ...")
+    group.add_argument("--not-watched", action="store_true", help="only tracks that were never played")
+
+def criteria_from_args(args):
+    criteria = {
+        "name": args.name,
+        "min_duration": args.min_duration,
+        "max_duration": args.max_duration,
+        "uploader": args.uploader,
+        "uploaded_after": args.uploaded_after,
+        "uploaded_before": args.uploaded_before,
+        "stream_type": args.stream_type,
+        "not_watched": args.not_watched,
+    }
+    return {key: value for key, value in criteria.items() if value not in (None, False, [])}
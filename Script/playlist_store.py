@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+# playlist_store.py
+#
+# Compact in-memory playlist model used by main.py, playlist_export.py and newpipe-convert-playlists.py.
+# Every distinct URL is stored once in a UrlTable: a shared prefix (e.g. "https://www.youtube.com/watch?v=")
+# plus the UTF-8 suffix in one bytearray, about 16 bytes for a YouTube URL instead of a ~100 byte str.
+# A playlist is a __slots__ record holding its tracks as an array('i') of URL table indices.
+# Playlists are keyed like playlist fingerprints, "local:<uid>" / "remote:<uid>", so playlists
+# sharing a name are all kept. Their label (used for file and folder names) gets " (2)", " (3)", ...
+# durations holds streams.duration in seconds by URL index where the selection read it (0 when unknown).
+# benchmark-playlist-store.py compares its memory with a dict of name -> list of URL strings.
+
+from array import array
+
+MAX_PREFIXES = 4096 # above this many distinct prefixes, URLs are stored whole
+DENSE_KEYS = 1 << 24 # integer keys below this are looked up in an array instead of a dict
+
+def split_url(url):
+    """
+    Split after the last '/' or '=', e.g. "https://youtu.be/" + "dQw4w9WgXcQ".
+    """
+    cut = max(url.rfind("/"), url.rfind("=")) + 1
+    return url[:cut], url[cut:]
+
+class UrlTable:
+    __slots__ = ("prefixes", "prefix_ids", "prefix_of", "blob", "offsets", "lookup", "by_id")
+
+    def __init__(self):
+        self.prefixes = [""]
+        self.prefix_ids = {"": 0}
+        self.prefix_of = array("H")
+        self.blob = bytearray()
+        self.offsets = array("I", [0])
+        self.lookup = {}
+        self.by_id = array("i")
+
+    def __len__(self):
+        return len(self.prefix_of)
+
+    def __getitem__(self, index):
+        # str() rather than .decode() also reads the memoryviews of a loaded snapshot (see snapshot_cache.py)
+        return self.prefixes[self.prefix_of[index]] + str(self.blob[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def add(self, url, key=None):
+        """
+        Index of url, added when new. key (default url) identifies the URL while building,
+        e.g. the streams.uid it came from, so lookups do not need the URL string.
+        """
+        dense = type(key) is int and 0 <= key < DENSE_KEYS
+        if dense:
+            if key >= len(self.by_id):
+                # grow geometrically, -1 marks keys not seen yet
+                self.by_id.extend(array("i", [-1]) * (max(key + 1, 2 * len(self.by_id)) - len(self.by_id)))
+            index = self.by_id[key]
+            if index >= 0:
+                return index
+        else:
+            key = url if key is None else key
+            index = self.lookup.get(key)
+            if index is not None:
+                return index
+        prefix, suffix = split_url(url)
+        prefix_id = self.prefix_ids.get(prefix)
+        if prefix_id is None:
+            if len(self.prefixes) < MAX_PREFIXES:
+                prefix_id = self.prefix_ids[prefix] = len(self.prefixes)
+                self.prefixes.append(prefix)
+            else:
+                prefix_id, suffix = 0, url
+        index = len(self.prefix_of)
+        self.prefix_of.append(prefix_id)
+        self.blob += suffix.encode("utf-8")
+        self.offsets.append(len(self.blob))
+        if dense:
+            self.by_id[key] = index
+        else:
+            self.lookup[key] = index
+        return index
+
+    def find(self, key):
+        """
+        Index of a key given to add(), -1 when unknown.
+        """
+        if type(key) is int and 0 <= key < DENSE_KEYS:
+            return self.by_id[key] if key < len(self.by_id) else -1
+        return self.lookup.get(key, -1)
+
+    def freeze(self):
+        """
+        Drop the build-time lookup tables, no URLs can be added afterwards.
+        """
+        self.lookup = None
+        self.by_id = None
+        self.prefix_ids = None
+
+class Playlist:
+    __slots__ = ("kind", "uid", "name", "label", "items")
+
+    def __init__(self, kind, uid, name):
+        self.kind = kind
+        self.uid = uid
+        self.name = name
+        self.label = name
+        self.items = array("i")
+
+    @property
+    def key(self):
+        return f"{self.kind}:{self.uid}"
+
+    def __len__(self):
+        return len(self.items)
+
+class PlaylistStore:
+    __slots__ = ("urls", "playlists", "durations")
+
+    def __init__(self):
+        self.urls = UrlTable()
+        self.playlists = {} # key -> Playlist, in insertion order
+        self.durations = array("i")
+
+    def __len__(self):
+        return len(self.playlists)
+
+    def __iter__(self):
+        return iter(self.playlists.values())
+
+    def get(self, key):
+        return self.playlists.get(key)
+
+    def add_playlist(self, kind, uid, name):
+        playlist = Playlist(kind, uid, name)
+        self.playlists[playlist.key] = playlist
+        return playlist
+
+    def add_track(self, playlist, url, key=None):
+        playlist.items.append(self.urls.add(url, key))
+
+    def urls_of(self, playlist):
+        table = self.urls
+        return [table[i] for i in playlist.items]
+
+    def duration_of(self, index):
+        """
+        Duration in seconds of the URL at index, 0 when unknown.
+        """
+        return self.durations[index] if index < len(self.durations) else 0
+
+    def finish(self):
+        """
+        Give duplicate names unique labels and freeze the URL table; call once after building.
+        """
+        names = {playlist.name for playlist in self.playlists.values()}
+        counts = {}
+        used = set()
+        for playlist in self.playlists.values():
+            label = playlist.name
+            if label in used:
+                n = counts.get(playlist.name, 1)
+                while label in used or label in names:
+                    n += 1
+                    label = f"{playlist.name} ({n})"
+                counts[playlist.name] = n
+            used.add(label)
+            playlist.label = label
+        self.urls.freeze()
+        return self
+
+    def to_dict(self):
+        """
+        label -> list of URLs, the shape of the JSON export.
+        """
+        return {playlist.label: self.urls_of(playlist) for playlist in self.playlists.values()}
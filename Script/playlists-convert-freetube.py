@@ -3,24 +3,38 @@
 # playlists-convert-freetube.py
 #
 # Detects if a playlist row contains a single remote playlist URL.
-# Expands that URL using yt_dlp to retrieve all video URLs.
+# Expands that URL through the configured extractor (yt-dlp by default) to retrieve all video URLs.
 # Converts remote playlist fully into a local playlist with all videos included.
 # Finally writes out FreeTube-compatible playlists in freetube-playlists.db.
+# A video whose lookup fails or is slow is written with placeholder metadata and retried in the background
+# (see retry_queue.py); resolved videos are patched into the file at the end, the rest is listed and kept in
+# <output>.retry.json for playlists-retry-failed.py. Only URLs without a YouTube video id are left out.
+# Finished playlists and resolved lookups are journaled in <output>.journal (see checkpoint.py): after a crash or
+# Ctrl-C the same command continues with the first unfinished playlist and writes the same file.
+# Every playlist line is written while its videos are looked up (see stream_io.py), so memory does not grow
+# with the size of the playlists.
 #
 # Usage Example:
 # python3 playlists-convert-freetube.py playlists.csv freetube-playlists.db
 #
 # - The first argument is the input playlists CSV file.
 # - The second argument is the output freetube database file.
+# - Set PLAYLIST_EXTRACTOR to use another metadata backend (see extractors.py).
 
-import ast
 import csv
+import itertools
 import json
+import os
 import sys
 import uuid
 import time
 import re
-from yt_dlp import YoutubeDL
+import profiling
+import stream_io
+from checkpoint import Journal
+from retry_queue import RetryQueue
+
+VIDEO_ID_RE = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([\w-]{11})')
 
 def generate_random_uuid():
     return str(uuid.uuid4())
@@ -28,28 +42,35 @@ def generate_random_uuid():
 def get_current_timestamp_ms():
     return int(time.time() * 1000)
 
-def process_video(url):
-    opts = {
-        'quiet': True,
-        'no_warnings': True
+def youtube_video_id(url):
+    match = VIDEO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+def video_fields(info):
+    return {
+        "videoId": info.get("id"),
+        "title": info.get("title"),
+        "author": info.get("uploader"),
+        "authorId": info.get("channel_id"),
+        "lengthSeconds": info.get("duration"),
+        "published": int(info.get("timestamp", 0)) * 1000 if info.get("timestamp") else None
     }
-    with YoutubeDL(opts) as ydl:
+
+def process_video(url, queue):
+    video_id = youtube_video_id(url)
+    if video_id is None:
+        # nothing to put a placeholder under, look it up once
         try:
-            info = ydl.extract_info(url, download=False)
+            info = queue.fetch(url)
         except Exception as e:
             print(f"Failed to extract info for {url}: {e}")
             return None
-        return {
-            "videoId": info.get("id"),
-            "title": info.get("title"),
-            "author": info.get("uploader"),
-            "authorId": info.get("channel_id"),
-            "lengthSeconds": info.get("duration"),
-            "published": int(info.get("timestamp", 0)) * 1000 if info.get("timestamp") else None,
-            "timeAdded": get_current_timestamp_ms(),
-            "playlistItemId": generate_random_uuid(),
-            "type": "video"
-        }
+    else:
+        info = queue.lookup(url, video_id=video_id)
+        if info is None:
+            info = {"id": video_id, "title": "Unknown Title", "uploader": "Unknown Uploader", "duration": 0}
+    return dict(video_fields(info), timeAdded=get_current_timestamp_ms(),
+                playlistItemId=generate_random_uuid(), type="video")
 
 def is_remote_playlist(url):
     patterns = [
@@ -60,94 +81,139 @@ def is_remote_playlist(url):
     pattern = re.compile('|'.join(patterns), re.IGNORECASE)
     return bool(pattern.search(url))
 
-def expand_remote_playlist(url):
-    opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'skip_download': True,
-        'extract_flat': True,  # get all entries without downloading
-    }
-    with YoutubeDL(opts) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-            entries = info.get('entries', [])
-            video_urls = []
-            for entry in entries:
-                video_url = entry.get('url') or entry.get('webpage_url')
-                if video_url:
-                    video_urls.append(video_url)
-            return video_urls
-        except Exception as e:
-            print(f"Failed to extract playlist videos from {url}: {e}")
-            return []
-
-def process_playlist(playlist_name, urls):
+def expand_remote_playlist(url, journal):
+    try:
+        return journal.expand_playlist(url)
+    except Exception as e:
+        print(f"Failed to extract playlist videos from {url}: {e}")
+        return []
+
+def process_playlist(playlist_name, urls, queue):
+    """
+    The playlist record, its videos a generator that looks them up while stream_io.dump writes them.
+    """
     current_ts = get_current_timestamp_ms()
     _id = "ft-playlist--" + generate_random_uuid()
+    last_updated = [current_ts]
 
-    videos = []
-    for url in urls:
-        url = url.strip()
-        if url:
-            video = process_video(url)
-            if video:
-                videos.append(video)
-
-    last_updated = max((v["timeAdded"] for v in videos), default=current_ts)
+    def videos():
+        for url in urls:
+            url = url.strip()
+            if url:
+                video = process_video(url, queue)
+                if video:
+                    last_updated[0] = max(last_updated[0], video["timeAdded"])
+                    yield video
 
     return {
         "playlistName": playlist_name,
         "protected": False,
         "description": "",
-        "videos": videos,
+        "videos": videos(),
         "_id": _id,
         "createdAt": current_ts,
-        "lastUpdatedAt": last_updated
+        "lastUpdatedAt": lambda: last_updated[0]
     }
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 playlists-convert-freetube.py playlists.csv freetube-playlists.db")
-        sys.exit(1)
-
-    playlists_csv = sys.argv[1]
-    freetube_db = sys.argv[2]
-
-    with open(freetube_db, 'w', encoding='utf-8') as db:
-        ts = get_current_timestamp_ms()
-        favorites = {
-            "playlistName": "Favorites",
-            "protected": False,
-            "description": "Your favorite videos",
-            "videos": [],
-            "_id": "favorites",
-            "createdAt": ts,
-            "lastUpdatedAt": ts
-        }
-        db.write(json.dumps(favorites, separators=(',', ':')) + '\n')
+def peek_single(urls):
+    """
+    (urls, the only URL) when urls holds exactly one URL, else (urls, None); urls stays complete.
+    """
+    urls = iter(urls)
+    head = list(itertools.islice(urls, 2))
+    return itertools.chain(head, urls), head[0] if len(head) == 1 else None
+
+@profiling.profiled("patch videos")
+def patch_freetube_db(freetube_db, resolved):
+    """
+    Replace the placeholder metadata of the videos whose lookup a retry resolved, returns the videos updated.
+    """
+    by_id = {item["details"]["video_id"]: video_fields(item["info"]) for item in resolved.values()}
+    updated = 0
+    tmp_path = freetube_db + ".tmp"
+    with open(freetube_db, "r", encoding="utf-8") as src, open(tmp_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            playlist = json.loads(line)
+            changed = False
+            for video in playlist["videos"]:
+                fields = by_id.get(video.get("videoId"))
+                if fields is not None:
+                    video.update(fields)
+                    changed = True
+                    updated += 1
+            dst.write(json.dumps(playlist, separators=(',', ':')) + '\n' if changed else line)
+    os.replace(tmp_path, freetube_db)
+    return updated
+
+def csv_to_freetube(playlists_csv, freetube_db):
+    stream_io.raise_csv_field_limit()
+    journal = Journal(freetube_db, "freetube", [playlists_csv])
+    queue = RetryQueue(freetube_db, "freetube", fetch=journal.video_metadata)
+    if journal.resumed:
+        # placeholders in finished playlists of the interrupted run are still waiting for their retry
+        queue.restore()
+        queue.resume()
+    # the playlists finished before an interruption stay in the file, the next one is appended
+    end, last_done = journal.resume_output(freetube_db)
+    with open(freetube_db, 'a' if last_done is not None else 'w', encoding='utf-8') as db:
+        if last_done is None:
+            ts = get_current_timestamp_ms()
+            favorites = {
+                "playlistName": "Favorites",
+                "protected": False,
+                "description": "Your favorite videos",
+                "videos": [],
+                "_id": "favorites",
+                "createdAt": ts,
+                "lastUpdatedAt": ts
+            }
+            db.write(json.dumps(favorites, separators=(',', ':')) + '\n')
+            db.flush()
+            journal.record_done(-1, db.tell())
 
         with open(playlists_csv, newline='', encoding='utf-8') as csvfile:
             reader = csv.reader(csvfile)
-            for row in reader:
+            for index, row in enumerate(reader):
                 if not row or not row[0].strip():
                     continue
+                if last_done is not None and index <= last_done:
+                    continue
                 playlist_name = row[0].strip().strip('"')
                 urls = []
                 if len(row) > 1 and row[1].strip():
                     try:
-                        urls = ast.literal_eval(row[1].strip())
+                        urls = stream_io.iter_url_list(row[1])
                     except Exception as e:
                         print(f"Error parsing URLs for playlist {playlist_name}: {e}")
                         urls = []
 
                 # Convert remote playlists into local playlists by expanding URLs
-                if len(urls) == 1 and is_remote_playlist(urls[0]):
-                    expanded_urls = expand_remote_playlist(urls[0])
+                urls, single = peek_single(urls)
+                if single is not None and is_remote_playlist(single):
+                    expanded_urls = expand_remote_playlist(single, journal)
                     if expanded_urls:
                         urls = expanded_urls
 
-                playlist = process_playlist(playlist_name, urls)
-                db.write(json.dumps(playlist, separators=(',', ':')) + '\n')
+                # each video is written as soon as it is looked up
+                with profiling.span("write playlist"):
+                    stream_io.dump(process_playlist(playlist_name, urls, queue), db, separators=(',', ':'))
+                    db.write('\n')
+                    db.flush()
+                journal.record_done(index, db.tell())
+
+    resolved = queue.finish()
+    patched = patch_freetube_db(freetube_db, resolved) if resolved else 0
+    queue.patched(resolved)
+    queue.report(len(resolved), patched)
+    journal.finish()
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python3 playlists-convert-freetube.py playlists.csv freetube-playlists.db")
+        sys.exit(1)
+
+    csv_to_freetube(sys.argv[1], sys.argv[2])
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
@@ -4,7 +4,7 @@
 
 # Extracts all files from the input Grayjay ZIP to memory
 # Reads playlists CSV with names and lists of URLs/playlist URLs
-# For YouTube remote playlists, uses yt-dlp to expand to individual video URLs
+# For YouTube remote playlists, uses the configured extractor (yt-dlp by default) to expand to individual video URLs
 # remove duplicate youtube videos in playlists
 # Converts all playlists to the Grayjay local playlist format (name + uuid + video URLs)
 # Updates stores/Playlists with the local playlists
@@ -14,6 +14,7 @@
 # - The first argument is the input Grayjay Template zip file.
 # - The second argument is the input playlists csv file.
 # - The third argument is the output grayjay export zip file.
+# - Set PLAYLIST_EXTRACTOR to use another metadata backend (see extractors.py).
 
 import sys
 import os
@@ -23,6 +24,8 @@ import zipfile
 import io
 import uuid
 from urllib.parse import urlparse, parse_qs
+import profiling
+from extractors import get_extractor
 
 # Optional: enable a lightweight availability check (off by default for determinism)
 ENABLE_AVAILABILITY_CHECK = False
@@ -30,9 +33,6 @@ ENABLE_AVAILABILITY_CHECK = False
 # plugin assumed for YouTube ID format (keep consistent with Grayjay template)
 YOUTUBE_PLUGIN_ID = "35ae969a-a7db-11ed-afa1-0242ac120002"
 
-# Global dedup tracker: video IDs seen across all playlists
-_seen_video_ids = set()
-
 def extract_youtube_id(url: str):
     try:
         p = urlparse(url)
@@ -46,17 +46,20 @@ def extract_youtube_id(url: str):
         pass
     return None
 
+@profiling.profiled("unzip")
 def load_grayjay_template(zip_path):
     with zipfile.ZipFile(zip_path, 'r') as z:
         # Read all bytes for later writing back
         contents = {name: z.read(name) for name in z.namelist()}
     return contents
 
+@profiling.profiled("zip")
 def save_grayjay_export(file_contents, output_path):
     with zipfile.ZipFile(output_path, 'w') as z:
         for name, data in file_contents.items():
             z.writestr(name, data)
 
+@profiling.profiled("read csv")
 def parse_playlists_csv(csv_path):
     playlists = []
     with open(csv_path, newline='', encoding='utf-8') as f:
@@ -78,27 +81,27 @@ def parse_playlists_csv(csv_path):
     return playlists
 
 def expand_youtube_playlist(playlist_url):
-    # Lightweight approach; in a real setup, replace with actual expansion results
-    # Here we simply return the URL itself if it's a direct video URL or a playlist URL that needs expansion later.
-    # For demonstration fidelity, you would call into a video downloader to expand playlists.
-    return [playlist_url]
+    # Returns the URL itself if the playlist cannot be expanded
+    try:
+        return get_extractor().expand_playlist(playlist_url) or [playlist_url]
+    except Exception:
+        return [playlist_url]
 
-def is_youtube_video_available_yt_dlp(url):
+def is_youtube_video_available(url):
     try:
-        # Minimal check using the library; do not download
-        import yt_dlp
-        ydl_opts = {"quiet": True, "skip_download": True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
+        # Minimal check through the extractor; do not download
+        get_extractor().video_metadata(url)
         # If extraction succeeded, consider the video as available for our purposes
         return True
     except Exception:
         # Any exception here typically indicates the video is not accessible under current context
         return False
 
+@profiling.profiled("deduplicate")
 def deduplicate_and_expand(playlists):
     """Return per-playlist cleaned URLs and a global set of retained URLs"""
-    global _seen_video_ids
+    # dedup tracker: video IDs seen across all playlists of this conversion
+    seen_video_ids = set()
     kept_playlists = []
     retained_all = []
     for name, urls in playlists:
@@ -106,20 +109,20 @@ def deduplicate_and_expand(playlists):
         for url in urls:
             vid = extract_youtube_id(url)
             if vid:
-                if vid in _seen_video_ids:
+                if vid in seen_video_ids:
                     continue # skip duplicate across all playlists
                 # optional availability check
                 if ENABLE_AVAILABILITY_CHECK:
-                    if not is_youtube_video_available_yt_dlp(url):
+                    if not is_youtube_video_available(url):
                         continue
-                _seen_video_ids.add(vid)
+                seen_video_ids.add(vid)
                 kept_urls.append(url)
                 retained_all.append(url)
             else:
                 # non-YouTube or unidentifiable; treat as unique if not seen
-                if url in _seen_video_ids:
+                if url in seen_video_ids:
                     continue
-                _seen_video_ids.add(url)
+                seen_video_ids.add(url)
                 kept_urls.append(url)
                 retained_all.append(url)
         playlist_str = name + ":::" + str(uuid.uuid5(uuid.NAMESPACE_DNS, name)) + "\n" + "\n".join(kept_urls)
@@ -129,15 +132,7 @@ def deduplicate_and_expand(playlists):
 def update_playlists_store(file_contents, playlists_output):
     file_contents['stores/Playlists'] = json.dumps(playlists_output, ensure_ascii=False).encode('utf-8')
 
-def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 playlists-convert-grayjay.py Grayjay-Zip-Template.zip playlists.csv grayjay-export.zip")
-        sys.exit(2)
-
-    template_zip = sys.argv[1]
-    playlists_csv = sys.argv[2]
-    output_zip = sys.argv[3]
-
+def csv_to_grayjay_zip(template_zip, playlists_csv, output_zip):
     # Load template
     file_contents = load_grayjay_template(template_zip)
 
@@ -155,5 +150,13 @@ def main():
 
     print(f"Grayjay export ZIP created: {output_zip}")
 
+def main():
+    if len(sys.argv) != 4:
+        print("Usage: python3 playlists-convert-grayjay.py Grayjay-Zip-Template.zip playlists.csv grayjay-export.zip")
+        sys.exit(2)
+
+    csv_to_grayjay_zip(sys.argv[1], sys.argv[2], sys.argv[3])
+
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
@@ -6,15 +6,28 @@
 # Reads the playlists.csv with playlist names and video URLs
 # Separates local and remote playlists
 # Fetches detailed video metadata for each local video URL
+# A failed or slow lookup does not stop the conversion: the stream gets placeholder metadata and the URL is retried
+# in the background (see retry_queue.py); resolved metadata is patched into newpipe.db before it is zipped and the
+# rest is listed at the end and kept in <output>.retry.json for playlists-retry-failed.py
 # Updates streams, playlists, playlist_stream_join, and remote_playlists tables accordingly
+# Resolved lookups are journaled in <output>.journal (see checkpoint.py): after a crash or Ctrl-C the same command
+# rebuilds newpipe.db from the journal without fetching anything twice and writes the same backup
+# Analyzes and compacts newpipe.db (see sqlite_finalize.py) and reports its size before and after
 # Packs the updated newpipe.db back with settings and preferences into the output zip
 #
+# With --merge the first zip is an existing NewPipe backup and the CSV is applied as a diff:
+# streams are reused by (service_id, url) and metadata is only fetched for new URLs,
+# only added or changed playlists get their join rows rewritten, playlists missing from the CSV are removed,
+# and streams, watch history and stream states are kept.
+#
 # Usage Example:
 # python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip
+# python3 playlists-convert-newpipe.py NewPipeData.zip playlists.csv NewPipeData-synced.zip --merge
 #
-# - The first argument is the input NewPipeData Template zip file.
+# - The first argument is the input NewPipeData Template zip file (with --merge the backup to update).
 # - The second argument is the input playlists csv file.
 # - the third argument is the output NewPipeData zip file.
+# - Set PLAYLIST_EXTRACTOR to use another metadata backend (see extractors.py).
 
 import csv
 import ast
@@ -25,7 +38,11 @@ import sys
 import tempfile
 import zipfile
 
-from yt_dlp import YoutubeDL
+import metrics
+import profiling
+from checkpoint import Journal
+from retry_queue import RetryQueue
+from sqlite_finalize import finalize_db, report
 
 REMOTE_PLAYLIST_PATTERNS = [
     r'(?:youtube\.com|youtu\.be).*(list=|/playlist\?list=)',
@@ -34,42 +51,43 @@ REMOTE_PLAYLIST_PATTERNS = [
 ]
 REMOTE_PLAYLIST_RE = re.compile('|'.join(REMOTE_PLAYLIST_PATTERNS), re.IGNORECASE)
 
+streams_written = metrics.counter("streams_written_total", "Streams inserted into newpipe.db")
+playlists_written = metrics.counter("playlists_written_total", "Playlists inserted into newpipe.db, by kind")
+
 def is_remote_playlist(url):
     return bool(REMOTE_PLAYLIST_RE.search(url))
 
-def fetch_video_metadata(url):
-    ydl_opts = {
-        'quiet': True,
-        'skip_download': True,
-        'extract_flat': False,
-        'forcejson': True,
+PLACEHOLDER_METADATA = {
+    'title': 'Unknown Title',
+    'duration': 0,
+    'uploader': 'Unknown Uploader',
+    'uploader_url': '',
+    'thumbnail_url': '',
+    'view_count': 0,
+    'textual_upload_date': '',
+    'upload_date': 0
+}
+
+def stream_metadata(info):
+    return {
+        'title': info.get('title') or 'Unknown Title',
+        'duration': int(info.get('duration') or 0),
+        'uploader': info.get('uploader') or 'Unknown Uploader',
+        'uploader_url': info.get('uploader_url') or '',
+        'thumbnail_url': info.get('thumbnail') or '',
+        'view_count': int(info.get('view_count') or 0),
+        'textual_upload_date': '',
+        'upload_date': int(info.get('timestamp', 0)) * 1000 if info.get('timestamp') else 0
     }
-    try:
-        with YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return {
-                'title': info.get('title') or 'Unknown Title',
-                'duration': int(info.get('duration') or 0),
-                'uploader': info.get('uploader') or 'Unknown Uploader',
-                'uploader_url': info.get('uploader_url') or '',
-                'thumbnail_url': info.get('thumbnail') or '',
-                'view_count': int(info.get('view_count') or 0),
-                'textual_upload_date': '',
-                'upload_date': int(info.get('timestamp', 0)) * 1000 if info.get('timestamp') else 0
-            }
-    except Exception as e:
-        print(f"Warning: Could not fetch metadata for {url}: {e}")
-        return {
-            'title': 'Unknown Title',
-            'duration': 0,
-            'uploader': 'Unknown Uploader',
-            'uploader_url': '',
-            'thumbnail_url': '',
-            'view_count': 0,
-            'textual_upload_date': '',
-            'upload_date': 0
-        }
 
+def fetch_video_metadata(url, queue):
+    """
+    Metadata columns of a stream, placeholders when the lookup failed and was queued for a retry.
+    """
+    info = queue.lookup(url)
+    return stream_metadata(info) if info is not None else dict(PLACEHOLDER_METADATA)
+
+@profiling.profiled("read csv")
 def read_playlists_csv(csv_path):
     playlists = []
     with open(csv_path, "r", encoding="utf-8") as f:
@@ -93,7 +111,8 @@ def get_next_uid(cursor, table):
     else:
         return 1
 
-def modify_newpipe_db(db_path, playlist_data):
+@profiling.profiled("write db")
+def modify_newpipe_db(db_path, playlist_data, queue):
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
 
@@ -107,6 +126,8 @@ def modify_newpipe_db(db_path, playlist_data):
     next_remote_uid = get_next_uid(c, "remote_playlists")
 
     stream_url_map = {}
+    # remote URLs are only stored for playlists without local URLs
+    metrics.track(sum(len([u for u in urls if not is_remote_playlist(u)]) or len(urls) for name, urls in playlist_data), "URLs")
 
     for name, urls in playlist_data:
         local_urls = [u for u in urls if not is_remote_playlist(u)]
@@ -119,6 +140,8 @@ def modify_newpipe_db(db_path, playlist_data):
                     (next_remote_uid, name, url)
                 )
                 next_remote_uid += 1
+                playlists_written.inc(kind="remote")
+                metrics.advance()
         elif local_urls:
             c.execute(
                 "INSERT INTO playlists (uid, name, is_thumbnail_permanent, thumbnail_stream_id, display_index) VALUES (?, ?, 0, 0, 0)",
@@ -126,10 +149,11 @@ def modify_newpipe_db(db_path, playlist_data):
             )
             playlist_uid = next_playlist_uid
             next_playlist_uid += 1
+            playlists_written.inc(kind="local")
 
             for join_index, url in enumerate(local_urls):
                 if url not in stream_url_map:
-                    meta = fetch_video_metadata(url)
+                    meta = fetch_video_metadata(url, queue)
                     c.execute(
                         """INSERT INTO streams
                         (uid, service_id, url, title, stream_type, duration, uploader, uploader_url,
@@ -143,12 +167,14 @@ def modify_newpipe_db(db_path, playlist_data):
                     )
                     stream_url_map[url] = next_stream_uid
                     next_stream_uid += 1
+                    streams_written.inc()
 
                 stream_uid = stream_url_map[url]
                 c.execute(
                     "INSERT INTO playlist_stream_join (playlist_id, stream_id, join_index) VALUES (?, ?, ?)",
                     (playlist_uid, stream_uid, join_index)
                 )
+                metrics.advance()
 
             if local_urls:
                 c.execute(
@@ -164,9 +190,171 @@ def modify_newpipe_db(db_path, playlist_data):
     c.close()
     conn.close()  # explicitly close to avoid locking
 
-def extract_modify_repack(template_zip, csv_file, output_zip):
+def find_or_insert_stream(c, stream_url_map, url, queue):
+    """
+    uid of the service 0 stream with this URL, inserted with fetched metadata when it is new.
+    """
+    stream_uid = stream_url_map.get(url)
+    if stream_uid is not None:
+        return stream_uid, False
+    row = c.execute("SELECT uid FROM streams WHERE service_id=0 AND url=?", (url,)).fetchone()
+    if row:
+        stream_url_map[url] = row[0]
+        return row[0], False
+    meta = fetch_video_metadata(url, queue)
+    c.execute(
+        """INSERT INTO streams
+        (service_id, url, title, stream_type, duration, uploader, uploader_url,
+        thumbnail_url, view_count, textual_upload_date, upload_date, is_upload_date_approximation)
+        VALUES (0, ?, ?, 'VIDEO_STREAM', ?, ?, ?, ?, ?, ?, ?, 1)""",
+        (
+            url, meta['title'], meta['duration'], meta['uploader'],
+            meta['uploader_url'], meta['thumbnail_url'], meta['view_count'], meta['textual_upload_date'],
+            meta['upload_date']
+        )
+    )
+    stream_url_map[url] = c.lastrowid
+    streams_written.inc()
+    return c.lastrowid, True
+
+@profiling.profiled("merge db")
+def merge_newpipe_db(db_path, playlist_data, queue):
+    """
+    Apply the CSV to an existing newpipe.db without touching unchanged playlists, streams or history.
+    Returns counts of playlists added/changed/removed/unchanged and streams reused/new.
+    """
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    counts = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0, "reused": 0, "new": 0}
+
+    # local playlists by name, oldest first, with their current URLs
+    existing = {}
+    contents = {}
+    for uid, name in c.execute("SELECT uid, name FROM playlists ORDER BY uid").fetchall():
+        contents[uid] = []
+        existing.setdefault(name, []).append(uid)
+    for playlist_id, url in c.execute(
+            "SELECT j.playlist_id, s.url FROM playlist_stream_join j JOIN streams s ON s.uid = j.stream_id "
+            "ORDER BY j.playlist_id, j.join_index"):
+        urls = contents.get(playlist_id)
+        if urls is not None:
+            urls.append(url)
+    remote = {url: [uid, name] for uid, name, url in c.execute("SELECT uid, name, url FROM remote_playlists")}
+    kept_remote = set()
+
+    stream_url_map = {}
+    for name, urls in playlist_data:
+        local_urls = [u for u in urls if not is_remote_playlist(u)]
+        remote_urls = [u for u in urls if is_remote_playlist(u)]
+
+        if remote_urls and not local_urls:
+            for url in remote_urls:
+                row = remote.get(url)
+                if row is None:
+                    c.execute(
+                        "INSERT INTO remote_playlists (service_id, name, url, thumbnail_url, uploader, display_index, stream_count) VALUES (0, ?, ?, '', '', 0, 0)",
+                        (name, url)
+                    )
+                    row = remote[url] = [c.lastrowid, name]
+                    counts["added"] += 1
+                    playlists_written.inc(kind="remote")
+                elif row[1] != name:
+                    c.execute("UPDATE remote_playlists SET name=? WHERE uid=?", (name, row[0]))
+                    row[1] = name
+                    counts["changed"] += 1
+                elif row[0] not in kept_remote:
+                    counts["unchanged"] += 1
+                kept_remote.add(row[0])
+        else:
+            # a local playlist, possibly empty: newpipe-convert-playlists.py writes "name,[]" for those
+            uids = existing.get(name)
+            if uids:
+                playlist_uid = uids.pop(0)
+                if contents[playlist_uid] == local_urls:
+                    counts["unchanged"] += 1
+                    continue
+                c.execute("DELETE FROM playlist_stream_join WHERE playlist_id=?", (playlist_uid,))
+                counts["changed"] += 1
+            else:
+                c.execute(
+                    "INSERT INTO playlists (name, is_thumbnail_permanent, thumbnail_stream_id, display_index) VALUES (?, 0, 0, 0)",
+                    (name,)
+                )
+                playlist_uid = c.lastrowid
+                counts["added"] += 1
+            playlists_written.inc(kind="local")
+
+            metrics.track(len(local_urls), "URLs")
+            join_rows = []
+            for join_index, url in enumerate(local_urls):
+                stream_uid, new = find_or_insert_stream(c, stream_url_map, url, queue)
+                counts["new" if new else "reused"] += 1
+                join_rows.append((playlist_uid, stream_uid, join_index))
+                metrics.advance()
+            c.executemany("INSERT INTO playlist_stream_join (playlist_id, stream_id, join_index) VALUES (?, ?, ?)", join_rows)
+            c.execute(
+                "UPDATE playlists SET thumbnail_stream_id=? WHERE uid=? AND is_thumbnail_permanent=0",
+                (join_rows[0][1] if join_rows else 0, playlist_uid)
+            )
+
+    # playlists no longer in the CSV; their streams stay for the watch history
+    for uids in existing.values():
+        for playlist_uid in uids:
+            c.execute("DELETE FROM playlist_stream_join WHERE playlist_id=?", (playlist_uid,))
+            c.execute("DELETE FROM playlists WHERE uid=?", (playlist_uid,))
+            counts["removed"] += 1
+    for uid, name in remote.values():
+        if uid not in kept_remote:
+            c.execute("DELETE FROM remote_playlists WHERE uid=?", (uid,))
+            counts["removed"] += 1
+
+    conn.commit()
+    c.close()
+    conn.close()
+    return counts
+
+@profiling.profiled("patch streams")
+def patch_streams(db_path, resolved):
+    """
+    Replace the placeholder metadata of the streams whose lookup a retry resolved, returns the rows updated.
+    """
+    conn = sqlite3.connect(db_path)
+    updated = 0
+    for url, item in resolved.items():
+        meta = stream_metadata(item['info'])
+        updated += conn.execute(
+            """UPDATE streams SET title=?, duration=?, uploader=?, uploader_url=?, thumbnail_url=?, view_count=?,
+            textual_upload_date=?, upload_date=? WHERE service_id=0 AND url=?""",
+            (
+                meta['title'], meta['duration'], meta['uploader'], meta['uploader_url'], meta['thumbnail_url'],
+                meta['view_count'], meta['textual_upload_date'], meta['upload_date'], url
+            )
+        ).rowcount
+    conn.commit()
+    conn.close()
+    return updated
+
+def patch_newpipe_zip(output_zip, resolved):
+    """
+    patch_streams() on the newpipe.db inside an existing backup zip, other members are copied unchanged.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with zipfile.ZipFile(output_zip, 'r') as zf:
+            names = zf.namelist()
+            zf.extractall(tmpdir)
+        db_path = os.path.join(tmpdir, 'newpipe.db')
+        updated = patch_streams(db_path, resolved)
+        report("newpipe.db", *finalize_db(db_path))
+        tmp_zip = output_zip + '.tmp'
+        with zipfile.ZipFile(tmp_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for name in names:
+                zf.write(os.path.join(tmpdir, name), arcname=name)
+        os.replace(tmp_zip, output_zip)
+    return updated
+
+def extract_modify_repack(template_zip, csv_file, output_zip, merge=False):
     with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(template_zip, 'r') as zf:
+        with profiling.span("unzip"), zipfile.ZipFile(template_zip, 'r') as zf:
             zf.extractall(tmpdir)
 
         db_path = os.path.join(tmpdir, 'newpipe.db')
@@ -178,21 +366,48 @@ def extract_modify_repack(template_zip, csv_file, output_zip):
             sys.exit(1)
 
         playlist_data = read_playlists_csv(csv_file)
-        modify_newpipe_db(db_path, playlist_data)
+        # the database is rebuilt on every run, only the lookups are worth keeping
+        journal = Journal(output_zip, "newpipe-merge" if merge else "newpipe", [template_zip, csv_file])
+        queue = RetryQueue(output_zip, "newpipe", fetch=journal.video_metadata)
+        if journal.resumed:
+            queue.restore()
+            queue.resume()
+        if merge:
+            counts = merge_newpipe_db(db_path, playlist_data, queue)
+            print(f"Playlists: {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed, {counts['unchanged']} unchanged")
+            print(f"Streams: {counts['reused']} reused, {counts['new']} new (metadata fetched)")
+        else:
+            modify_newpipe_db(db_path, playlist_data, queue)
+        resolved = queue.finish()
+        patched = patch_streams(db_path, resolved) if resolved else 0
 
-        with zipfile.ZipFile(output_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
-            zf.write(db_path, arcname='newpipe.db')
-            zf.write(pref_path, arcname='preferences.json')
-            if os.path.isfile(settings_path):
-                zf.write(settings_path, arcname='newpipe.settings')
+        report("newpipe.db", *finalize_db(db_path))
+
+        with profiling.span("zip") as s:
+            with zipfile.ZipFile(output_zip, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                zf.write(db_path, arcname='newpipe.db')
+                zf.write(pref_path, arcname='preferences.json')
+                if os.path.isfile(settings_path):
+                    zf.write(settings_path, arcname='newpipe.settings')
+            s.add_bytes(os.path.getsize(output_zip))
+        queue.patched(resolved)
+        queue.report(len(resolved), patched)
+        journal.finish()
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip")
+    merge = "--merge" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != "--merge"]
+    if len(args) != 3:
+        print("Usage: python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip [--merge]")
         sys.exit(1)
 
-    extract_modify_repack(sys.argv[1], sys.argv[2], sys.argv[3])
-    print(f"Created {sys.argv[3]} from template {sys.argv[1]} with playlists from {sys.argv[2]}")
+    extract_modify_repack(args[0], args[1], args[2], merge)
+    if merge:
+        print(f"Created {args[2]} from backup {args[0]} merged with playlists from {args[1]}")
+    else:
+        print(f"Created {args[2]} from template {args[0]} with playlists from {args[1]}")
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
+    metrics.init_from_argv()
     main()
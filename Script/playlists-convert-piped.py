@@ -5,7 +5,9 @@
 # Reads your playlist CSV where each playlist has a list (including remote playlist URLs).
 # Expands any remote playlist URLs inside CSV’s playlist lists into video URLs.
 # Exports them all as playlists with "type": "playlist" and "visibility": "private".
-# Outputs the entire JSON export as one single line.
+# Outputs the entire JSON export as one single line, written while the CSV is read (see stream_io.py):
+# memory does not grow with the number or the size of the playlists. The JSON goes to a temporary file next to
+# the output that replaces it once complete, so an interrupted run leaves the previous export intact.
 # Piped does not support importing remote playlists as bookmarks.
 # Outputs valid playlists-piped.json for Piped import/export.
 #
@@ -14,13 +16,18 @@
 #
 # - The first argument is the input playlists CSV file.
 # - The second argument is the output piped json file.
+# - Set PLAYLIST_EXTRACTOR to use another metadata backend (see extractors.py).
 
 import csv
-import json
+import os
 import sys
-import ast
+import tempfile
 import re
-from yt_dlp import YoutubeDL
+import itertools
+import profiling
+import stream_io
+from extractors import get_extractor
+from stream_io import iter_url_list
 
 REMOTE_PLAYLIST_PATTERNS = [
     r'(?:youtube\.com|youtu\.be).*(list=|/playlist\?id=)',
@@ -34,28 +41,36 @@ def is_remote_url(url):
     return bool(REMOTE_PLAYLIST_RE.search(url))
 
 def expand_remote_playlist(url):
-    opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'skip_download': True,
-        'extract_flat': True,
-    }
-    with YoutubeDL(opts) as ydl:
-        try:
-            info = ydl.extract_info(url, download=False)
-            entries = info.get('entries', [])
-            video_urls = []
-            for entry in entries:
-                video_url = entry.get('url') or entry.get('webpage_url')
-                if video_url:
-                    video_urls.append(video_url)
-            return video_urls
-        except Exception as e:
-            print(f"Failed to expand remote playlist {url}: {e}")
-            return []
-
-def read_playlists_csv(csv_file):
-    playlists = []
+    try:
+        return get_extractor().expand_playlist(url)
+    except Exception as e:
+        print(f"Failed to expand remote playlist {url}: {e}")
+        return []
+
+def expand_urls(urls):
+    # Expand remote playlist URLs into local video URLs
+    for url in urls:
+        if is_remote_url(url):
+            expanded = expand_remote_playlist(url)
+            if expanded:
+                yield from expanded
+                continue
+        yield url
+
+def unique_urls(urls):
+    # Remove duplicates and empty
+    seen = set()
+    for url in urls:
+        url = url.strip()
+        if url and url not in seen:
+            seen.add(url)
+            yield url
+
+def read_playlists_csv(csv_file, counter):
+    """
+    Yields the playlists of the CSV one at a time, their videos as a generator that expands and looks up
+    while the JSON is written; counter["playlists"] counts them.
+    """
     with open(csv_file, "r", encoding="utf-8") as f:
         reader = csv.reader(f)
         for row in reader:
@@ -63,56 +78,54 @@ def read_playlists_csv(csv_file):
                 continue
             name, urls_str = row
             try:
-                urls = ast.literal_eval(urls_str)
-                if not isinstance(urls, list) or not urls:
+                urls = iter_url_list(urls_str)
+                first = next(urls, None)
+                if first is None:
                     continue
             except:
                 continue
 
-            # Expand remote playlist URLs into local video URLs
-            expanded_urls = []
-            for url in urls:
-                if is_remote_url(url):
-                    expanded = expand_remote_playlist(url)
-                    if expanded:
-                        expanded_urls.extend(expanded)
-                    else:
-                        expanded_urls.append(url)
-                else:
-                    expanded_urls.append(url)
-
-            # Remove duplicates and empty
-            cleaned_urls = list(dict.fromkeys([u.strip() for u in expanded_urls if u.strip()]))
-
-            playlists.append({
+            counter["playlists"] += 1
+            yield {
                 "name": name.strip(),
                 "type": "playlist",
                 "visibility": "private",
-                "videos": cleaned_urls
-            })
-    return playlists
-
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python playlists-convert-piped.py playlists.csv playlists-piped.json")
-        sys.exit(1)
-
-    in_csv = sys.argv[1]
-    out_json = sys.argv[2]
-
-    playlists = read_playlists_csv(in_csv)
+                "videos": unique_urls(expand_urls(itertools.chain([first], urls)))
+            }
 
+def csv_to_piped_json(in_csv, out_json):
+    stream_io.raise_csv_field_limit()
+    counter = {"playlists": 0}
     piped_data = {
         "format": "Piped",
         "version": 1,
-        "playlists": playlists
+        "playlists": read_playlists_csv(in_csv, counter)
     }
 
-    # Dump JSON on a single line
-    with open(out_json, "w", encoding="utf-8") as jsonf:
-        jsonf.write(json.dumps(piped_data, separators=(',', ':')))
+    # Write JSON on a single line, each playlist as soon as it is read
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(out_json) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(out_json) or ".")
+    try:
+        with profiling.span("write json") as s, os.fdopen(fd, "w", encoding="utf-8") as jsonf:
+            s.add_bytes(stream_io.dump(piped_data, jsonf, separators=(',', ':')))
+        os.chmod(tmp_path, 0o644) # mkstemp creates 0600
+        os.replace(tmp_path, out_json)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    print(f"Exported {counter['playlists']} playlists to {out_json}")
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python playlists-convert-piped.py playlists.csv playlists-piped.json")
+        sys.exit(1)
 
-    print(f"Exported {len(playlists)} playlists to {out_json}")
+    csv_to_piped_json(sys.argv[1], sys.argv[2])
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+
+# playlists-daemon.py
+#
+# Long-running service for the conversion and export scripts, for pipelines that run many small jobs.
+# The converter scripts are imported once, the extractor (yt-dlp, pytubefix, ...) is created once and keeps
+# a metadata cache (extractors.enable_cache), and parsed NewPipe backups are kept as snapshots for listing.
+# Jobs run on a fixed pool of worker threads behind a bounded queue; when the queue is full new jobs
+# are refused with 503 and a Retry-After header instead of piling up.
+#
+# API (JSON over HTTP, on 127.0.0.1:PORT or a Unix socket):
+#   POST /jobs              {"action": "...", "args": {...}, "wait": false} -> 202 {"id": ..., "status": "queued"}
+#                           with "wait": true the answer is the finished job
+#   GET  /jobs/ID           status ("queued", "running", "done", "failed"), result, error and printed output of a job
+#   GET  /playlists?backup=PATH[&name=Rock*&urls=1]
+#                           playlists of a newpipe.db or NewPipe zip (kind, uid, name, label, tracks)
+#   GET  /status            workers, queue, jobs and cache sizes
+#   GET  /metrics           Prometheus metrics (see metrics.py)
+# Actions and their args (paths are on the machine running the daemon):
+#   newpipe-to-csv   input, output[, criteria]      freetube-to-csv  input, output
+#   piped-to-csv     input, output                  grayjay-to-csv   input, output
+#   csv-to-newpipe   template, input, output[, merge]
+#   csv-to-freetube  input, output                  csv-to-piped     input, output
+#   csv-to-grayjay   template, input, output
+#   export           input, formats[, output_dir, criteria]   (formats: csv, txt, md, m3u8, json)
+#   subscriptions    input, output[, template, source, target]  (subscriptions-convert.py, formats in subscriptions.py)
+# criteria are the selection options of playlist_filter.py, e.g. {"name": "Rock*", "max_duration": 600}.
+#
+# Usage Example:
+# python3 playlists-daemon.py --port 8765 --workers 4 --queue 16
+# python3 playlists-daemon.py --socket /tmp/playlists.sock --extractor synthetic
+# curl -s -X POST localhost:8765/jobs -d '{"action": "csv-to-piped", "args": {"input": "playlists.csv", "output": "piped.json"}, "wait": true}'
+# curl -s --unix-socket /tmp/playlists.sock "http://localhost/playlists?backup=NewPipeData.zip&name=Rock*"
+#
+# - --extractor sets PLAYLIST_EXTRACTOR for all jobs, "synthetic" works without network (see extractors.py).
+
+import argparse
+import importlib.util
+import io
+import itertools
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import extractors
+import metrics
+import profiling
+from playlist_export import EXPORT_FORMATS, export_playlists, playlist_fingerprints
+from playlist_filter import date_to_ms, select_playlists
+from snapshot_cache import SnapshotDirectory, load_or_build
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE = 16
+DEFAULT_CACHE_ENTRIES = 50000
+DEFAULT_SNAPSHOTS = 4
+KEEP_FINISHED_JOBS = 1000
+MAX_BODY = 1024 * 1024
+CRITERIA_KEYS = ("name", "min_duration", "max_duration", "uploader", "uploaded_after", "uploaded_before",
+                 "stream_type", "not_watched")
+
+# action -> (script, function, required args, optional args)
+ACTIONS = {
+    "newpipe-to-csv": ("newpipe-convert-playlists.py", "newpipe_to_csv", ("input", "output"), ("criteria",)),
+    "freetube-to-csv": ("freetube-convert-playlists.py", "freetube_to_csv", ("input", "output"), ()),
+    "piped-to-csv": ("piped-convert-playlists.py", "piped_json_to_csv", ("input", "output"), ()),
+    "grayjay-to-csv": ("grayjay-convert-playlists.py", "grayjay_zip_to_csv", ("input", "output"), ()),
+    "csv-to-newpipe": ("playlists-convert-newpipe.py", "extract_modify_repack", ("template", "input", "output"), ("merge",)),
+    "csv-to-freetube": ("playlists-convert-freetube.py", "csv_to_freetube", ("input", "output"), ()),
+    "csv-to-piped": ("playlists-convert-piped.py", "csv_to_piped_json", ("input", "output"), ()),
+    "csv-to-grayjay": ("playlists-convert-grayjay.py", "csv_to_grayjay_zip", ("template", "input", "output"), ()),
+    "export": (None, None, ("input", "formats"), ("output_dir", "criteria")),
+    "subscriptions": ("subscriptions-convert.py", "convert_subscriptions", ("input", "output"), ("template", "source", "target")),
+}
+
+jobs_total = metrics.counter("daemon_jobs_total", "Finished daemon jobs, by action and result")
+jobs_rejected = metrics.counter("daemon_jobs_rejected_total", "Jobs refused because the queue was full")
+job_seconds = metrics.histogram("daemon_job_seconds", "Run time of daemon jobs, by action")
+jobs_queued = metrics.gauge("daemon_jobs_queued", "Jobs waiting for a worker")
+jobs_running = metrics.gauge("daemon_jobs_running", "Jobs being run")
+
+class JobError(Exception):
+    pass
+
+def load_script(file_name):
+    """
+    Import one of the hyphenated scripts as a module.
+    """
+    name = os.path.splitext(file_name)[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class ThreadOutput:
+    """
+    sys.stdout replacement: what a job prints goes to the job's buffer, everything else to the real stdout.
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self, buffer):
+        self._local.buffer = buffer
+
+    def write(self, data):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is not None:
+            return buffer.write(data)
+        return self._stream.write(data)
+
+    def flush(self):
+        if getattr(self._local, "buffer", None) is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class Job:
+    __slots__ = ("id", "action", "args", "status", "result", "error", "output", "created", "started", "finished", "done")
+
+    def __init__(self, job_id, action, args):
+        self.id = job_id
+        self.action = action
+        self.args = args
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.output = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {"id": self.id, "action": self.action, "args": self.args, "status": self.status,
+                "result": self.result, "error": self.error, "output": self.output,
+                "created": self.created, "started": self.started, "finished": self.finished}
+
+def criteria_from_request(criteria):
+    """
+    Selection criteria from a job or query string in the form playlist_filter.py expects, None for no selection.
+    """
+    if not criteria:
+        return None
+    if not isinstance(criteria, dict):
+        raise JobError("criteria must be an object")
+    unknown = [key for key in criteria if key not in CRITERIA_KEYS]
+    if unknown:
+        raise JobError(f"unknown criteria {', '.join(unknown)}, choose from: " + ", ".join(CRITERIA_KEYS))
+    criteria = dict(criteria)
+    if isinstance(criteria.get("name"), str):
+        criteria["name"] = [criteria["name"]]
+    if isinstance(criteria.get("not_watched"), str):
+        criteria["not_watched"] = criteria["not_watched"].lower() not in ("0", "", "false", "no")
+    try:
+        for key in ("min_duration", "max_duration"):
+            if criteria.get(key) is not None:
+                criteria[key] = int(criteria[key])
+        for key in ("uploaded_after", "uploaded_before"):
+            if criteria.get(key):
+                date_to_ms(criteria[key])
+    except (TypeError, ValueError) as e:
+        raise JobError(f"invalid criteria: {e}")
+    return criteria
+
+def newpipe_db_path(path, tmpdir):
+    if not path.lower().endswith('.zip'):
+        return path
+    with zipfile.ZipFile(path, 'r') as zf:
+        zf.extract('newpipe.db', path=tmpdir)
+    return os.path.join(tmpdir, 'newpipe.db')
+
+def read_backup(path, criteria):
+    with profiling.span("read backup"), tempfile.TemporaryDirectory() as tmpdir:
+        conn = sqlite3.connect(newpipe_db_path(path, tmpdir))
+        try:
+            return select_playlists(conn, criteria), playlist_fingerprints(conn)
+        finally:
+            conn.close()
+
+class SnapshotCache:
+    """
+    Parsed backups (PlaylistStore) keyed by path, size, mtime and selection criteria, least recently used first out.
+    Misses are loaded from the snapshot files shared with main.py (see snapshot_cache.py) or parsed and saved there.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.snapshot_files = SnapshotDirectory()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def load(self, path, criteria=None):
+        stat = os.stat(path)
+        key = (os.path.realpath(path), stat.st_size, stat.st_mtime_ns, json.dumps(criteria or {}, sort_keys=True))
+        with self._lock:
+            store = self.entries.get(key)
+            if store is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return store
+            self.misses += 1
+        store, _ = load_or_build(path, criteria, lambda: read_backup(path, criteria), self.snapshot_files)
+        with self._lock:
+            self.entries[key] = store
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return store
+
+    def __len__(self):
+        return len(self.entries)
+
+class Daemon:
+    def __init__(self, workers, queue_size, snapshots):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.jobs = OrderedDict()
+        self.jobs_lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.snapshots = SnapshotCache(snapshots)
+        self.output = ThreadOutput(sys.stdout)
+        sys.stdout = self.output
+        with profiling.span("load scripts"):
+            self.scripts = {script: load_script(script) for script, _, _, _ in ACTIONS.values() if script}
+
+    def warm_up(self):
+        try:
+            extractor = extractors.get_extractor()
+            print(f"Extractor {extractor.name} ready")
+        except (ImportError, ValueError) as e:
+            print(f"Warning: extractor not available yet: {e}")
+
+    def submit(self, action, args):
+        if action not in ACTIONS:
+            raise JobError(f"unknown action '{action}', choose one of: " + ", ".join(ACTIONS))
+        if not isinstance(args, dict):
+            raise JobError("args must be an object")
+        _, _, required, optional = ACTIONS[action]
+        missing = [name for name in required if name not in args]
+        unknown = [name for name in args if name not in required and name not in optional]
+        if missing or unknown:
+            raise JobError(f"{action} needs args {', '.join(required)}" + (f" (optional {', '.join(optional)})" if optional else ""))
+        if "criteria" in args:
+            args = dict(args, criteria=criteria_from_request(args["criteria"]))
+        if not self.slots.acquire(blocking=False):
+            jobs_rejected.inc()
+            return None
+        job = Job(next(self.ids), action, args)
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > KEEP_FINISHED_JOBS + self.workers + self.queue_size:
+                oldest = next(iter(self.jobs.values()))
+                if not oldest.done.is_set():
+                    break
+                self.jobs.popitem(last=False)
+        jobs_queued.inc()
+        self.pool.submit(self.run, job)
+        return job
+
+    def run(self, job):
+        jobs_queued.dec()
+        jobs_running.inc()
+        job.status = "running"
+        job.started = time.time()
+        buffer = io.StringIO()
+        self.output.capture(buffer)
+        try:
+            with job_seconds.time(action=job.action), profiling.span("job " + job.action):
+                job.result = self.call(job.action, job.args)
+            job.status = "done"
+        except BaseException as e:
+            # converters exit through sys.exit on bad input
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.output.capture(None)
+            job.output = buffer.getvalue()
+            job.finished = time.time()
+            jobs_total.inc(action=job.action, result=job.status)
+            jobs_running.dec()
+            self.slots.release()
+            job.done.set()
+
+    def call(self, action, args):
+        if action == "export":
+            return self.export(**args)
+        script, function, _, _ = ACTIONS[action]
+        values = [args[name] for name in ACTIONS[action][2]]
+        extra = {name: args[name] for name in ACTIONS[action][3] if name in args}
+        result = getattr(self.scripts[script], function)(*values, **extra)
+        if action == "newpipe-to-csv":
+            return {"playlists": len(result) if result is not None else None, "changed": result is not None}
+        if action == "subscriptions":
+            return result
+        return None
+
+    def export(self, input, formats, output_dir="./Playlists", criteria=None):
+        formats = [formats] if isinstance(formats, str) else list(formats)
+        unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+        if unknown:
+            raise JobError(f"unknown formats {', '.join(unknown)}, choose from: " + ", ".join(EXPORT_FORMATS))
+        store = self.snapshots.load(input, criteria)
+        export_playlists(store, formats, output_dir)
+        return {"playlists": len(store)}
+
+    def list_playlists(self, path, criteria, with_urls):
+        store = self.snapshots.load(path, criteria)
+        playlists = []
+        for playlist in store:
+            entry = {"kind": playlist.kind, "uid": playlist.uid, "name": playlist.name, "label": playlist.label,
+                     "tracks": len(playlist)}
+            if with_urls:
+                entry["urls"] = store.urls_of(playlist)
+            playlists.append(entry)
+        return playlists
+
+    def status(self):
+        with self.jobs_lock:
+            states = {}
+            for job in self.jobs.values():
+                states[job.status] = states.get(job.status, 0) + 1
+        cache = {}
+        for name, extractor in extractors._extractors.items():
+            if extractor.cache is not None:
+                cache[name] = {"entries": len(extractor.cache), "hits": extractor.cache.hits, "misses": extractor.cache.misses}
+        return {"workers": self.workers, "queue": self.queue_size, "queued": jobs_queued.get(), "running": jobs_running.get(),
+                "jobs": states, "extractor_cache": cache,
+                "snapshots": {"entries": len(self.snapshots), "hits": self.snapshots.hits, "misses": self.snapshots.misses}}
+
+class Handler(BaseHTTPRequestHandler):
+    daemon = None
+
+    def send_json(self, code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values if key == "name" else values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/status":
+            self.send_json(200, self.daemon.status())
+        elif url.path == "/metrics":
+            body = metrics.REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path.startswith("/jobs/"):
+            try:
+                job_id = int(url.path[len("/jobs/"):])
+            except ValueError:
+                job_id = None
+            job = self.daemon.jobs.get(job_id)
+            if job is None:
+                self.send_json(404, {"error": "no such job"})
+            else:
+                self.send_json(200, job.to_dict())
+        elif url.path == "/playlists":
+            backup = query.pop("backup", None)
+            with_urls = query.pop("urls", "0") not in ("0", "", "false")
+            if not backup:
+                self.send_json(400, {"error": "backup=PATH is required"})
+                return
+            try:
+                self.send_json(200, self.daemon.list_playlists(backup, criteria_from_request(query), with_urls))
+            except JobError as e:
+                self.send_json(400, {"error": str(e)})
+            except (OSError, sqlite3.Error, KeyError, ValueError) as e:
+                self.send_json(400, {"error": f"{type(e).__name__}: {e}"})
+        else:
+            self.send_json(404, {"error": "unknown path"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/jobs":
+            self.send_json(404, {"error": "unknown path"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.send_json(413, {"error": "request too large"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.daemon.submit(request.get("action"), request.get("args", {}))
+        except (ValueError, AttributeError) as e:
+            self.send_json(400, {"error": f"invalid JSON request: {e}"})
+            return
+        except JobError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        if job is None:
+            self.send_json(503, {"error": "queue full, retry later"}, {"Retry-After": "1"})
+            return
+        if request.get("wait"):
+            job.done.wait()
+            self.send_json(200, job.to_dict())
+        else:
+            self.send_json(202, {"id": job.id, "status": job.status}, {"Location": f"/jobs/{job.id}"})
+
+    def log_message(self, format, *args):
+        pass
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    address_family = socket.AF_UNIX
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.TCPServer.server_bind(self)
+        os.chmod(self.server_address, 0o600)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(self):
+        request, _ = self.socket.accept()
+        return request, ("local", 0)
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 playlists-daemon.py [--port N | --socket PATH] [--workers N] [--queue N] [--extractor NAME]")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"HTTP port on 127.0.0.1 (default {DEFAULT_PORT})")
+    parser.add_argument("--socket", default=None, help="listen on this Unix socket instead of a port")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"jobs run at the same time (default {DEFAULT_WORKERS})")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE, help=f"jobs waiting before new ones are refused (default {DEFAULT_QUEUE})")
+    parser.add_argument("--cache", type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help=f"extractor answers kept in memory (default {DEFAULT_CACHE_ENTRIES})")
+    parser.add_argument("--snapshots", type=int, default=DEFAULT_SNAPSHOTS,
+                        help=f"parsed backups kept in memory (default {DEFAULT_SNAPSHOTS})")
+    parser.add_argument("--extractor", default=None, help="PLAYLIST_EXTRACTOR for all jobs, e.g. synthetic")
+    args = parser.parse_args()
+
+    if args.extractor:
+        os.environ["PLAYLIST_EXTRACTOR"] = args.extractor
+    extractors.enable_cache(args.cache)
+    daemon = Daemon(args.workers, args.queue, args.snapshots)
+    daemon.warm_up()
+    Handler.daemon = daemon
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, Handler)
+        where = args.socket
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+        server.daemon_threads = True
+        where = f"http://127.0.0.1:{args.port}"
+    print(f"Listening on {where} with {args.workers} workers and a queue of {args.queue}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping")
+    finally:
+        server.server_close()
+        daemon.pool.shutdown(wait=True)
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    metrics.init_from_argv()
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+# playlists-retry-failed.py
+#
+# Retries the metadata lookups a conversion could not finish (kept in <output>.retry.json, see retry_queue.py)
+# and patches the resolved metadata into the output in place: the streams of a NewPipe backup zip
+# (playlists-convert-newpipe.py) or the videos of a FreeTube playlists file (playlists-convert-freetube.py).
+# Lookups are retried when their backoff is over; --now retries all of them at once, including the ones that
+# already failed too often. Prints what was resolved and what is still unresolved; run it again later (or from cron).
+#
+# Usage Example:
+# python3 playlists-retry-failed.py NewPipeData.zip
+# python3 playlists-retry-failed.py freetube-playlists.db --now --wait 300
+#
+# - The first argument is the output file of the conversion.
+# - --wait SECONDS keeps retrying lookups that come due within that time (default 60).
+# - Set PLAYLIST_EXTRACTOR to use another metadata backend (see extractors.py).
+
+import argparse
+import importlib.util
+import os
+import sys
+
+import metrics
+import profiling
+from retry_queue import DEFAULT_WAIT, RetryQueue, queue_path
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PATCHERS = {
+    "newpipe": ("playlists-convert-newpipe.py", "patch_newpipe_zip"),
+    "freetube": ("playlists-convert-freetube.py", "patch_freetube_db"),
+}
+
+def load_script(file_name):
+    """
+    Import one of the hyphenated scripts as a module.
+    """
+    name = os.path.splitext(file_name)[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, os.path.join(SCRIPT_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def retry_failed(output, wait=DEFAULT_WAIT, now=False):
+    """
+    Retry the queued lookups of output and patch what resolved into it, returns the lookups still unresolved.
+    """
+    queue = RetryQueue.open(output)
+    if queue is None:
+        print(f"No failed lookups queued for {output} ({queue_path(output)} does not exist)")
+        return 0
+    if not os.path.isfile(output):
+        print(f"{output} does not exist any more, remove {queue.path} to forget its failed lookups")
+        sys.exit(1)
+    print(f"{len(queue.entries)} failed lookups queued for {output}")
+    queue.resume(force=now)
+    resolved = queue.finish(wait)
+    patched = 0
+    if resolved:
+        script, function = PATCHERS[queue.kind]
+        patched = getattr(load_script(script), function)(output, resolved)
+        queue.patched(resolved)
+    queue.report(len(resolved), patched)
+    return len(queue.entries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Retry failed metadata lookups of a conversion and patch its output")
+    parser.add_argument("output", help="NewPipe zip or FreeTube playlists file written by a conversion")
+    parser.add_argument("--wait", type=float, default=DEFAULT_WAIT, help="seconds to keep retrying lookups that come due")
+    parser.add_argument("--now", action="store_true", help="retry every lookup now, also the ones that failed too often")
+    args = parser.parse_args()
+
+    if retry_failed(args.output, args.wait, args.now):
+        sys.exit(2)
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    metrics.init_from_argv()
+    main()
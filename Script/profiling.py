@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+# profiling.py
+#
+# Lightweight stage profiling shared by main.py and the converter scripts.
+# Stages are wrapped in span("name"); spans nest per thread, count calls and can record bytes moved.
+# Without --profile a span is a shared no-op object, so instrumented code costs next to nothing.
+#
+# Flags (removed from sys.argv by init_from_argv before the script parses its arguments):
+#   --profile[=trace.json]          record spans, write a Chrome trace (chrome://tracing, ui.perfetto.dev)
+#                                   and print the top stages at exit; default file <script>-trace.json
+#   --profile-top=N                 number of stages in the summary (default 15)
+#   --profile-cprofile=STAGE        also run cProfile while the first STAGE span is open,
+#                                   written next to the trace as .prof and summarized at exit
+#
+# Usage Example:
+# python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip --profile
+# python3 main.py newpipe.db --profile=run.json --profile-cprofile=query
+
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+
+DEFAULT_TOP = 15
+
+_enabled = False
+_trace_path = None
+_top = DEFAULT_TOP
+_cprofile_stage = None
+_cprofile = None
+_cprofile_done = False
+_lock = threading.Lock()
+_local = threading.local()
+_events = []
+_stats = {} # name -> [calls, total seconds, self seconds, bytes]
+_thread_ids = {}
+_start = time.perf_counter()
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_bytes(self, count):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    __slots__ = ("name", "args", "bytes", "start", "child_time", "profiling")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.bytes = 0
+        self.child_time = 0.0
+        self.profiling = False
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+    def __enter__(self):
+        stack = _stack()
+        stack.append(self)
+        if _cprofile_stage == self.name:
+            self.profiling = _start_cprofile()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        if self.profiling:
+            _cprofile.disable()
+        duration = end - self.start
+        stack = _stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_time += duration
+        event = {"name": self.name, "ph": "X", "pid": os.getpid(), "tid": _thread_id(),
+                 "ts": round((self.start - _start) * 1e6, 1), "dur": round(duration * 1e6, 1)}
+        args = dict(self.args) if self.args else {}
+        if self.bytes:
+            args["bytes"] = self.bytes
+        if args:
+            event["args"] = args
+        with _lock:
+            _events.append(event)
+            entry = _stats.setdefault(self.name, [0, 0.0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += duration - self.child_time
+            entry[3] += self.bytes
+        return False
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def _thread_id():
+    ident = threading.get_ident()
+    with _lock:
+        return _thread_ids.setdefault(ident, len(_thread_ids) + 1)
+
+def _start_cprofile():
+    global _cprofile, _cprofile_done
+    import cProfile
+    with _lock:
+        if _cprofile_done:
+            return False
+        _cprofile_done = True
+        _cprofile = cProfile.Profile()
+    _cprofile.enable()
+    return True
+
+def enabled():
+    return _enabled
+
+def span(name, **args):
+    """
+    Context manager timing one stage; keyword arguments are stored in the trace event.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, args)
+
+def add_bytes(count):
+    """
+    Add bytes moved to the innermost open span of this thread.
+    """
+    if _enabled:
+        stack = _stack()
+        if stack:
+            stack[-1].bytes += count
+
+def profiled(name):
+    """
+    Decorator form of span(name).
+    """
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Span(name, None):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+def _option_value(argv, i, option):
+    arg = argv[i]
+    if arg.startswith(option + "="):
+        return arg[len(option) + 1:], 1
+    if i + 1 < len(argv):
+        return argv[i + 1], 2
+    print(f"{option} needs a value")
+    sys.exit(2)
+
+def init_from_argv(argv=None):
+    """
+    Strip the profiling flags from argv (default sys.argv, changed in place) and enable profiling when asked.
+    """
+    global _enabled, _trace_path, _top, _cprofile_stage
+    argv = sys.argv if argv is None else argv
+    script = os.path.splitext(os.path.basename(argv[0]))[0] if argv else "profile"
+    kept = argv[:1]
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--profile" or arg.startswith("--profile="):
+            _enabled = True
+            _trace_path = arg.split("=", 1)[1] if "=" in arg else script + "-trace.json"
+            i += 1
+        elif arg == "--profile-top" or arg.startswith("--profile-top="):
+            value, used = _option_value(argv, i, "--profile-top")
+            _top = int(value)
+            i += used
+        elif arg == "--profile-cprofile" or arg.startswith("--profile-cprofile="):
+            value, used = _option_value(argv, i, "--profile-cprofile")
+            _cprofile_stage = value
+            i += used
+        else:
+            kept.append(arg)
+            i += 1
+    argv[:] = kept
+    if _enabled:
+        atexit.register(finish)
+    return argv
+
+def summary(top=DEFAULT_TOP):
+    """
+    Lines of the top stages by total time.
+    """
+    with _lock:
+        rows = sorted(_stats.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    lines = [f"{'stage':32s} {'calls':>8s} {'total s':>9s} {'self s':>9s} {'mean ms':>9s} {'MiB':>9s}"]
+    for name, (calls, total, self_time, moved) in rows:
+        lines.append(f"{name[:32]:32s} {calls:8d} {total:9.3f} {self_time:9.3f} {total / calls * 1000:9.2f} "
+                     f"{moved / 1024 / 1024:9.2f}")
+    return lines
+
+def write_trace(path):
+    with _lock:
+        trace = {
+            "traceEvents": list(_events),
+            "displayTimeUnit": "ms",
+            "otherData": {"argv": sys.argv, "stats": {name: {"calls": s[0], "total_s": s[1], "self_s": s[2], "bytes": s[3]}
+                                                      for name, s in _stats.items()}},
+        }
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(trace, f)
+    os.replace(path + ".tmp", path)
+
+def finish():
+    """
+    Write the trace and print the summary; registered with atexit by init_from_argv.
+    """
+    global _enabled
+    if not _enabled:
+        return
+    _enabled = False
+    write_trace(_trace_path)
+    print("=========================", file=sys.stderr)
+    print(f"Profile ({time.perf_counter() - _start:.3f} s wall), trace written to {_trace_path}", file=sys.stderr)
+    for line in summary(_top):
+        print(line, file=sys.stderr)
+    if _cprofile is not None:
+        import pstats
+        prof_path = os.path.splitext(_trace_path)[0] + ".prof"
+        _cprofile.dump_stats(prof_path)
+        print(f"cProfile of stage '{_cprofile_stage}' written to {prof_path}", file=sys.stderr)
+        pstats.Stats(_cprofile, stream=sys.stderr).sort_stats("cumulative").print_stats(_top)
+    elif _cprofile_stage:
+        print(f"Stage '{_cprofile_stage}' never ran, no cProfile written", file=sys.stderr)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+# ratelimit.py
+#
+# Request budget shared by every process on the machine that talks to YouTube and other services:
+# main.py downloads and all playlists-convert-* scripts running at the same time.
+# Each service has a token bucket (rate per second, burst) stored in one SQLite file; a process takes a token
+# inside a BEGIN IMMEDIATE transaction before every extractor call, so all processes together stay under the quota.
+# When any process gets HTTP 429 (Too Many Requests) it blocks the service for everyone: Retry-After when the
+# server sends one, otherwise an exponential backoff with jitter that grows with every further 429 and is
+# cleared by the next successful call.
+#
+# Environment:
+#   PLAYLIST_RATE_LIMITS    quotas as service=rate[:burst], comma separated, e.g. "youtube=0.5:10,*=2"
+#                           (default youtube=1:5, everything else 2:5)
+#   PLAYLIST_RATE_LIMIT_DB  bucket file (default playlist-extractor-ratelimit.sqlite in the temp folder)
+#   PLAYLIST_RATE_LIMIT=off disables the limiter
+#
+# Usage Example:
+# PLAYLIST_RATE_LIMITS="youtube=0.5:4" python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip
+
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+
+import metrics
+
+DEFAULT_LIMITS = {"youtube": (1.0, 5.0), "*": (2.0, 5.0)}
+DEFAULT_DB = os.path.join(tempfile.gettempdir(), "playlist-extractor-ratelimit.sqlite")
+MAX_RETRIES = 3 # extractor calls retried after a 429
+BACKOFF_BASE = 5.0 # seconds of the first backoff without Retry-After
+BACKOFF_MAX = 600.0
+MAX_SLEEP = 1.0 # longest single sleep, so changes by other processes are noticed
+SERVICE_HOSTS = (
+    ("youtube", ("youtube.com", "youtu.be", "googlevideo.com", "ytimg.com", "youtube-nocookie.com")),
+    ("soundcloud", ("soundcloud.com", "sndcdn.com")),
+    ("odysee", ("odysee.com", "odysee.tv", "lbry.tv")),
+    ("bandcamp", ("bandcamp.com", "bcbits.com")),
+)
+THROTTLED_RE = re.compile(r"\b429\b|too many requests|rate.?limit", re.IGNORECASE)
+
+wait_seconds = metrics.counter("rate_limit_wait_seconds_total", "Seconds spent waiting for the shared request budget, by service")
+throttled_total = metrics.counter("rate_limit_throttled_total", "HTTP 429 answers reported to the shared limiter, by service")
+
+_connections = threading.local()
+_limits = None
+
+def enabled():
+    return os.environ.get("PLAYLIST_RATE_LIMIT", "on").lower() not in ("off", "0", "false", "no")
+
+def parse_limits(text):
+    """
+    "youtube=0.5:10,*=2" -> {"youtube": (0.5, 10.0), "*": (2.0, 5.0)} on top of the defaults.
+    """
+    limits = dict(DEFAULT_LIMITS)
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        try:
+            service, quota = item.split("=", 1)
+            rate, _, burst = quota.partition(":")
+            limits[service.strip().lower()] = (float(rate), float(burst) if burst else DEFAULT_LIMITS["*"][1])
+        except ValueError:
+            raise ValueError(f"invalid PLAYLIST_RATE_LIMITS entry '{item}', expected service=rate[:burst]")
+    return limits
+
+def limits():
+    global _limits
+    if _limits is None:
+        _limits = parse_limits(os.environ.get("PLAYLIST_RATE_LIMITS"))
+    return _limits
+
+def quota(service):
+    table = limits()
+    return table.get(service, table["*"])
+
+def service_of(target):
+    """
+    Service a URL (or an audio stream dict with a "url") belongs to, by host name.
+    """
+    if isinstance(target, dict):
+        target = target.get("_source") or target.get("url") or ""
+    host = (urlparse(str(target)).hostname or "").lower()
+    for service, domains in SERVICE_HOSTS:
+        if any(host == domain or host.endswith("." + domain) for domain in domains):
+            return service
+    if "peertube" in host:
+        return "peertube"
+    return host or "other"
+
+def _connection():
+    path = os.environ.get("PLAYLIST_RATE_LIMIT_DB", DEFAULT_DB)
+    conn = getattr(_connections, "conn", None)
+    if conn is None or _connections.path != path:
+        conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS buckets (
+                            service TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,
+                            blocked_until REAL NOT NULL DEFAULT 0, failures INTEGER NOT NULL DEFAULT 0)""")
+        _connections.conn = conn
+        _connections.path = path
+    return conn
+
+def _take(conn, service, now):
+    """
+    Take one token in an open transaction; returns 0 on success, else the seconds to wait.
+    """
+    rate, burst = quota(service)
+    row = conn.execute("SELECT tokens, updated, blocked_until FROM buckets WHERE service = ?", (service,)).fetchone()
+    if row is None:
+        tokens, blocked_until = burst, 0.0
+    else:
+        tokens = min(burst, row[0] + max(now - row[1], 0.0) * rate)
+        blocked_until = row[2]
+    if now < blocked_until:
+        wait = blocked_until - now
+    elif tokens >= 1.0:
+        tokens -= 1.0
+        wait = 0.0
+    else:
+        wait = (1.0 - tokens) / rate
+    conn.execute("""INSERT INTO buckets (service, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(service) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated""",
+                 (service, tokens, now, blocked_until))
+    return wait
+
+def acquire(service):
+    """
+    Block until the shared bucket of service has a token for one request.
+    """
+    if not enabled():
+        return
+    conn = _connection()
+    waited = 0.0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            wait = _take(conn, service, time.time())
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if wait <= 0:
+            break
+        pause = min(wait, MAX_SLEEP)
+        time.sleep(pause)
+        waited += pause
+    if waited:
+        wait_seconds.inc(waited, service=service)
+
+def report_throttled(service, retry_after=None):
+    """
+    A request to service was answered with 429: block the service for every process and empty its bucket.
+    Returns the seconds it is blocked for.
+    """
+    throttled_total.inc(service=service)
+    if not enabled():
+        return 0.0
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        row = conn.execute("SELECT failures, blocked_until FROM buckets WHERE service = ?", (service,)).fetchone()
+        failures = (row[0] if row else 0) + 1
+        if retry_after is not None:
+            backoff = float(retry_after)
+        else:
+            backoff = min(BACKOFF_BASE * 2 ** (failures - 1), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+        blocked_until = max(row[1] if row else 0.0, now + backoff)
+        conn.execute("""INSERT INTO buckets (service, tokens, updated, blocked_until, failures) VALUES (?, 0, ?, ?, ?)
+                        ON CONFLICT(service) DO UPDATE SET tokens = 0, updated = excluded.updated,
+                        blocked_until = excluded.blocked_until, failures = excluded.failures""",
+                     (service, now, blocked_until, failures))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return blocked_until - now
+
+def report_success(service):
+    """
+    Reset the backoff of service after a 429, a no-op (and no write) otherwise.
+    """
+    if not enabled():
+        return
+    _connection().execute("UPDATE buckets SET failures = 0 WHERE service = ? AND failures > 0", (service,))
+
+def is_throttled(error):
+    """
+    Whether an extractor or HTTP error is a 429 answer.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, HTTPError) and error.code == 429:
+            return True
+        if THROTTLED_RE.search(str(error)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def retry_after(error):
+    """
+    Seconds from a Retry-After header of the error (or its causes), None when there is none.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        headers = getattr(error, "headers", None)
+        value = headers.get("Retry-After") if headers is not None else None
+        if value is not None and str(value).strip().isdigit():
+            return float(value)
+        error = error.__cause__ or error.__context__
+    return None
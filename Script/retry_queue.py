@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+# retry_queue.py
+#
+# Metadata lookups that failed or were too slow during a conversion, kept and retried instead of being lost.
+# lookup() runs the extractor call on a worker thread and waits at most PLAYLIST_LOOKUP_TIMEOUT seconds for it
+# (default 30 for backends that go to the network; 0, and local backends, call inline without a timeout).
+# When the call fails or times out it returns None at once:
+# the converter writes a placeholder and goes on, and the URL is queued.
+# A background thread retries queued URLs with exponential backoff (5 s, 10 s, 20 s, ... with jitter) while the
+# conversion continues; a lookup that finishes after its timeout is recorded too. finish() waits up to
+# PLAYLIST_RETRY_WAIT seconds (default 60) for retries that come due in that time and returns the metadata
+# that was resolved, which the converter patches into its output.
+# What is still unresolved is kept in <output>.retry.json; playlists-retry-failed.py retries it later and
+# patches the output in place. After MAX_ATTEMPTS failures a URL is only retried on request (--now).
+#
+# Usage Example:
+# PLAYLIST_RETRY_WAIT=120 python3 playlists-convert-newpipe.py NewPipeData-Zip-Template.zip playlists.csv NewPipeData.zip
+# python3 playlists-retry-failed.py NewPipeData.zip
+
+import heapq
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import metrics
+from extractors import get_extractor
+
+QUEUE_SUFFIX = ".retry.json"
+QUEUE_VERSION = 1
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_WAIT = 60.0
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 3600.0
+MAX_ATTEMPTS = 8
+SAVE_INTERVAL = 2.0 # seconds between queue file rewrites while lookups fail
+LOOKUP_WORKERS = 4
+REPORT_LINES = 50 # unresolved URLs listed in the report, the rest is in the queue file
+
+lookups_total = metrics.counter("retry_queue_lookups_total", "Deferred metadata lookups, by result (deferred, resolved, failed)")
+
+def queue_path(output):
+    return output + QUEUE_SUFFIX
+
+def _env_seconds(name, default):
+    return float(os.environ.get(name, default))
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+def _error_text(error):
+    return str(error).strip().splitlines()[0][:300] if str(error).strip() else type(error).__name__
+
+def _read_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    if state.get("version") != QUEUE_VERSION:
+        raise ValueError(f"{path} was written by another version")
+    return state
+
+class RetryQueue:
+    """
+    Deferred lookups of one output file. entries holds the unresolved URLs as
+    {url: {"attempts", "next_attempt", "first_failed", "last_error", "details"}},
+    resolved the ones a retry answered but that are not patched into the output yet.
+    """
+    def __init__(self, output, kind, fetch=None, timeout=None):
+        self.output = output
+        self.kind = kind
+        self.path = queue_path(output)
+        self.fetch = fetch or (lambda url: get_extractor().video_metadata(url))
+        if timeout is None and "PLAYLIST_LOOKUP_TIMEOUT" in os.environ:
+            timeout = _env_seconds("PLAYLIST_LOOKUP_TIMEOUT", DEFAULT_TIMEOUT)
+        self.timeout = timeout # None: decided by the extractor on the first lookup
+        self.entries = {}
+        self.resolved = {}
+        self.deferred = 0
+        self.running = set() # URLs with a lookup in flight after its timeout or being retried
+        self._schedule = [] # heap of (next_attempt, url), entries that were rescheduled since are skipped
+        self._cond = threading.Condition()
+        self._pool = None
+        self._thread = None
+        self._stop = False
+        self._saved = 0.0
+        self._dirty = False
+
+    @classmethod
+    def open(cls, output, fetch=None):
+        """
+        The queue saved for output, None when it has none.
+        """
+        state = _read_state(queue_path(output))
+        if state is None:
+            return None
+        queue = cls(output, state["kind"], fetch)
+        queue._restore(state)
+        return queue
+
+    def restore(self):
+        """
+        Take over the lookups an interrupted run of the same conversion left in the queue file.
+        """
+        state = _read_state(self.path)
+        if state is not None and state["kind"] == self.kind:
+            self._restore(state)
+
+    def _restore(self, state):
+        with self._cond:
+            self.entries.update(state["entries"])
+            self.resolved.update(state.get("resolved", {}))
+            for url, entry in state["entries"].items():
+                self._push(url, entry)
+
+    # --- conversion side ---
+
+    def lookup(self, url, **details):
+        """
+        Metadata of url, or None when the lookup failed or timed out and was queued.
+        details are kept with the entry for the patcher (e.g. the video id a placeholder was written with).
+        """
+        with self._cond:
+            if url in self.entries:
+                return None
+            if url in self.resolved:
+                return dict(self.resolved[url]["info"])
+        if self.timeout is None:
+            # the synthetic and replay backends answer at once, a worker thread would only slow them down
+            self.timeout = DEFAULT_TIMEOUT if get_extractor().rate_limited else 0
+        if self.timeout <= 0:
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                self.defer(url, e, **details)
+                return None
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(LOOKUP_WORKERS, thread_name_prefix="lookup")
+        future = self._pool.submit(self.fetch, url)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            self.defer(url, f"no answer within {self.timeout:g} s", **details)
+            with self._cond:
+                self.running.add(url)
+            future.add_done_callback(lambda f: self._late(url, f))
+            return None
+        except Exception as e:
+            self.defer(url, e, **details)
+            return None
+
+    def defer(self, url, error, **details):
+        print(f"Warning: Could not fetch metadata for {url}: {_error_text(error)} (retrying later)")
+        metrics.item_errors.inc()
+        lookups_total.inc(result="deferred")
+        now = time.time()
+        with self._cond:
+            entry = self.entries.get(url)
+            if entry is None:
+                self.deferred += 1
+                entry = self.entries[url] = {"attempts": 0, "first_failed": now, "details": details}
+            entry["attempts"] += 1
+            entry["last_error"] = _error_text(error)
+            entry["next_attempt"] = now + backoff(entry["attempts"])
+            self._push(url, entry)
+            self._dirty = True
+            self._start()
+            self._cond.notify_all()
+        self._save_soon()
+
+    def _late(self, url, future):
+        # a lookup that timed out finished after all
+        with self._cond:
+            self.running.discard(url)
+            entry = self.entries.get(url)
+            if entry is not None:
+                error = future.exception()
+                if error is None:
+                    self._resolve(url, future.result())
+                else:
+                    entry["last_error"] = _error_text(error)
+                    self._push(url, entry)
+                self._dirty = True
+            self._cond.notify_all()
+
+    def _resolve(self, url, info):
+        # called with self._cond held
+        entry = self.entries.pop(url)
+        self.resolved[url] = {"info": info, "details": entry.get("details", {})}
+        lookups_total.inc(result="resolved")
+
+    # --- retries ---
+
+    def _start(self):
+        # called with self._cond held
+        if self._thread is None:
+            self._stop = False
+            self._thread = threading.Thread(target=self._retry_loop, name="retry-queue", daemon=True)
+            self._thread.start()
+
+    def _push(self, url, entry):
+        # called with self._cond held
+        heapq.heappush(self._schedule, (entry["next_attempt"], url))
+
+    def _next_due(self):
+        """
+        (time, url) of the next retry, None when nothing is left to retry; called with self._cond held.
+        """
+        while self._schedule:
+            when, url = self._schedule[0]
+            entry = self.entries.get(url)
+            if (entry is not None and entry["next_attempt"] == when and entry["attempts"] < MAX_ATTEMPTS
+                    and url not in self.running):
+                return when, url
+            heapq.heappop(self._schedule)
+        return None
+
+    def _retry_loop(self):
+        while True:
+            with self._cond:
+                while not self._stop:
+                    next_due = self._next_due()
+                    if next_due is not None and next_due[0] <= time.time():
+                        break
+                    self._cond.wait(None if next_due is None else max(next_due[0] - time.time(), 0.01))
+                if self._stop:
+                    return
+                url = heapq.heappop(self._schedule)[1]
+                self.running.add(url)
+            try:
+                info, error = self.fetch(url), None
+            except Exception as e:
+                info, error = None, e
+            with self._cond:
+                self.running.discard(url)
+                entry = self.entries.get(url)
+                if entry is not None:
+                    if error is None:
+                        self._resolve(url, info)
+                    else:
+                        entry["attempts"] += 1
+                        entry["last_error"] = _error_text(error)
+                        entry["next_attempt"] = time.time() + backoff(entry["attempts"])
+                        self._push(url, entry)
+                        if entry["attempts"] >= MAX_ATTEMPTS:
+                            lookups_total.inc(result="failed")
+                    self._dirty = True
+                self._cond.notify_all()
+            self._save_soon()
+
+    def resume(self, force=False):
+        """
+        Start retrying a queue loaded with open(); with force every URL is due at once,
+        also the ones that already failed MAX_ATTEMPTS times (they get one more attempt).
+        """
+        now = time.time()
+        with self._cond:
+            if force:
+                for entry in self.entries.values():
+                    entry["attempts"] = min(entry["attempts"], MAX_ATTEMPTS - 1)
+                    entry["next_attempt"] = now
+                self._schedule = []
+                for url, entry in self.entries.items():
+                    self._push(url, entry)
+            if self.entries:
+                self._start()
+            self._cond.notify_all()
+
+    def finish(self, wait=None):
+        """
+        Wait up to wait seconds for retries due in that time and for lookups still running, stop retrying
+        and return {url: {"info", "details"}} of everything resolved, for the caller to patch into the output.
+        """
+        wait = _env_seconds("PLAYLIST_RETRY_WAIT", DEFAULT_WAIT) if wait is None else wait
+        deadline = time.time() + wait
+        with self._cond:
+            if self.entries and wait > 0:
+                print(f"Retrying {len(self.entries)} failed lookups for up to {wait:g} s")
+            while self.entries:
+                # retries already due always run, later ones and slow lookups only until the deadline
+                now = time.time()
+                next_due = self._next_due()
+                if next_due is not None and next_due[0] <= now:
+                    pass
+                elif now >= deadline or (not self.running and (next_due is None or next_due[0] > deadline)):
+                    break
+                # every retry and late lookup notifies, so this wakes up on each change
+                self._cond.wait(deadline - now if deadline > now else 1.0)
+            self._stop = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+            self._thread = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self.save()
+        return dict(self.resolved)
+
+    def patched(self, urls):
+        """
+        The resolved urls are in the output now: forget them (and the queue file once nothing is left).
+        """
+        with self._cond:
+            for url in urls:
+                self.resolved.pop(url, None)
+            self._dirty = True
+        self.save()
+
+    # --- persistence and report ---
+
+    def _save_soon(self):
+        if time.time() - self._saved >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        with self._cond:
+            if not self._dirty and (self.entries or self.resolved or not os.path.exists(self.path)):
+                return
+            if not self.entries and not self.resolved:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+                self._dirty = False
+                return
+            state = {"version": QUEUE_VERSION, "output": os.path.abspath(self.output), "kind": self.kind,
+                     "entries": self.entries, "resolved": self.resolved}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self._saved = time.time()
+            self._dirty = False
+
+    def report(self, resolved=0, patched=0):
+        """
+        Print what retries resolved and list the URLs that are still unresolved.
+        """
+        if not self.deferred and not self.entries and not resolved:
+            return
+        if resolved:
+            print(f"Retries resolved {resolved} lookups, {patched} entries patched in {self.output}")
+        if not self.entries:
+            print("All failed lookups were resolved")
+            return
+        print(f"{len(self.entries)} lookups still unresolved (placeholders in {self.output}), "
+              f"retry with: python3 playlists-retry-failed.py {self.output}")
+        now = time.time()
+        for url, entry in sorted(self.entries.items(), key=lambda item: item[1]["first_failed"])[:REPORT_LINES]:
+            if entry["attempts"] >= MAX_ATTEMPTS:
+                when = "gave up, retry with --now"
+            else:
+                when = f"next retry in {max(entry['next_attempt'] - now, 0):.0f} s"
+            print(f"  {url}  {entry['attempts']} attempts, {when}: {entry['last_error']}")
+        if len(self.entries) > REPORT_LINES:
+            print(f"  ... and {len(self.entries) - REPORT_LINES} more, see {self.path}")
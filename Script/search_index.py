@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+# search_index.py
+#
+# Side-car SQLite FTS5 search index for a NewPipe newpipe.db, shared by main.py and newpipe-search.py.
+# Indexes playlists.name, remote_playlists.name, streams.title and streams.uploader, plus which
+# streams every local playlist contains, so "playlists whose tracks mention X" is one indexed query.
+# The index lives next to the backup (<backup>.search.sqlite) and is updated incrementally:
+# a digest of the indexed columns (title, uploader) of every stream is kept, streams that are new, were edited
+# or removed are re-indexed row by row, and playlists are re-read when they changed.
+# The source database is only attached while updating, queries need the index file alone.
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import zipfile
+
+import profiling
+
+INDEX_SUFFIX = ".search.sqlite"
+INDEX_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+CREATE VIRTUAL TABLE IF NOT EXISTS streams_fts USING fts5(
+    title, uploader, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3');
+CREATE VIRTUAL TABLE IF NOT EXISTS playlists_fts USING fts5(
+    name, kind UNINDEXED, uid UNINDEXED, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3');
+CREATE TABLE IF NOT EXISTS streams_digest (uid INTEGER PRIMARY KEY, digest INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS playlist_tracks (
+    stream_id INTEGER NOT NULL, playlist_id INTEGER NOT NULL,
+    PRIMARY KEY (stream_id, playlist_id)) WITHOUT ROWID;
+"""
+
+def index_path_for(backup_path):
+    return backup_path + INDEX_SUFFIX
+
+def open_index(index_path):
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    version = get_meta(conn, "version")
+    if version is not None and version != INDEX_VERSION:
+        conn.close()
+        os.remove(index_path)
+        return open_index(index_path)
+    set_meta(conn, "version", INDEX_VERSION)
+    conn.commit()
+    return conn
+
+def get_meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+class OrderedDigest:
+    """
+    SQLite aggregate: digest of all rows in the order they are fed, so moved or swapped rows change it
+    (unlike a sum). Fed from an ORDER BY subquery.
+    """
+    def __init__(self):
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def step(self, *values):
+        self.digest.update(repr(values).encode("utf-8", "surrogatepass"))
+
+    def finalize(self):
+        return self.digest.hexdigest()
+
+def row_digest(title, uploader):
+    # 64-bit digest of the indexed columns of a stream, an SQLite integer
+    data = f"{title or ''}\x1f{uploader or ''}".encode("utf-8", "surrogatepass")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little", signed=True)
+
+@profiling.profiled("update search index")
+def update_index(conn, db_path):
+    """
+    Bring the index up to date with the newpipe.db at db_path.
+    Returns a dict with the number of streams added, updated and removed and whether playlists were re-read.
+    """
+    conn.create_function("row_digest", 2, row_digest, deterministic=True)
+    conn.create_aggregate("ordered_digest", -1, OrderedDigest)
+    conn.execute("ATTACH DATABASE ? AS src", (os.path.abspath(db_path),))
+    try:
+        result = {"streams_added": 0, "streams_updated": 0, "streams_removed": 0, "playlists_updated": False}
+        with conn:
+            # streams: new rows and rows whose title or uploader changed, by the digest they were indexed with
+            conn.execute("""
+                CREATE TEMP TABLE changed_streams AS
+                SELECT s.uid, s.title, s.uploader, row_digest(s.title, s.uploader) AS digest, d.uid IS NULL AS new
+                FROM src.streams s LEFT JOIN streams_digest d ON d.uid = s.uid
+                WHERE d.digest IS NOT row_digest(s.title, s.uploader)
+            """)
+            try:
+                result["streams_removed"] = conn.execute(
+                    "DELETE FROM streams_digest WHERE uid NOT IN (SELECT uid FROM src.streams)").rowcount
+                if result["streams_removed"]:
+                    conn.execute("DELETE FROM streams_fts WHERE rowid NOT IN (SELECT uid FROM streams_digest)")
+                conn.execute("DELETE FROM streams_fts WHERE rowid IN (SELECT uid FROM changed_streams WHERE NOT new)")
+                conn.execute("""
+                    INSERT INTO streams_fts (rowid, title, uploader) SELECT uid, title, uploader FROM changed_streams
+                """)
+                conn.execute("INSERT OR REPLACE INTO streams_digest (uid, digest) SELECT uid, digest FROM changed_streams")
+                added, updated = conn.execute("SELECT total(new), total(NOT new) FROM changed_streams").fetchone()
+                result["streams_added"], result["streams_updated"] = int(added), int(updated)
+            finally:
+                conn.execute("DROP TABLE temp.changed_streams")
+
+            # playlists and their tracks: re-read only when the digest of the joins or the names moved
+            signature = repr(conn.execute("""
+                SELECT (SELECT ordered_digest(playlist_id, stream_id, join_index) FROM (
+                            SELECT playlist_id, stream_id, join_index FROM src.playlist_stream_join
+                            ORDER BY playlist_id, join_index, stream_id)),
+                       (SELECT ordered_digest(uid, name) FROM (SELECT uid, name FROM src.playlists ORDER BY uid)),
+                       (SELECT ordered_digest(uid, name) FROM (SELECT uid, name FROM src.remote_playlists ORDER BY uid))
+            """).fetchone())
+            if signature != get_meta(conn, "playlists_signature"):
+                conn.execute("DELETE FROM playlists_fts")
+                conn.execute("DELETE FROM playlist_tracks")
+                conn.execute("""
+                    INSERT INTO playlists_fts (name, kind, uid)
+                    SELECT IFNULL(name, ''), 'local', uid FROM src.playlists
+                    UNION ALL
+                    SELECT IFNULL(name, ''), 'remote', uid FROM src.remote_playlists
+                """)
+                conn.execute("""
+                    INSERT OR IGNORE INTO playlist_tracks (stream_id, playlist_id)
+                    SELECT stream_id, playlist_id FROM src.playlist_stream_join
+                """)
+                set_meta(conn, "playlists_signature", signature)
+                result["playlists_updated"] = True
+        return result
+    finally:
+        conn.execute("DETACH DATABASE src")
+
+def open_updated_index(backup_path, index_path=None):
+    """
+    Open the side-car index of a newpipe.db or NewPipe ZIP backup and update it.
+    Returns (connection, update result).
+    """
+    conn = open_index(index_path or index_path_for(backup_path))
+    if backup_path.lower().endswith('.zip'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with zipfile.ZipFile(backup_path, 'r') as zf:
+                zf.extract('newpipe.db', path=tmpdir)
+            result = update_index(conn, os.path.join(tmpdir, 'newpipe.db'))
+    else:
+        result = update_index(conn, backup_path)
+    return conn, result
+
+def to_match_query(text_query):
+    """
+    Turn free text into an FTS5 query: every word must match, as a prefix.
+    """
+    terms = [term.replace('"', '""') for term in text_query.split()]
+    return " ".join(f'"{term}"*' for term in terms if term)
+
+@profiling.profiled("search")
+def search_tracks(conn, text_query, limit=50):
+    """
+    Streams whose title or uploader match, best match first: [(uid, title, uploader)].
+    """
+    match = to_match_query(text_query)
+    if not match:
+        return []
+    return conn.execute("""
+        SELECT rowid, title, uploader FROM streams_fts WHERE streams_fts MATCH ? ORDER BY rank LIMIT ?
+    """, (match, limit)).fetchall()
+
+@profiling.profiled("search")
+def search_playlists(conn, text_query, include_tracks=True, limit=None):
+    """
+    Playlists whose name matches, followed by local playlists containing a matching track.
+    Returns [(kind, uid, name, matched_by)] where matched_by is "name" or "track".
+    """
+    match = to_match_query(text_query)
+    if not match:
+        return []
+    results = []
+    seen = set()
+    for name, kind, uid in conn.execute("""
+        SELECT name, kind, uid FROM playlists_fts WHERE playlists_fts MATCH ? ORDER BY rank
+    """, (match,)):
+        seen.add((kind, uid))
+        results.append((kind, uid, name, "name"))
+    if include_tracks:
+        for uid, name in conn.execute("""
+            SELECT p.uid, p.name FROM playlists_fts p
+            WHERE p.kind = 'local' AND p.uid IN (
+                SELECT pt.playlist_id FROM streams_fts f
+                JOIN playlist_tracks pt ON pt.stream_id = f.rowid
+                WHERE streams_fts MATCH ?)
+        """, (match,)):
+            if ("local", uid) not in seen:
+                results.append(("local", uid, name, "track"))
+    return results[:limit] if limit else results
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+# snapshot_cache.py
+#
+# Persistent cache of parsed NewPipe backups, so running main.py several times on the same backup
+# (export M3U8, then download, ...) unzips and queries newpipe.db only once.
+# A snapshot holds the PlaylistStore of getPlaylists (see playlist_store.py) and the playlist fingerprints
+# in one binary file, named after the blake2b hash of the backup's content plus the selection criteria.
+# Loading maps the file read-only (mmap): the URL table and the track arrays are memoryviews into the map,
+# only playlist names and fingerprints are decoded, so a load takes milliseconds whatever the library size.
+#
+# Files are written to a temporary name and renamed into place, and are never changed afterwards, so the CLI,
+# the daemon and any other reader can share the directory while others write or evict.
+# A checksum in the header rejects damaged files, which are then rebuilt from the backup.
+# The content hash of a backup is remembered by path, size and mtime, so an unchanged backup is not hashed again.
+# When the directory grows beyond its size limit the least recently loaded snapshots are removed.
+#
+# Layout (little endian on the machines that wrote it, sections 8-byte aligned):
+#   header     magic, blake2b checksum of everything after the header, (offset, length) of every section
+#   prefixes   URL prefix strings                 prefix_of   array('H') prefix of every URL
+#   url_offsets array('I') into url_blob          url_blob    UTF-8 URL suffixes
+#   durations  array('i') streams.duration by URL index
+#   playlists  array('q') kind, uid, first item, item count per playlist
+#   names      playlist names and labels          items       array('i') URL indices of all playlists
+#   fingerprints  JSON, as playlist_export.playlist_fingerprints returns them
+# Strings are stored as array('I') count and count + 1 offsets, followed by the UTF-8 blob.
+#
+# Settings:
+#   PLAYLIST_SNAPSHOT_CACHE     directory (default ~/.cache/playlist-extractor/snapshots), "off" disables the cache
+#   PLAYLIST_SNAPSHOT_CACHE_MB  size limit of the directory in MiB (default 256)
+#
+# Usage Example (the second run loads the snapshot):
+# python3 main.py NewPipeData.zip
+# python3 main.py NewPipeData.zip
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+import metrics
+import profiling
+from playlist_store import Playlist, PlaylistStore
+
+SNAPSHOT_VERSION = 2
+MAGIC = b"PLSNAP02"
+SECTIONS = ("prefixes", "prefix_of", "url_offsets", "url_blob", "durations", "playlists", "names", "items",
+            "fingerprints")
+HEADER = struct.Struct(f"<8s16s{2 * len(SECTIONS)}Q")
+KINDS = ("local", "remote")
+SUFFIX = ".snap"
+DIGESTS_FILE = "digests.json"
+DEFAULT_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                           "playlist-extractor", "snapshots")
+DEFAULT_LIMIT_MB = 256
+
+snapshot_lookups = metrics.counter("snapshot_lookups_total", "Playlist snapshot lookups, by result (hit, miss, damaged)")
+
+def content_digest(path):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def pack_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = array("I", [len(encoded), 0])
+    total = 0
+    for data in encoded:
+        total += len(data)
+        offsets.append(total)
+    return offsets.tobytes() + b"".join(encoded)
+
+def unpack_strings(view):
+    count = view[:4].cast("I")[0]
+    offsets = view[4:8 + 4 * count].cast("I")
+    blob = view[8 + 4 * count:]
+    return [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(count)]
+
+def encode_snapshot(store, fingerprints):
+    """
+    Bytes of the snapshot of a finished PlaylistStore and its fingerprints.
+    """
+    table = store.urls
+    records = array("q")
+    items = array("i")
+    names = []
+    for playlist in store:
+        records.extend((KINDS.index(playlist.kind), playlist.uid, len(items), len(playlist.items)))
+        items.extend(playlist.items)
+        names += (playlist.name, playlist.label)
+    sections = {
+        "prefixes": pack_strings(table.prefixes),
+        "prefix_of": bytes(table.prefix_of),
+        "url_offsets": bytes(table.offsets),
+        "url_blob": bytes(table.blob),
+        "durations": bytes(store.durations),
+        "playlists": records.tobytes(),
+        "names": pack_strings(names),
+        "items": items.tobytes(),
+        "fingerprints": json.dumps(fingerprints, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+    }
+    body = bytearray()
+    positions = []
+    for name in SECTIONS:
+        body += b"\0" * (-(HEADER.size + len(body)) % 8)
+        positions += (HEADER.size + len(body), len(sections[name]))
+        body += sections[name]
+    checksum = hashlib.blake2b(body, digest_size=16).digest()
+    return HEADER.pack(MAGIC, checksum, *positions) + body
+
+def decode_snapshot(view):
+    """
+    (PlaylistStore, fingerprints) backed by the memoryview of a snapshot, None when it is damaged.
+    """
+    if len(view) < HEADER.size:
+        return None
+    magic, checksum, *positions = HEADER.unpack(view[:HEADER.size])
+    if magic != MAGIC or hashlib.blake2b(view[HEADER.size:], digest_size=16).digest() != checksum:
+        return None
+    sections = {}
+    for i, name in enumerate(SECTIONS):
+        offset, length = positions[2 * i], positions[2 * i + 1]
+        if offset + length > len(view):
+            return None
+        sections[name] = view[offset:offset + length]
+
+    store = PlaylistStore()
+    table = store.urls
+    table.prefixes = unpack_strings(sections["prefixes"])
+    table.prefix_of = sections["prefix_of"].cast("H")
+    table.offsets = sections["url_offsets"].cast("I")
+    table.blob = sections["url_blob"]
+    table.freeze()
+    store.durations = sections["durations"].cast("i")
+    records = sections["playlists"].cast("q")
+    items = sections["items"].cast("i")
+    names = unpack_strings(sections["names"])
+    for i in range(len(records) // 4):
+        kind, uid, first, count = records[4 * i:4 * i + 4]
+        playlist = Playlist(KINDS[kind], uid, names[2 * i])
+        playlist.label = names[2 * i + 1]
+        playlist.items = items[first:first + count]
+        store.playlists[playlist.key] = playlist
+    fingerprints = json.loads(str(sections["fingerprints"], "utf-8"))
+    return store, fingerprints
+
+class SnapshotDirectory:
+    """
+    Snapshots in one directory; load() and save() take the key of a backup from key().
+    """
+    def __init__(self, directory=None, limit_mb=None):
+        directory = directory or os.environ.get("PLAYLIST_SNAPSHOT_CACHE", DEFAULT_DIR)
+        self.enabled = directory.lower() != "off"
+        self.directory = directory
+        if limit_mb is None:
+            limit_mb = float(os.environ.get("PLAYLIST_SNAPSHOT_CACHE_MB", DEFAULT_LIMIT_MB))
+        self.limit = int(limit_mb * 1024 * 1024)
+
+    def backup_digest(self, path):
+        """
+        Content hash of a backup, reused while its size and mtime are unchanged.
+        """
+        stat = os.stat(path)
+        real_path = os.path.realpath(path)
+        digests = self._read_digests()
+        known = digests.get(real_path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        with profiling.span("hash backup") as s:
+            digest = content_digest(path)
+            s.add_bytes(stat.st_size)
+        digests = {known_path: entry for known_path, entry in digests.items() if os.path.exists(known_path)}
+        digests[real_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        try:
+            self._write(DIGESTS_FILE, json.dumps(digests, separators=(",", ":")).encode("utf-8"))
+        except OSError:
+            pass # hashed again next time
+        return digest
+
+    def key(self, path, criteria=None):
+        if not self.enabled:
+            return None
+        try:
+            digest = self.backup_digest(path)
+        except OSError:
+            return None # unreadable, left to the caller to report
+        selection = json.dumps(criteria or {}, sort_keys=True)
+        layout = f"{SNAPSHOT_VERSION}:{sys.byteorder}:{selection}"
+        return hashlib.blake2b(f"{digest}:{layout}".encode("utf-8"), digest_size=20).hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_digests(self):
+        try:
+            with open(self._path(DIGESTS_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, name, data):
+        # a private temporary file per writer, renamed into place: readers see the old or the new file, never a part
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644) # readable by other users' readers, mkstemp creates 0600
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def load(self, key):
+        """
+        (PlaylistStore, fingerprints) of a snapshot, None when there is none (or it is damaged).
+        """
+        if key is None:
+            return None
+        path = self._path(key + SUFFIX)
+        with profiling.span("load snapshot"):
+            try:
+                with open(path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                snapshot_lookups.inc(result="miss")
+                return None
+            # the store keeps views of the map, which stays open as long as they are alive
+            snapshot = decode_snapshot(memoryview(mapped))
+        if snapshot is None:
+            snapshot_lookups.inc(result="damaged")
+            print(f"Ignoring damaged snapshot {path}")
+            return None
+        snapshot_lookups.inc(result="hit")
+        try:
+            os.utime(path) # last use, for eviction
+        except OSError:
+            pass
+        return snapshot
+
+    def save(self, key, store, fingerprints):
+        if key is None:
+            return
+        with profiling.span("save snapshot") as s:
+            data = encode_snapshot(store, fingerprints)
+            s.add_bytes(len(data))
+            try:
+                self._write(key + SUFFIX, data)
+            except OSError as e:
+                print(f"Could not save snapshot: {e}")
+                return
+        self.evict(keep=key + SUFFIX)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used snapshots until the directory fits its size limit.
+        """
+        snapshots = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(SUFFIX):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue # removed by another process
+                        snapshots.append((stat.st_mtime, stat.st_size, entry.name))
+        except OSError:
+            return
+        total = sum(size for _, size, _ in snapshots)
+        for _, size, name in sorted(snapshots):
+            if total <= self.limit:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self._path(name)) # readers that mapped it keep their copy
+            except OSError:
+                continue
+            total -= size
+
+def load_or_build(path, criteria, build, snapshots=None):
+    """
+    (PlaylistStore, fingerprints) of a backup: from its snapshot, or from build() which is then saved.
+    """
+    snapshots = snapshots or SnapshotDirectory()
+    key = snapshots.key(path, criteria)
+    snapshot = snapshots.load(key)
+    if snapshot is not None:
+        return snapshot
+    built = build()
+    if built is not None:
+        snapshots.save(key, *built)
+    return built
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+# sqlite_finalize.py
+#
+# Last step before a rewritten newpipe.db is packed into a zip.
+# Deleting and re-inserting rows leaves free pages in the file, which are zipped and copied to the phone for nothing.
+# finalize_db() refreshes the query planner statistics (ANALYZE, PRAGMA optimize) so NewPipe's first queries
+# use the right indexes, then writes a compacted copy with VACUUM INTO and puts it in place of the original.
+# The page size is 4096, the default of SQLite on Android.
+
+import os
+import sqlite3
+
+import profiling
+
+DEFAULT_PAGE_SIZE = 4096
+
+def format_size(size):
+    return f"{size / 1024 / 1024:.2f} MiB" if size >= 1024 * 1024 else f"{size / 1024:.1f} KiB"
+
+@profiling.profiled("finalize db")
+def finalize_db(db_path, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Analyze and compact db_path in place, returns (size before, size after) in bytes.
+    """
+    before = os.path.getsize(db_path)
+    compact_path = db_path + ".compact"
+    if os.path.exists(compact_path):
+        os.remove(compact_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    # page_size only takes effect for the database VACUUM INTO writes
+    conn.execute(f"PRAGMA page_size={int(page_size)}")
+    conn.execute("VACUUM INTO ?", (compact_path,))
+    conn.close()
+
+    os.replace(compact_path, db_path)
+    return before, os.path.getsize(db_path)
+
+def report(name, before, after):
+    change = after * 100 / before - 100 if before else 0
+    print(f"{name}: {format_size(before)} -> {format_size(after)} ({abs(change):.1f}% {'larger' if change > 0 else 'smaller'})")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# stream_io.py
+#
+# Constant-memory reading and writing for the converter scripts, so a playlist with tens of thousands of videos
+# is never held in memory as a whole:
+# - iter_url_list reads the URL list column of playlists.csv ("['url1', 'url2']") one URL at a time,
+#   instead of ast.literal_eval building the list and its syntax tree (several times the size of the text).
+# - dump writes JSON exactly as json.dump(obj, f, separators=...) would, byte for byte, but iterators
+#   (e.g. generators) in obj are written as arrays while they are consumed, and callables are called
+#   when their value is written, e.g. a "lastUpdatedAt" that is only known after the videos.
+#   Dicts and lists holding such values are written piece by piece; any other value is encoded in one call.
+# benchmark-streaming.py checks that the peak memory of the converters does not grow with the playlists.
+
+import ast
+import csv
+import json
+import re
+from collections.abc import Iterator
+
+CHUNK_ITEMS = 1000 # plain array items encoded per json call
+STRING_LITERAL = r"""(?:'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")"""
+ITEM_RE = re.compile(rf"({STRING_LITERAL})\s*(,?)\s*")
+OPEN_RE = re.compile(r"\[\s*")
+
+def raise_csv_field_limit():
+    # a playlists.csv row holds a whole playlist, far beyond the csv module's default 128 KiB per field
+    limit = 2 ** 31 - 1
+    while True:
+        try:
+            csv.field_size_limit(limit)
+            return
+        except OverflowError:
+            limit //= 2
+
+def _string_tokens(text):
+    """
+    String literals of "[...]" one by one, then True; False as soon as it is not a plain list of strings.
+    """
+    position = OPEN_RE.match(text).end()
+    end = len(text) - 1
+    while position < end:
+        match = ITEM_RE.match(text, position)
+        if match is None or (not match.group(2) and match.end() != end):
+            yield False
+            return
+        yield match.group(1)
+        position = match.end()
+    yield True
+
+def iter_url_list(text):
+    """
+    Strings of a Python list literal of strings, one at a time. Raises ValueError (like ast.literal_eval)
+    for anything else, before the first string is returned.
+    """
+    text = text.strip()
+    # checked in a first pass, a regex over the whole text would keep state for every item
+    plain = text.startswith("[") and text.endswith("]") and all(_string_tokens(text))
+    if not plain:
+        # not a plain list of strings, let literal_eval decide
+        value = ast.literal_eval(text)
+        if not isinstance(value, (list, tuple)):
+            raise ValueError("not a list")
+        return iter(value)
+    return _strings(text)
+
+def _strings(text):
+    for token in _string_tokens(text):
+        if token is True:
+            return
+        yield ast.literal_eval(token) if "\\" in token else token[1:-1]
+
+def _is_lazy(value):
+    return isinstance(value, Iterator) or callable(value)
+
+def _holds_lazy(value):
+    # a lazy value, or a dict or list with one anywhere inside
+    if isinstance(value, dict):
+        return any(_holds_lazy(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_holds_lazy(item) for item in value)
+    return _is_lazy(value)
+
+def dump(obj, f, separators=(",", ":"), ensure_ascii=True):
+    """
+    json.dump(obj, f, separators=separators, ensure_ascii=ensure_ascii), streaming iterators and calling callables.
+    Returns the number of characters written.
+    """
+    encode = json.JSONEncoder(separators=separators, ensure_ascii=ensure_ascii).encode
+    item_separator, key_separator = separators
+    written = 0
+
+    def write(text):
+        nonlocal written
+        written += len(text)
+        f.write(text)
+
+    def write_value(value):
+        while callable(value):
+            value = value()
+        if isinstance(value, Iterator):
+            write_array(value)
+        elif isinstance(value, list) and any(_holds_lazy(item) for item in value):
+            write_array(iter(value))
+        elif isinstance(value, dict) and any(_holds_lazy(item) for item in value.values()):
+            write("{")
+            for i, (key, item) in enumerate(value.items()):
+                write((item_separator if i else "") + encode(key) + key_separator)
+                write_value(item)
+            write("}")
+        else:
+            write(encode(value))
+
+    def write_array(items):
+        write("[")
+        first = True
+        plain = []
+        for item in items:
+            if _holds_lazy(item):
+                if plain:
+                    write(("" if first else item_separator) + encode(plain)[1:-1])
+                    first = False
+                    plain = []
+                if not first:
+                    write(item_separator)
+                write_value(item)
+                first = False
+            else:
+                plain.append(item)
+                if len(plain) >= CHUNK_ITEMS:
+                    write(("" if first else item_separator) + encode(plain)[1:-1])
+                    first = False
+                    plain = []
+        if plain:
+            write(("" if first else item_separator) + encode(plain)[1:-1])
+        write("]")
+
+    write_value(obj)
+    return written
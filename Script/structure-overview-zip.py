@@ -2,73 +2,283 @@
 
 # structure-overview-zip.py
 #
-# It reads the ZIP file
-# extracts the internal folder/file structure
-# writes a human-readable, tree-style structure overview
+# Reads only the central directory of a ZIP file (no file data, no ZipInfo objects), ZIP64 included
+# builds the folder tree iteratively and writes a tree-style overview with, for every folder and file,
+# the uncompressed and compressed size, the compression ratio (compressed / uncompressed) and the method,
+# plus the CRC-32 of every file. Entries of a folder are sorted by size, largest first.
+# Meant for triaging oversized Grayjay and NewPipe exports: memory stays bounded on archives with 100k+ entries,
+# because a folder only keeps its --top largest files (the rest is summed up in one line) and folders deeper
+# than --depth are folded into their parent. A list of the --largest files of the whole archive follows the tree.
 #
 # Usage Example:
 # python3 structure-overview-zip.py archive.zip structure-overview.txt
+# python3 structure-overview-zip.py grayjay-export.zip - --top 20 --depth 3 --largest 10
 #
 # - The first argument is the input ZIP archive.
-# - The second argument is the output structure-overview.txt
+# - The second argument is the output structure-overview.txt ("-" prints it).
 
+import argparse
+import heapq
+import os
+import struct
 import sys
-import zipfile
-from collections import defaultdict
 
-def build_tree(paths):
+import profiling
+
+EOCD = struct.Struct("<4s4H2LH")
+EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_EOCD_SIGNATURE = b"PK\x06\x06"
+CENTRAL_DIR = struct.Struct("<4s4B4HL2L5H2L")
+CENTRAL_DIR_SIGNATURE = b"PK\x01\x02"
+MAX_COMMENT = 0xFFFF
+READ_BUFFER = 1024 * 1024
+UTF8_FLAG = 0x800
+
+METHODS = {0: "stored", 1: "shrunk", 6: "imploded", 8: "deflate", 9: "deflate64", 12: "bzip2",
+           14: "lzma", 93: "zstd", 95: "xz", 98: "ppmd", 99: "aes"}
+DEFAULT_TOP = 50
+DEFAULT_LARGEST = 20
+
+class ZipFormatError(Exception):
+    pass
+
+def method_name(method):
+    return METHODS.get(method, f"method {method}")
+
+def find_central_directory(f):
     """
-    Build a nested dictionary tree from list of zip paths
+    (offset, size, entries) of the central directory, from the (ZIP64) end of central directory record.
     """
-    tree = lambda: defaultdict(tree)
-    root = tree()
-    for path in paths:
-        parts = path.rstrip('/').split('/')
-        current = root
-        for part in parts:
-            current = current[part]
-    return root
-
-def print_tree(d, indent=0, is_last=True, prefix=''):
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    tail_size = min(file_size, EOCD.size + MAX_COMMENT)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    position = tail.rfind(EOCD_SIGNATURE)
+    if position < 0 or position + EOCD.size > len(tail):
+        raise ZipFormatError("not a ZIP file (no end of central directory record)")
+    eocd_offset = file_size - tail_size + position
+    _, _, _, _, entries, cd_size, cd_offset, _ = EOCD.unpack_from(tail, position)
+
+    locator_offset = eocd_offset - ZIP64_LOCATOR.size
+    if locator_offset >= 0:
+        f.seek(locator_offset)
+        signature, _, zip64_offset, _ = ZIP64_LOCATOR.unpack(f.read(ZIP64_LOCATOR.size))
+        if signature == ZIP64_LOCATOR_SIGNATURE:
+            # the ZIP64 record sits right before its locator (like zipfile, this is where it is looked for first):
+            # the offset stored in the locator does not include data prepended to the archive
+            for record_offset in (locator_offset - ZIP64_EOCD.size, zip64_offset):
+                if record_offset < 0:
+                    continue
+                f.seek(record_offset)
+                record = f.read(ZIP64_EOCD.size)
+                if len(record) == ZIP64_EOCD.size and record[:4] == ZIP64_EOCD_SIGNATURE:
+                    _, _, _, _, _, _, _, entries, cd_size, cd_offset = ZIP64_EOCD.unpack(record)
+                    eocd_offset = record_offset
+                    break
+    # data prepended to the archive (self-extracting zips) shifts every offset
+    prefix = eocd_offset - cd_size - cd_offset
+    return cd_offset + max(prefix, 0), cd_size, entries
+
+def zip64_sizes(extra, file_size, compress_size):
+    # the ZIP64 extra field holds the sizes that are 0xFFFFFFFF in the record, in this order
+    position = 0
+    while position + 4 <= len(extra):
+        tag, length = struct.unpack_from("<2H", extra, position)
+        if tag == 1:
+            values = extra[position + 4:position + 4 + length]
+            index = 0
+            if file_size == 0xFFFFFFFF and index + 8 <= len(values):
+                file_size = struct.unpack_from("<Q", values, index)[0]
+                index += 8
+            if compress_size == 0xFFFFFFFF and index + 8 <= len(values):
+                compress_size = struct.unpack_from("<Q", values, index)[0]
+            break
+        position += 4 + length
+    return file_size, compress_size
+
+def iter_central_directory(path):
     """
-    Print the directory tree in a tree-like format.
+    Yields (name, uncompressed size, compressed size, method, crc) of every entry, reading the central directory
+    sequentially; nothing but the current record is kept.
     """
-    lines = []
-    keys = list(d.keys())
-    for i, key in enumerate(keys):
-        last = (i == len(keys) - 1)
-        branch = '└── ' if last else '├── '
-        line = prefix + branch + key
-        if d[key]:
-            line += '/'
-        lines.append(line)
-        extension = '    ' if last else '│   '
-        if d[key]:
-            lines.extend(print_tree(d[key], indent + 1, last, prefix + extension))
-    return lines
+    with open(path, "rb", buffering=READ_BUFFER) as f:
+        offset, size, entries = find_central_directory(f)
+        f.seek(offset)
+        for _ in range(entries):
+            record = f.read(CENTRAL_DIR.size)
+            if len(record) < CENTRAL_DIR.size or record[:4] != CENTRAL_DIR_SIGNATURE:
+                raise ZipFormatError("truncated or damaged central directory")
+            (_, _, _, _, _, flags, method, _, _, crc, compress_size, file_size,
+             name_length, extra_length, comment_length, _, _, _, _) = CENTRAL_DIR.unpack(record)
+            raw_name = f.read(name_length)
+            extra = f.read(extra_length)
+            f.seek(comment_length, os.SEEK_CUR)
+            name = raw_name.decode("utf-8" if flags & UTF8_FLAG else "cp437", errors="replace")
+            if 0xFFFFFFFF in (file_size, compress_size):
+                file_size, compress_size = zip64_sizes(extra, file_size, compress_size)
+            yield name, file_size, compress_size, method, crc
 
-def main():
-    if len(sys.argv) != 3:
-        print("Usage: python3 structure-overview-zip.py archive.zip structure-overview.txt")
-        sys.exit(1)
+class Folder:
+    """
+    Totals of everything below a folder, its subfolders and its largest files as a min-heap of
+    (size, sequence, name, compressed, method, crc); files pushed out of the heap only count in the totals.
+    """
+    __slots__ = ("name", "folders", "files", "size", "compressed", "file_count", "methods", "hidden", "hidden_size",
+                 "hidden_compressed")
 
-    zip_filename = sys.argv[1]
-    output_file = sys.argv[2]
+    def __init__(self, name):
+        self.name = name
+        self.folders = {}
+        self.files = []
+        self.size = 0
+        self.compressed = 0
+        self.file_count = 0
+        self.methods = set()
+        self.hidden = 0
+        self.hidden_size = 0
+        self.hidden_compressed = 0
 
-    with zipfile.ZipFile(zip_filename, 'r') as zipf:
-        paths = zipf.namelist()
+def build_tree(entries, top=DEFAULT_TOP, depth=None, largest=DEFAULT_LARGEST):
+    """
+    Folder tree of the entries, built in one pass without recursion, and the largest files of the archive.
+    """
+    root = Folder("")
+    biggest = []
+    for sequence, (name, size, compressed, method, crc) in enumerate(entries):
+        parts = [part for part in name.split("/") if part]
+        if not parts:
+            continue
+        is_folder = name.endswith("/")
+        folder_parts = parts if is_folder else parts[:-1]
+        if depth is not None and len(folder_parts) > depth:
+            if is_folder:
+                continue # a folder below the depth limit, its files are folded into the parent
+            # too deep: shown as a file of the deepest folder that is kept
+            folder_parts = folder_parts[:depth]
+            parts = folder_parts + ["/".join(parts[depth:])]
+        node = root
+        chain = [root]
+        for part in folder_parts:
+            child = node.folders.get(part)
+            if child is None:
+                child = node.folders[part] = Folder(part)
+            node = child
+            chain.append(node)
+        if is_folder:
+            continue
+        for folder in chain:
+            folder.size += size
+            folder.compressed += compressed
+            folder.file_count += 1
+            folder.methods.add(method)
+        item = (size, sequence, parts[-1], compressed, method, crc)
+        if top and len(node.files) >= top:
+            item = heapq.heappushpop(node.files, item)
+            node.hidden += 1
+            node.hidden_size += item[0]
+            node.hidden_compressed += item[3]
+        else:
+            heapq.heappush(node.files, item)
+        if largest:
+            entry = (size, sequence, name, compressed)
+            if len(biggest) < largest:
+                heapq.heappush(biggest, entry)
+            else:
+                heapq.heappushpop(biggest, entry)
+    return root, sorted(biggest, reverse=True)
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.2f} {unit}"
+        size /= 1024
+
+def ratio(size, compressed):
+    return f"{compressed * 100 / size:5.1f}%" if size else "    -"
+
+def stats_line(size, compressed, method, crc, label):
+    return f"{format_size(size):>11} {format_size(compressed):>11} {ratio(size, compressed):>6}  {method:<9} {crc:<8}  {label}"
+
+def folder_method(folder):
+    if not folder.methods:
+        return "-"
+    return method_name(next(iter(folder.methods))) if len(folder.methods) == 1 else "mixed"
 
-    tree = build_tree(paths)
+def render_tree(root, title):
+    """
+    Lines of the tree, depth first with an explicit stack; children are sorted by size, largest first.
+    """
+    yield f"{'size':>11} {'compressed':>11} {'ratio':>6}  {'method':<9} {'crc32':<8}  name"
+    yield stats_line(root.size, root.compressed, folder_method(root), "", f"{title} ({root.file_count} files)")
+    # the stack holds finished lines and folders whose children are still to be listed
+    stack = [(root, "")]
+    while stack:
+        folder, prefix = stack.pop()
+        if folder is None:
+            yield prefix
+            continue
+        children = [(child.size, child.name, child) for child in folder.folders.values()]
+        children += [(entry[0], entry[2], entry) for entry in folder.files]
+        children.sort(key=lambda child: (-child[0], child[1]))
+        rows = []
+        for i, (_, name, child) in enumerate(children):
+            last = i == len(children) - 1 and not folder.hidden
+            branch = prefix + ("└── " if last else "├── ")
+            if isinstance(child, Folder):
+                label = f"{branch}{name}/ ({child.file_count} files)"
+                rows.append((None, stats_line(child.size, child.compressed, folder_method(child), "", label)))
+                rows.append((child, prefix + ("    " if last else "│   ")))
+            else:
+                size, _, _, compressed, method, crc = child
+                rows.append((None, stats_line(size, compressed, method_name(method), f"{crc:08x}", branch + name)))
+        if folder.hidden:
+            label = f"{prefix}└── ... {folder.hidden} smaller files"
+            rows.append((None, stats_line(folder.hidden_size, folder.hidden_compressed, "", "", label)))
+        # reversed, so the largest child comes off the stack first
+        stack.extend(reversed(rows))
+
+def render_largest(biggest):
+    if not biggest:
+        return
+    yield ""
+    yield f"Largest {len(biggest)} files:"
+    for size, _, name, compressed in biggest:
+        yield f"{format_size(size):>11} {format_size(compressed):>11} {ratio(size, compressed):>6}  {name}"
 
-    lines = [f"{zip_filename}"]
-    lines.append('│')
-    lines.extend(print_tree(tree))
+def main():
+    parser = argparse.ArgumentParser(description="Tree of a ZIP archive with sizes, ratios, methods and CRCs")
+    parser.add_argument("archive", help="ZIP archive")
+    parser.add_argument("output", help="overview file to write, - prints it")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="largest files listed per folder, 0 lists all")
+    parser.add_argument("--depth", type=int, help="folder levels shown, deeper folders are folded into their parent")
+    parser.add_argument("--largest", type=int, default=DEFAULT_LARGEST, help="largest files of the archive listed after the tree")
+    args = parser.parse_args()
+
+    try:
+        with profiling.span("read zip index"):
+            root, biggest = build_tree(iter_central_directory(args.archive), args.top, args.depth, args.largest)
+    except (OSError, ZipFormatError) as e:
+        print(f"Error: {args.archive}: {e}")
+        sys.exit(1)
 
-    with open(output_file, "w", encoding="utf-8") as f:
-        for line in lines:
-            f.write(line + "\n")
+    with profiling.span("write overview"):
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            for line in render_tree(root, os.path.basename(args.archive)):
+                out.write(line + "\n")
+            for line in render_largest(biggest):
+                out.write(line + "\n")
+        finally:
+            if out is not sys.stdout:
+                out.close()
 
-    print(f"Structure overview saved to {output_file}")
+    if args.output != "-":
+        print(f"Structure overview saved to {args.output}")
 
 if __name__ == "__main__":
+    profiling.init_from_argv()
     main()
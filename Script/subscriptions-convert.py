@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+# subscriptions-convert.py
+#
+# Converts channel subscriptions, with their groups, between NewPipe, FreeTube, Piped, Grayjay and
+# YouTube (Google Takeout) CSV (readers and writers in subscriptions.py).
+# The input format is detected from the file, the output format from its extension
+# (.db FreeTube profiles, .json Piped, .csv Takeout, .zip the kind of the --template) or given with --to.
+# Piped only has YouTube; --to newpipe-json writes the same JSON for NewPipe with the channels of all its services.
+# NewPipe and Grayjay output is written into a copy of a template (default the templates next to this script);
+# with an existing backup as --template its subscriptions are kept and the new ones are added.
+# Handles (@name), /c/ and /user/ URLs are resolved to channel IDs where the output needs them: all of them in
+# one batch, from the persistent channel cache first and the rest with --jobs parallel lookups.
+#
+# Usage Example:
+# python3 subscriptions-convert.py NewPipeData.zip freetube-profiles.db
+# python3 subscriptions-convert.py subscriptions.csv NewPipeData-subscribed.zip --template NewPipeData.zip
+# python3 subscriptions-convert.py freetube-profiles.db grayjay-export.zip --to grayjay
+# python3 subscriptions-convert.py piped-subscriptions.json subscriptions.json --to piped --jobs 16
+# python3 subscriptions-convert.py grayjay-export.zip newpipe-subscriptions.json --to newpipe-json
+#
+# - The first argument is the input subscriptions (NewPipe zip/db, FreeTube profiles, Piped/NewPipe JSON, Grayjay zip, Takeout CSV).
+# - The second argument is the output file.
+# - Set PLAYLIST_EXTRACTOR to use another metadata backend (see extractors.py), PLAYLIST_CHANNEL_CACHE to move the cache.
+
+import argparse
+import os
+import sys
+
+import metrics
+import profiling
+from subscriptions import (DEFAULT_JOBS, FORMATS, READERS, WRITERS, ChannelResolver, deduplicate, detect_format,
+                           output_format, resolve_channels, writable)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES = {
+    "newpipe": os.path.join(SCRIPT_DIR, "NewPipeData-Zip-Template.zip"),
+    "grayjay": os.path.join(SCRIPT_DIR, "Grayjay-Zip-Template.zip"),
+}
+SKIPPED_LINES = 20
+
+def convert_subscriptions(input, output, template=None, source=None, target=None, jobs=DEFAULT_JOBS):
+    """
+    Convert the subscriptions of input into output, returns counts of read, written, skipped and resolved channels.
+    """
+    source = source or detect_format(input)
+    target = target or output_format(output, template)
+    if source not in FORMATS or target not in FORMATS:
+        raise ValueError("formats are " + ", ".join(FORMATS))
+    template = template or TEMPLATES.get(target)
+
+    subscriptions, groups = READERS[source](input)
+    subscriptions = deduplicate(subscriptions)
+    print(f"Read {len(subscriptions)} subscriptions in {len(groups)} groups from {input} ({source})")
+
+    resolver = ChannelResolver(jobs=jobs)
+    subscriptions = resolve_channels(subscriptions, target, resolver)
+    if any(resolver.stats.values()):
+        print(f"Channels: {resolver.stats['cache']} from cache, {resolver.stats['extractor']} looked up, "
+              f"{resolver.stats['failed']} failed")
+    for url, error in list(resolver.failures.items())[:SKIPPED_LINES]:
+        print(f"  could not resolve {url}: {error}")
+
+    kept, skipped = writable(subscriptions, target)
+    WRITERS[target](kept, groups, output, template)
+    print(f"Wrote {len(kept)} subscriptions in {len(groups)} groups to {output} ({target})")
+    if skipped:
+        print(f"Skipped {len(skipped)} subscriptions {target} cannot store:")
+        for sub, reason in skipped[:SKIPPED_LINES]:
+            print(f"  {sub['name'] or sub['url']} ({sub['url']}): {reason}")
+        if len(skipped) > SKIPPED_LINES:
+            print(f"  ... and {len(skipped) - SKIPPED_LINES} more")
+    return {"read": len(subscriptions), "written": len(kept), "skipped": len(skipped), "groups": len(groups),
+            "channels": dict(resolver.stats)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert channel subscriptions between NewPipe, FreeTube, Piped, Grayjay and Takeout CSV")
+    parser.add_argument("input", help="subscriptions to read")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("--from", dest="source", choices=FORMATS, help="input format (detected from the file by default)")
+    parser.add_argument("--to", dest="target", choices=FORMATS, help="output format (from the extension or template by default)")
+    parser.add_argument("--template", help="NewPipe or Grayjay zip to write into (default the template next to this script)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="parallel channel lookups")
+    args = parser.parse_args()
+
+    try:
+        convert_subscriptions(args.input, args.output, args.template, args.source, args.target, args.jobs)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    profiling.init_from_argv()
+    metrics.init_from_argv()
+    main()
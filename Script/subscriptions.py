@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+
+# subscriptions.py
+#
+# Channel subscriptions, and the groups they are sorted into, of NewPipe, FreeTube, Piped and Grayjay.
+# Every reader returns (subscriptions, groups): subscriptions is a list of
+# {"service_id", "url", "channel_id", "name", "avatar", "groups"} and groups the group names in order.
+# Every writer takes the same pair. Used by subscriptions-convert.py.
+#
+# Formats:
+#   newpipe   NewPipeData.zip or newpipe.db: subscriptions, feed_group and feed_group_subscription_join
+#   freetube  freetube-profiles.db: the "All Channels" profile plus one profile per group
+#   piped     subscriptions JSON as exported by Piped: {"subscriptions": [{"service_id", "url", "name"}]}, YouTube only
+#   newpipe-json  the same JSON as exported by NewPipe, with the channels of every service NewPipe has
+#   grayjay   Grayjay export zip: stores/Subscriptions (channel URLs) and stores/subscription_groups
+#   csv       YouTube (Google Takeout) subscriptions.csv: Channel Id, Channel Url, Channel Title
+#
+# FreeTube and Takeout need the channel ID (UC...) of every channel, and every format but Grayjay wants a name.
+# ChannelResolver gets them for @handle, /c/ and /user/ URLs and for channels without a name:
+# all distinct URLs of a conversion are looked up as one batch, first in a persistent cache
+# (PLAYLIST_CHANNEL_CACHE, default ~/.cache/playlist-extractor/channels.sqlite, entries kept CACHE_DAYS days),
+# then the misses concurrently through the extractor (the shared rate limit of ratelimit.py still applies).
+# /channel/UC... URLs carry their ID and need no lookup at all.
+# Grayjay only stores channel URLs: their NewPipe service is told from the host (PeerTube from the channel path,
+# as it runs on any host). Channels of services NewPipe does not have keep service_id None and are skipped,
+# with a reason, by the NewPipe targets.
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import profiling
+from extractors import CHANNEL_URL, get_extractor
+from sqlite_finalize import finalize_db, report
+
+FORMATS = ("newpipe", "freetube", "piped", "newpipe-json", "grayjay", "csv")
+NEEDS_CHANNEL_ID = ("freetube", "csv")
+NEEDS_NAME = ("newpipe", "freetube", "piped", "newpipe-json", "csv")
+NEEDS_SERVICE_ID = ("newpipe", "newpipe-json")
+YOUTUBE_ONLY = ("freetube", "piped", "csv")
+# NewPipe's service IDs (ServiceList of NewPipeExtractor)
+YOUTUBE_SERVICE_ID = 0
+SOUNDCLOUD_SERVICE_ID = 1
+MEDIA_CCC_SERVICE_ID = 2
+PEERTUBE_SERVICE_ID = 3
+BANDCAMP_SERVICE_ID = 4
+DEFAULT_JOBS = 8
+CACHE_DAYS = 30
+CACHE_BATCH = 500 # keys per SELECT, below SQLite's variable limit
+DEFAULT_CACHE = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                             "playlist-extractor", "channels.sqlite")
+FREETUBE_COLORS = ("#F44336", "#2196F3", "#4CAF50", "#FF9800", "#9C27B0", "#009688", "#795548", "#607D8B")
+
+CHANNEL_ID_RE = re.compile(r"youtube\.com/channel/(UC[\w-]{22})")
+YOUTUBE_HOST_RE = re.compile(r"^https?://(?:www\.|m\.|music\.)?youtube\.com/", re.IGNORECASE)
+SERVICE_HOSTS = (
+    (re.compile(r"(?:^|\.)(?:youtube\.com|youtu\.be)$"), YOUTUBE_SERVICE_ID),
+    (re.compile(r"(?:^|\.)soundcloud\.com$"), SOUNDCLOUD_SERVICE_ID),
+    (re.compile(r"(?:^|\.)media\.ccc\.de$"), MEDIA_CCC_SERVICE_ID),
+    (re.compile(r"(?:^|\.)bandcamp\.com$"), BANDCAMP_SERVICE_ID),
+)
+PEERTUBE_PATH_RE = re.compile(r"^/(?:video-channels|accounts|c|a)/[^/]+")
+
+channel_lookups = metrics.counter("channel_lookups_total", "Channel resolutions, by source (cache, extractor, failed)")
+
+def channel_id_of(url):
+    match = CHANNEL_ID_RE.search(url or "")
+    return match.group(1) if match else None
+
+def service_id_of(url):
+    """
+    NewPipe service ID of a channel URL, None for a service NewPipe does not have.
+    """
+    parts = urllib.parse.urlsplit((url or "").strip())
+    host = (parts.hostname or "").lower()
+    if not host:
+        return None
+    for host_re, service_id in SERVICE_HOSTS:
+        if host_re.search(host):
+            return service_id
+    if PEERTUBE_PATH_RE.match(parts.path):
+        return PEERTUBE_SERVICE_ID
+    return None
+
+def name_from_url(url):
+    # stands in for a channel name no format had, e.g. "x" of https://soundcloud.com/x or
+    # https://x.bandcamp.com/; NewPipe refreshes it
+    parts = urllib.parse.urlsplit(url)
+    return parts.path.rstrip("/").rsplit("/", 1)[-1] or (parts.hostname or "").split(".")[0]
+
+def is_youtube(subscription):
+    return subscription["service_id"] == YOUTUBE_SERVICE_ID and bool(
+        subscription["channel_id"] or YOUTUBE_HOST_RE.match(subscription["url"]))
+
+def subscription(url, name=None, service_id=YOUTUBE_SERVICE_ID, avatar=None, channel_id=None):
+    url = (url or "").strip()
+    channel_id = channel_id or channel_id_of(url)
+    if channel_id and service_id == YOUTUBE_SERVICE_ID:
+        url = CHANNEL_URL + channel_id
+    return {"service_id": service_id, "url": url, "channel_id": channel_id, "name": name or None,
+            "avatar": avatar or None, "groups": []}
+
+def _add_to_group(by_url, url, group):
+    sub = by_url.get(url)
+    if sub is not None and group not in sub["groups"]:
+        sub["groups"].append(group)
+
+def deduplicate(subscriptions):
+    """
+    One subscription per URL (resolved handles can turn out to be a channel that is already there),
+    the first keeps its place and gets the groups of the others.
+    """
+    by_url = {}
+    for sub in subscriptions:
+        first = by_url.get(sub["url"])
+        if first is None:
+            by_url[sub["url"]] = sub
+            continue
+        for key in ("name", "avatar", "channel_id"):
+            first[key] = first[key] or sub[key]
+        first["groups"].extend(g for g in sub["groups"] if g not in first["groups"])
+    return list(by_url.values())
+
+# --- channel resolution ---
+
+def cache_key(url):
+    """
+    Handles and channel names are case-insensitive, query strings and trailing slashes do not matter.
+    """
+    url = url.strip().split("?", 1)[0].split("#", 1)[0].rstrip("/")
+    url = re.sub(r"^https?://(?:www\.|m\.)?", "https://www.", url, flags=re.IGNORECASE)
+    return url.lower() if CHANNEL_ID_RE.search(url) is None else url
+
+class ChannelResolver:
+    """
+    Channel ID, name and avatar of many channel URLs at once, from the persistent cache or the extractor.
+    """
+    def __init__(self, cache_path=None, jobs=DEFAULT_JOBS):
+        self.cache_path = cache_path or os.environ.get("PLAYLIST_CHANNEL_CACHE", DEFAULT_CACHE)
+        self.jobs = jobs
+        self.stats = {"cache": 0, "extractor": 0, "failed": 0}
+        self.failures = {}
+        self._local = threading.local()
+
+    def _cache(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            conn = sqlite3.connect(self.cache_path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS channels (
+                                key TEXT PRIMARY KEY, id TEXT NOT NULL, name TEXT, url TEXT, thumbnail TEXT,
+                                resolved REAL NOT NULL)""")
+            self._local.conn = conn
+        return conn
+
+    def _cached(self, keys):
+        conn = self._cache()
+        oldest = time.time() - CACHE_DAYS * 86400
+        found = {}
+        for start in range(0, len(keys), CACHE_BATCH):
+            batch = keys[start:start + CACHE_BATCH]
+            rows = conn.execute(
+                f"SELECT key, id, name, url, thumbnail FROM channels WHERE resolved >= ? AND key IN ({','.join('?' * len(batch))})",
+                [oldest] + batch)
+            for key, channel_id, name, url, thumbnail in rows:
+                found[key] = {"id": channel_id, "name": name, "url": url, "thumbnail": thumbnail}
+        return found
+
+    def _fetch(self, url):
+        try:
+            return url, get_extractor().channel_metadata(url), None
+        except Exception as e:
+            return url, None, e
+
+    @profiling.profiled("resolve channels")
+    def resolve(self, urls):
+        """
+        {url: {"id", "name", "url", "thumbnail"}} of the urls that could be resolved; failures are in self.failures.
+        """
+        keys = {}
+        for url in urls:
+            keys.setdefault(cache_key(url), url)
+        cached = self._cached(list(keys))
+        self.stats["cache"] += len(cached)
+        channel_lookups.inc(len(cached), source="cache")
+        result = {keys[key]: channel for key, channel in cached.items()}
+
+        missing = [url for key, url in keys.items() if key not in cached]
+        fetched = []
+        failed = 0
+        if missing:
+            print(f"Looking up {len(missing)} channels ({len(cached)} cached) with {self.jobs} parallel requests")
+            metrics.track(len(missing), "channels")
+            with ThreadPoolExecutor(self.jobs, thread_name_prefix="channel") as pool:
+                for url, channel, error in pool.map(self._fetch, missing):
+                    metrics.advance(error=error is not None)
+                    if error is not None or not channel.get("id"):
+                        self.failures[url] = str(error or "no channel ID")
+                        failed += 1
+                        continue
+                    result[url] = channel
+                    fetched.append((cache_key(url), channel))
+        self.stats["extractor"] += len(fetched)
+        self.stats["failed"] += failed
+        channel_lookups.inc(len(fetched), source="extractor")
+        channel_lookups.inc(failed, source="failed")
+
+        if fetched:
+            conn = self._cache()
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO channels (key, id, name, url, thumbnail, resolved) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(key, c["id"], c.get("name"), c.get("url"), c.get("thumbnail"), now) for key, c in fetched])
+        # spellings of the same URL share one answer
+        return {url: result[keys[cache_key(url)]] for url in urls if keys[cache_key(url)] in result}
+
+def resolve_channels(subscriptions, target, resolver):
+    """
+    Fill in the channel ID and name where target needs them, then drop duplicates.
+    """
+    pending = []
+    for sub in subscriptions:
+        if not is_youtube(sub):
+            continue
+        if (target in NEEDS_CHANNEL_ID and not sub["channel_id"]) or (target in NEEDS_NAME and not sub["name"]):
+            pending.append(sub["url"])
+    if not pending:
+        return subscriptions
+    channels = resolver.resolve(pending)
+    for sub in subscriptions:
+        channel = channels.get(sub["url"])
+        if channel is None:
+            continue
+        sub["channel_id"] = channel["id"]
+        sub["url"] = CHANNEL_URL + channel["id"]
+        sub["name"] = sub["name"] or channel.get("name")
+        sub["avatar"] = sub["avatar"] or channel.get("thumbnail")
+    return deduplicate(subscriptions)
+
+# --- format detection ---
+
+def detect_format(path):
+    """
+    Format of an existing subscriptions file, from its content.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            names = set(zf.namelist())
+        if "newpipe.db" in names:
+            return "newpipe"
+        if "stores/Subscriptions" in names:
+            return "grayjay"
+        raise ValueError(f"{path} is neither a NewPipe nor a Grayjay backup")
+    with open(path, "rb") as f:
+        head = f.read(64)
+    if head.startswith(b"SQLite format 3"):
+        return "newpipe"
+    if path.lower().endswith(".csv"):
+        return "csv"
+    text = head.lstrip(b"\xef\xbb\xbf").lstrip()
+    if text.startswith(b"{"):
+        with open(path, "r", encoding="utf-8-sig") as f:
+            first_line = f.readline()
+        try:
+            first = json.loads(first_line)
+        except ValueError:
+            first = {} # a JSON document over several lines
+        # FreeTube profiles are one JSON object per line
+        return "freetube" if "_id" in first and "subscriptions" in first else "piped"
+    raise ValueError(f"cannot tell the subscription format of {path}, give it with --from")
+
+def output_format(path, template=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        return "piped"
+    if extension == ".csv":
+        return "csv"
+    if extension == ".db":
+        return "freetube"
+    if extension == ".zip" and template:
+        return detect_format(template)
+    raise ValueError(f"cannot tell the output format of {path}, give it with --to")
+
+# --- NewPipe ---
+
+def _newpipe_db(path, tmpdir):
+    if not zipfile.is_zipfile(path):
+        return path
+    with zipfile.ZipFile(path) as zf:
+        zf.extract("newpipe.db", tmpdir)
+    return os.path.join(tmpdir, "newpipe.db")
+
+@profiling.profiled("read subscriptions")
+def read_newpipe(path):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        conn = sqlite3.connect(_newpipe_db(path, tmpdir))
+        by_uid = {}
+        for uid, service_id, url, name, avatar in conn.execute(
+                "SELECT uid, service_id, url, name, avatar_url FROM subscriptions ORDER BY uid"):
+            by_uid[uid] = subscription(url, name, service_id, avatar)
+        groups = []
+        for group_uid, group in conn.execute("SELECT uid, name FROM feed_group ORDER BY sort_order, uid").fetchall():
+            groups.append(group)
+            for (subscription_id,) in conn.execute(
+                    "SELECT subscription_id FROM feed_group_subscription_join WHERE group_id = ?", (group_uid,)):
+                sub = by_uid.get(subscription_id)
+                if sub is not None and group not in sub["groups"]:
+                    sub["groups"].append(group)
+        conn.close()
+    return list(by_uid.values()), groups
+
+def update_newpipe_db(db_path, subscriptions, groups):
+    """
+    Add the subscriptions and groups to newpipe.db; existing subscriptions (same service and URL) and
+    groups (same name) are kept and only get the missing group memberships. Returns (added, groups added).
+    """
+    conn = sqlite3.connect(db_path)
+    before = conn.execute("SELECT count(*) FROM subscriptions").fetchone()[0]
+    conn.executemany(
+        "INSERT OR IGNORE INTO subscriptions (service_id, url, name, avatar_url, subscriber_count, description, notification_mode) "
+        "VALUES (?, ?, ?, ?, NULL, NULL, 0)",
+        [(sub["service_id"], sub["url"], sub["name"] or name_from_url(sub["url"]), sub["avatar"] or "")
+         for sub in subscriptions])
+    added = conn.execute("SELECT count(*) FROM subscriptions").fetchone()[0] - before
+
+    group_uids = {name: uid for uid, name in conn.execute("SELECT uid, name FROM feed_group ORDER BY uid DESC")}
+    sort_order = conn.execute("SELECT coalesce(max(sort_order) + 1, 0) FROM feed_group").fetchone()[0]
+    new_groups = 0
+    for group in groups:
+        if group not in group_uids:
+            cursor = conn.execute("INSERT INTO feed_group (name, icon_id, sort_order) VALUES (?, 0, ?)", (group, sort_order))
+            group_uids[group] = cursor.lastrowid
+            sort_order += 1
+            new_groups += 1
+    if any(sub["groups"] for sub in subscriptions):
+        uids = {(service_id, url): uid for uid, service_id, url in conn.execute("SELECT uid, service_id, url FROM subscriptions")}
+        conn.executemany(
+            "INSERT OR IGNORE INTO feed_group_subscription_join (group_id, subscription_id) VALUES (?, ?)",
+            [(group_uids[group], uids[(sub["service_id"], sub["url"])]) for sub in subscriptions for group in sub["groups"]])
+    conn.commit()
+    conn.close()
+    return added, new_groups
+
+def write_newpipe(subscriptions, groups, output, template):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with zipfile.ZipFile(template) as zf:
+            names = zf.namelist()
+            zf.extractall(tmpdir)
+        db_path = os.path.join(tmpdir, "newpipe.db")
+        added, new_groups = update_newpipe_db(db_path, subscriptions, groups)
+        print(f"newpipe.db: {added} subscriptions and {new_groups} groups added")
+        report("newpipe.db", *finalize_db(db_path))
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for name in names:
+                zf.write(os.path.join(tmpdir, name), arcname=name)
+
+# --- FreeTube ---
+
+@profiling.profiled("read subscriptions")
+def read_freetube(path):
+    subscriptions = {}
+    groups = []
+    with open(path, "r", encoding="utf-8-sig") as f:
+        profiles = [json.loads(line) for line in f if line.strip()]
+    # All Channels first, so its order wins
+    profiles.sort(key=lambda profile: profile.get("_id") != "allChannels")
+    for profile in profiles:
+        group = None if profile.get("_id") == "allChannels" else profile.get("name")
+        if group and group not in groups:
+            groups.append(group)
+        for channel in profile.get("subscriptions") or []:
+            sub = subscriptions.get(channel["id"])
+            if sub is None:
+                sub = subscriptions[channel["id"]] = subscription(None, channel.get("name"), avatar=channel.get("thumbnail"),
+                                                                  channel_id=channel["id"])
+            if group and group not in sub["groups"]:
+                sub["groups"].append(group)
+    return list(subscriptions.values()), groups
+
+def write_freetube(subscriptions, groups, output, template=None):
+    def entry(sub):
+        return {"id": sub["channel_id"], "name": sub["name"], "thumbnail": sub["avatar"] or ""}
+    profiles = [{"_id": "allChannels", "name": "All Channels", "bgColor": "#000000", "textColor": "#FFFFFF",
+                 "subscriptions": [entry(sub) for sub in subscriptions]}]
+    for i, group in enumerate(groups):
+        profiles.append({"_id": str(uuid.uuid5(uuid.NAMESPACE_URL, "freetube-profile:" + group)), "name": group,
+                         "bgColor": FREETUBE_COLORS[i % len(FREETUBE_COLORS)], "textColor": "#FFFFFF",
+                         "subscriptions": [entry(sub) for sub in subscriptions if group in sub["groups"]]})
+    with open(output, "w", encoding="utf-8") as f:
+        for profile in profiles:
+            f.write(json.dumps(profile, separators=(",", ":")) + "\n")
+
+# --- Piped and NewPipe's subscriptions JSON ---
+
+@profiling.profiled("read subscriptions")
+def read_piped(path):
+    with open(path, "r", encoding="utf-8-sig") as f:
+        data = json.load(f)
+    subscriptions = [subscription(item.get("url"), item.get("name"), int(item.get("service_id", YOUTUBE_SERVICE_ID)))
+                     for item in data.get("subscriptions") or [] if item.get("url")]
+    return subscriptions, []
+
+def write_piped(subscriptions, groups, output, template=None):
+    data = {"app_version": "", "app_version_int": 0,
+            "subscriptions": [{"service_id": sub["service_id"], "url": sub["url"],
+                               "name": sub["name"] or name_from_url(sub["url"])}
+                              for sub in subscriptions]}
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+# --- Grayjay ---
+
+def _store_items(data):
+    # store entries are strings, some of them serialized JSON objects
+    items = json.loads(data or b"[]")
+    return [json.loads(item) if isinstance(item, str) and item.lstrip().startswith("{") else item for item in items]
+
+@profiling.profiled("read subscriptions")
+def read_grayjay(path):
+    with zipfile.ZipFile(path) as zf:
+        names = set(zf.namelist())
+        subscription_store = zf.read("stores/Subscriptions")
+        group_store = zf.read("stores/subscription_groups") if "stores/subscription_groups" in names else b"[]"
+    by_url = {}
+    for item in _store_items(subscription_store):
+        url = item if isinstance(item, str) else (item.get("channel") or {}).get("url")
+        name = None if isinstance(item, str) else (item.get("channel") or {}).get("name")
+        if url:
+            sub = subscription(url, name, service_id_of(url))
+            by_url.setdefault(sub["url"], sub)
+    groups = []
+    for item in _store_items(group_store):
+        if not isinstance(item, dict) or not item.get("name"):
+            continue
+        groups.append(item["name"])
+        for url in item.get("urls") or []:
+            _add_to_group(by_url, subscription(url, service_id=service_id_of(url))["url"], item["name"])
+    return list(by_url.values()), groups
+
+def write_grayjay(subscriptions, groups, output, template):
+    with zipfile.ZipFile(template) as zf:
+        contents = [(info, zf.read(info)) for info in zf.infolist()]
+    now = int(time.time())
+    group_items = [json.dumps({"id": str(uuid.uuid5(uuid.NAMESPACE_URL, "grayjay-group:" + group)), "name": group,
+                               "image": None, "urls": [sub["url"] for sub in subscriptions if group in sub["groups"]],
+                               "priority": i, "lastChange": now, "creationTime": now}, separators=(",", ":"))
+                   for i, group in enumerate(groups)]
+    stores = {
+        "stores/Subscriptions": json.dumps([sub["url"] for sub in subscriptions]).encode("utf-8"),
+        "stores/subscription_groups": json.dumps(group_items).encode("utf-8"),
+    }
+    with zipfile.ZipFile(output, "w") as zf:
+        for info, data in contents:
+            zf.writestr(info, stores.pop(info.filename, data))
+        for name, data in stores.items():
+            zf.writestr(name, data)
+
+# --- Google Takeout CSV ---
+
+@profiling.profiled("read subscriptions")
+def read_csv(path):
+    subscriptions = []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].strip().lower() == "channel id":
+                continue
+            channel_id, url = row[0].strip(), row[1].strip()
+            name = row[2].strip() if len(row) > 2 else None
+            subscriptions.append(subscription(url, name, channel_id=channel_id if channel_id.startswith("UC") else None))
+    return subscriptions, []
+
+def write_csv(subscriptions, groups, output, template=None):
+    with open(output, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Channel Id", "Channel Url", "Channel Title"])
+        for sub in subscriptions:
+            writer.writerow([sub["channel_id"], "http://www.youtube.com/channel/" + sub["channel_id"], sub["name"]])
+
+READERS = {"newpipe": read_newpipe, "freetube": read_freetube, "piped": read_piped, "newpipe-json": read_piped,
+           "grayjay": read_grayjay, "csv": read_csv}
+WRITERS = {"newpipe": write_newpipe, "freetube": write_freetube, "piped": write_piped, "newpipe-json": write_piped,
+           "grayjay": write_grayjay, "csv": write_csv}
+
+def writable(subscriptions, target):
+    """
+    The subscriptions target can store, and the ones it cannot with the reason.
+    """
+    kept, skipped = [], []
+    for sub in subscriptions:
+        if target in YOUTUBE_ONLY and not is_youtube(sub):
+            skipped.append((sub, "not a YouTube channel"))
+        elif target in NEEDS_SERVICE_ID and sub["service_id"] is None:
+            skipped.append((sub, "service not supported by NewPipe"))
+        elif target in NEEDS_CHANNEL_ID and not sub["channel_id"]:
+            skipped.append((sub, "channel ID could not be resolved"))
+        else:
+            kept.append(sub)
+    return kept, skipped
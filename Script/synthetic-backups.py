@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# synthetic-backups.py
+#
+# Writes realistic synthetic backups of one random library in every format the scripts read:
+# - newpipe.db and NewPipeData.zip (built on the NewPipeData template, with streams, playlists,
+#   remote playlists, stream_history, stream_state, subscriptions and search_history)
+# - playlists.csv
+# - freetube-playlists.db (FreeTube JSON lines)
+# - playlists-piped.json
+# - grayjay-export.zip (built on the Grayjay template)
+# The same --seed always produces the same library.
+#
+# Usage Example:
+# python3 synthetic-backups.py synthetic-data --scale medium
+# python3 synthetic-backups.py synthetic-data --playlists 5000 --items 200 --history 10000000
+#
+# - The first argument is the output folder.
+
+import argparse
+import csv
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+import zipfile
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+NEWPIPE_TEMPLATE = os.path.join(SCRIPT_DIR, "NewPipeData-Zip-Template.zip")
+GRAYJAY_TEMPLATE = os.path.join(SCRIPT_DIR, "Grayjay-Zip-Template.zip")
+
+# playlists, items per playlist, stream_history rows
+SCALES = {
+    "tiny": (5, 10, 100),
+    "small": (50, 50, 10000),
+    "medium": (500, 100, 200000),
+    "large": (5000, 200, 2000000),
+}
+
+NEWPIPE_TABLES = ["feed", "feed_group_subscription_join", "feed_last_updated", "feed_group", "stream_history",
+                  "stream_state", "playlist_stream_join", "playlists", "remote_playlists", "streams",
+                  "subscriptions", "search_history"]
+
+WORDS = ["after", "blue", "broken", "city", "dance", "dark", "dream", "echo", "electric", "fade", "fire",
+         "forever", "ghost", "golden", "heart", "highway", "home", "island", "light", "lost", "love",
+         "midnight", "moon", "neon", "night", "ocean", "paper", "rain", "river", "road", "shadow", "silver",
+         "sky", "slow", "storm", "summer", "sun", "tonight", "velvet", "wave", "wild", "winter", "young"]
+ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+STREAM_REUSE = 0.6 # distinct videos per playlist slot, the rest repeat across playlists
+REMOTE_FRACTION = 0.05
+STATE_FRACTION = 0.1
+START_MS = 1577836800000 # 2020-01-01
+
+def random_id(rng, length=11):
+    return "".join(rng.choice(ID_ALPHABET) for _ in range(length))
+
+def random_words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def make_library(rng, playlist_count, items, subscription_count):
+    """
+    Build the library in memory: streams, local playlists, remote playlists and channels.
+    """
+    channels = []
+    for _ in range(max(subscription_count, 1)):
+        channel_id = "UC" + random_id(rng, 22)
+        channels.append((channel_id, random_words(rng, 2).title()))
+
+    stream_count = max(1, int(playlist_count * items * STREAM_REUSE))
+    streams = []
+    for _ in range(stream_count):
+        channel_id, channel_name = rng.choice(channels)
+        streams.append({
+            "id": random_id(rng),
+            "title": random_words(rng, rng.randint(2, 6)).capitalize(),
+            "duration": rng.randint(60, 600),
+            "uploader": channel_name,
+            "channel_id": channel_id,
+            "view_count": rng.randint(0, 10 ** 7),
+            "upload_date": START_MS - rng.randint(0, 10 * 365) * 86400000,
+        })
+
+    playlists = []
+    for i in range(playlist_count):
+        size = max(1, int(rng.gauss(items, items / 4)))
+        playlists.append((f"{random_words(rng, 2).title()} {i}", [rng.randrange(stream_count) for _ in range(size)]))
+
+    remote = [(f"Remote {random_words(rng, 2).title()} {i}", "https://www.youtube.com/playlist?list=PL" + random_id(rng, 32))
+              for i in range(int(playlist_count * REMOTE_FRACTION))]
+    return streams, playlists, remote, channels[:subscription_count]
+
+def watch_url(stream):
+    return f"https://www.youtube.com/watch?v={stream['id']}"
+
+def write_newpipe(out_dir, rng, streams, playlists, remote, channels, history_rows):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with zipfile.ZipFile(NEWPIPE_TEMPLATE) as zf:
+            zf.extractall(tmpdir)
+        db_path = os.path.join(out_dir, "newpipe.db")
+        shutil.copyfile(os.path.join(tmpdir, "newpipe.db"), db_path)
+
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        for table in NEWPIPE_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+
+        conn.executemany("""INSERT INTO streams
+            (uid, service_id, url, title, stream_type, duration, uploader, uploader_url,
+            thumbnail_url, view_count, textual_upload_date, upload_date, is_upload_date_approximation)
+            VALUES (?, 0, ?, ?, 'VIDEO_STREAM', ?, ?, ?, ?, ?, '', ?, 1)""",
+            ((i + 1, watch_url(s), s["title"], s["duration"], s["uploader"],
+              "https://www.youtube.com/channel/" + s["channel_id"],
+              f"https://i.ytimg.com/vi/{s['id']}/hqdefault.jpg", s["view_count"], s["upload_date"])
+             for i, s in enumerate(streams)))
+        conn.executemany(
+            "INSERT INTO playlists (uid, name, is_thumbnail_permanent, thumbnail_stream_id, display_index) VALUES (?, ?, 0, ?, ?)",
+            ((i + 1, name, indexes[0] + 1, i) for i, (name, indexes) in enumerate(playlists)))
+        conn.executemany(
+            "INSERT INTO playlist_stream_join (playlist_id, stream_id, join_index) VALUES (?, ?, ?)",
+            ((i + 1, index + 1, j) for i, (name, indexes) in enumerate(playlists) for j, index in enumerate(indexes)))
+        conn.executemany(
+            "INSERT INTO remote_playlists (uid, service_id, name, url, thumbnail_url, uploader, display_index, stream_count) VALUES (?, 0, ?, ?, '', '', ?, 0)",
+            ((i + 1, name, url, i) for i, (name, url) in enumerate(remote)))
+
+        # listening history: strictly increasing access dates keep (stream_id, access_date) unique
+        step = max(1, (int(time.time() * 1000) - START_MS) // max(history_rows, 1))
+        conn.executemany("INSERT INTO stream_history (stream_id, access_date, repeat_count) VALUES (?, ?, ?)",
+                         ((rng.randint(1, len(streams)), START_MS + i * step + rng.randrange(step), rng.randint(1, 5))
+                          for i in range(history_rows)))
+        conn.executemany("INSERT INTO stream_state (stream_id, progress_time) VALUES (?, ?)",
+                         ((uid, rng.randint(0, streams[uid - 1]["duration"] * 1000))
+                          for uid in rng.sample(range(1, len(streams) + 1), int(len(streams) * STATE_FRACTION))))
+        conn.executemany(
+            "INSERT INTO subscriptions (uid, service_id, url, name, avatar_url, subscriber_count, description, notification_mode) VALUES (?, 0, ?, ?, '', ?, '', 0)",
+            ((i + 1, "https://www.youtube.com/channel/" + channel_id, name, rng.randint(0, 10 ** 6))
+             for i, (channel_id, name) in enumerate(channels)))
+        conn.executemany("INSERT INTO search_history (creation_date, service_id, search, id) VALUES (?, 0, ?, ?)",
+                         ((START_MS + i * 3600000, random_words(rng, 2), i + 1) for i in range(min(history_rows // 10, 100000))))
+        for table, count in (("streams", len(streams)), ("playlists", len(playlists)), ("remote_playlists", len(remote)),
+                             ("subscriptions", len(channels))):
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, count))
+        conn.commit()
+        conn.close()
+
+        with zipfile.ZipFile(os.path.join(out_dir, "NewPipeData.zip"), "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.write(db_path, arcname="newpipe.db")
+            zf.write(os.path.join(tmpdir, "preferences.json"), arcname="preferences.json")
+            zf.write(os.path.join(tmpdir, "newpipe.settings"), arcname="newpipe.settings")
+
+def write_csv(out_dir, streams, playlists, remote):
+    with open(os.path.join(out_dir, "playlists.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for name, indexes in playlists:
+            writer.writerow([name, str([watch_url(streams[i]) for i in indexes])])
+        for name, url in remote:
+            writer.writerow([name, str([url])])
+
+def write_freetube(out_dir, rng, streams, playlists):
+    with open(os.path.join(out_dir, "freetube-playlists.db"), "w", encoding="utf-8") as db:
+        db.write(json.dumps({"playlistName": "Favorites", "protected": False, "description": "Your favorite videos",
+                             "videos": [], "_id": "favorites", "createdAt": START_MS, "lastUpdatedAt": START_MS},
+                            separators=(',', ':')) + "\n")
+        for name, indexes in playlists:
+            videos = []
+            for i in indexes:
+                s = streams[i]
+                videos.append({"videoId": s["id"], "title": s["title"], "author": s["uploader"],
+                               "authorId": s["channel_id"], "lengthSeconds": s["duration"],
+                               "published": s["upload_date"], "timeAdded": START_MS,
+                               "playlistItemId": str(uuid.UUID(int=rng.getrandbits(128))), "type": "video"})
+            db.write(json.dumps({"playlistName": name, "protected": False, "description": "", "videos": videos,
+                                 "_id": "ft-playlist--" + str(uuid.UUID(int=rng.getrandbits(128))),
+                                 "createdAt": START_MS, "lastUpdatedAt": START_MS}, separators=(',', ':')) + "\n")
+
+def write_piped(out_dir, streams, playlists):
+    data = {"format": "Piped", "version": 1, "playlists": [
+        {"name": name, "type": "playlist", "visibility": "private",
+         "videos": list(dict.fromkeys(watch_url(streams[i]) for i in indexes))}
+        for name, indexes in playlists]}
+    with open(os.path.join(out_dir, "playlists-piped.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(data, separators=(',', ':')))
+
+def write_grayjay(out_dir, streams, playlists):
+    with zipfile.ZipFile(GRAYJAY_TEMPLATE) as zf:
+        contents = {name: zf.read(name) for name in zf.namelist()}
+    entries = [name + ":::" + str(uuid.uuid5(uuid.NAMESPACE_DNS, name)) + "\n" +
+               "\n".join(watch_url(streams[i]) for i in indexes)
+               for name, indexes in playlists]
+    contents["stores/Playlists"] = json.dumps(entries, ensure_ascii=False).encode("utf-8")
+    with zipfile.ZipFile(os.path.join(out_dir, "grayjay-export.zip"), "w") as zf:
+        for name, data in contents.items():
+            zf.writestr(name, data)
+
+def generate(out_dir, playlist_count, items, history_rows, subscription_count=50, seed=1):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    streams, playlists, remote, channels = make_library(rng, playlist_count, items, subscription_count)
+    write_newpipe(out_dir, rng, streams, playlists, remote, channels, history_rows)
+    write_csv(out_dir, streams, playlists, remote)
+    write_freetube(out_dir, rng, streams, playlists)
+    write_piped(out_dir, streams, playlists)
+    write_grayjay(out_dir, streams, playlists)
+    return {"streams": len(streams), "playlists": len(playlists), "remote_playlists": len(remote),
+            "history_rows": history_rows, "subscriptions": len(channels)}
+
+def main():
+    parser = argparse.ArgumentParser(
+        usage="python3 synthetic-backups.py <output-folder> [--scale tiny|small|medium|large] "
+              "[--playlists N] [--items N] [--history N] [--subscriptions N] [--seed N]")
+    parser.add_argument("output_dir")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--playlists", type=int, help="number of local playlists")
+    parser.add_argument("--items", type=int, help="average items per playlist")
+    parser.add_argument("--history", type=int, help="stream_history rows")
+    parser.add_argument("--subscriptions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    if len(sys.argv) < 2:
+        parser.print_usage()
+        sys.exit(1)
+    args = parser.parse_args()
+
+    playlist_count, items, history_rows = SCALES[args.scale]
+    counts = generate(args.output_dir,
+                      args.playlists if args.playlists is not None else playlist_count,
+                      args.items if args.items is not None else items,
+                      args.history if args.history is not None else history_rows,
+                      args.subscriptions, args.seed)
+    print(f"Wrote synthetic backups to {args.output_dir}: " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+
+if __name__ == "__main__":
+    main()